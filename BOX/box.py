@@ -19,6 +19,7 @@ import datetime
 import ipaddress
 import subprocess
 import struct
+import hashlib
 from scapy.all import ARP, Ether, srp
 
 app = Flask(__name__)
@@ -30,11 +31,32 @@ IP_BLOCKLIST_FILE = "ip_blocklist.json"
 DEVICE_DATA_FILE = "network_devices.json"
 SCAN_INTERVAL = 600  # 10 minuti in secondi
 BLOCKLIST_UPDATE_INTERVAL = 86400  # 24 ore in secondi
+API_PORT = 5001  # Porta delle API per il CLIENT
+DISCOVERY_UDP_PORT = 5002  # Porta UDP per la risposta ai broadcast di discovery dei CLIENT
+DISCOVERY_MAGIC = b"FUTURO_DISCOVER"  # Contenuto atteso nelle richieste di discovery
+BLOCKLIST_HISTORY_SIZE = 100  # Aggiornamenti della lista conservati per i delta verso i CLIENT
+BINARY_MIMETYPE = 'application/vnd.futuro.blocklist'  # Formato binario compatto della lista IP
+BINARY_MAGIC = b'FBL1'
+CLIENT_REPORTS_FILE = 'client_reports.json'
+REPORT_RETRY_DEFAULT = 60  # Attesa in secondi prima del reinvio se il SERVER non indica Retry-After
 
 # Variabili globali
 box_code = None
 network_devices = []
-ip_blocklist = []
+ip_blocklist = []  # Reti bloccate come tuple (versione, indirizzo di rete, prefisso)
+blocklist_revision = 0  # Revisione della lista ricevuta dal SERVER
+blocklist_history = []  # Aggiornamenti applicati: (revisione di partenza, revisione finale, aggiunti, rimossi)
+blocklist_etag = None  # Hash del contenuto della lista servita ai CLIENT
+blocklist_last_modified = None  # Data (UTC) dell'ultima modifica al contenuto della lista
+blocklist_binary = None  # Lista completa già codificata nel formato binario per i CLIENT
+blocklist_text = None  # Lista completa in forma testuale per le risposte JSON ai CLIENT
+server_etag = None  # Header ETag dell'ultima risposta del SERVER
+server_last_modified = None  # Header Last-Modified dell'ultima risposta del SERVER
+blocklist_lock = threading.Lock()
+client_reports_lock = threading.Lock()  # Accesso al file dei report dei CLIENT
+report_send_lock = threading.Lock()  # Un solo invio al SERVER alla volta
+report_retry_timer = None  # Reinvio programmato dopo una risposta 429 del SERVER
+report_generation = 0  # Aumenta a ogni invio: un reinvio superato da un invio più recente viene scartato
 
 
 def get_public_ip():
@@ -213,50 +235,284 @@ def send_data_to_server():
             'client_reports': []  # Sarà popolato dai report dei CLIENT
         }
 
-        # Carica eventuali report client salvati
-        if os.path.exists('client_reports.json'):
-            try:
-                with open('client_reports.json', 'r') as f:
-                    client_data = json.load(f)
-                    payload['client_reports'] = client_data.get('reports', [])
+        # Carica eventuali report client salvati: restano nel file fino alla conferma del SERVER
+        with client_reports_lock:
+            payload['client_reports'] = load_client_reports()
+
+        return post_report(payload)
+    except Exception as e:
+        print(f"Errore nell'invio dei dati al SERVER: {e}")
+        return False
+
+
+def load_client_reports():
+    """Legge i report dei CLIENT salvati (da chiamare con client_reports_lock)."""
+    if not os.path.exists(CLIENT_REPORTS_FILE):
+        return []
+    try:
+        with open(CLIENT_REPORTS_FILE, 'r') as f:
+            return json.load(f).get('reports', [])
+    except:
+        return []
+
+
+def save_client_reports(reports):
+    """Salva i report dei CLIENT (da chiamare con client_reports_lock)."""
+    with open(CLIENT_REPORTS_FILE, 'w') as f:
+        json.dump({
+            'timestamp': datetime.datetime.now().isoformat(),
+            'reports': reports
+        }, f, indent=4)
+
 
-                # Reset dei report client dopo l'invio
-                with open('client_reports.json', 'w') as f:
-                    json.dump({'reports': []}, f)
-            except:
-                pass
+def post_report(payload, generation=None):
+    """Invia un report al SERVER.
+
+    I report dei CLIENT inviati vengono rimossi dal file solo dopo una risposta
+    200/202; con una risposta 429 lo stesso payload viene reinviato dopo Retry-After
+    secondi, a meno che nel frattempo non parta un invio più recente.
+    """
+    global report_retry_timer, report_generation
+
+    with report_send_lock:
+        if generation is not None and generation != report_generation:
+            # Superato da un invio più recente, che contiene anche questi report dei CLIENT
+            return False
+        report_generation += 1
+        if report_retry_timer:
+            report_retry_timer.cancel()
+            report_retry_timer = None
 
-        # Invia i dati al SERVER
         response = requests.post(
             f"{SERVER_URL}/api/report",
             json=payload,
             headers={'Content-Type': 'application/json'}
         )
 
-        return response.status_code == 200
-    except Exception as e:
-        print(f"Errore nell'invio dei dati al SERVER: {e}")
+        # Il SERVER accoda i report (202) e risponde 429 se la sua coda è piena
+        if response.status_code in (200, 202):
+            # I report arrivati dai CLIENT durante l'invio sono in coda al file e restano
+            with client_reports_lock:
+                save_client_reports(load_client_reports()[len(payload['client_reports']):])
+            return True
+
+        if response.status_code == 429:
+            try:
+                delay = max(1, int(response.headers.get('Retry-After', REPORT_RETRY_DEFAULT)))
+            except ValueError:
+                delay = REPORT_RETRY_DEFAULT
+            print(f"SERVER sovraccarico, nuovo invio tra {delay} secondi")
+            report_retry_timer = threading.Timer(delay, retry_report, args=(payload, report_generation))
+            report_retry_timer.daemon = True
+            report_retry_timer.start()
+        else:
+            print(f"Il SERVER ha rifiutato il report: {response.status_code}")
         return False
 
 
+def retry_report(payload, generation):
+    """Reinvia un report rifiutato con 429."""
+    try:
+        post_report(payload, generation)
+    except Exception as e:
+        print(f"Errore nel reinvio dei dati al SERVER: {e}")
+
+
+def apply_blocklist_delta(current, added, removed):
+    """Applica aggiunte e rimozioni a una lista di reti mantenendone l'ordine."""
+    removed = set(removed)
+    result = [ip for ip in current if ip not in removed]
+    existing = set(result)
+    result.extend(ip for ip in added if ip not in existing)
+    return result
+
+
+def parse_networks(ips):
+    """Converte gli IP e i range CIDR testuali in tuple (versione, indirizzo di rete, prefisso).
+
+    Le voci non valide vengono scartate, i duplicati rimossi mantenendo l'ordine.
+    """
+    networks = {}
+    for ip in ips:
+        try:
+            network = ipaddress.ip_network(str(ip).strip(), strict=False)
+        except ValueError:
+            continue
+        value, prefix = int(network.network_address), network.prefixlen
+        # Gli indirizzi IPv4-mapped vengono inviati come IPv4
+        if network.version == 6 and prefix == 128 and value >> 32 == 0xFFFF:
+            networks[(4, value & 0xFFFFFFFF, 32)] = None
+        else:
+            networks[(network.version, value, prefix)] = None
+    return list(networks)
+
+
+def format_network(version, value, prefix):
+    """Converte (versione, indirizzo, prefisso) in forma testuale (IP singolo o CIDR)."""
+    family, width = (socket.AF_INET, 32) if version == 4 else (socket.AF_INET6, 128)
+    address = socket.inet_ntop(family, value.to_bytes(width // 8, 'big'))
+    return address if prefix == width else f"{address}/{prefix}"
+
+
+def format_networks(networks):
+    """Converte una lista di tuple (versione, indirizzo, prefisso) in forma testuale."""
+    return [format_network(*network) for network in networks]
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_blocklist(revision, full, *sections):
+    """Codifica la lista nel formato binario compatto (stesso formato del SERVER).
+
+    Ogni sezione è una lista di tuple (versione, indirizzo, prefisso). Per ogni sezione
+    e versione IP: numero di voci, poi gli indirizzi ordinati come differenze varint;
+    il bit basso indica se segue un byte con la lunghezza del prefisso.
+    """
+    out = bytearray(BINARY_MAGIC)
+    _write_varint(out, revision)
+    out.append(1 if full else 0)
+    for networks in sections:
+        for version, width in ((4, 32), (6, 128)):
+            entries = sorted((value, prefix) for v, value, prefix in networks if v == version)
+            _write_varint(out, len(entries))
+            previous = 0
+            for value, prefix in entries:
+                if prefix == width:
+                    _write_varint(out, (value - previous) << 1)
+                else:
+                    _write_varint(out, (value - previous) << 1 | 1)
+                    out.append(prefix)
+                previous = value
+    return bytes(out)
+
+
+def decode_blocklist(data):
+    """Decodifica una risposta binaria del SERVER in un dizionario come quello JSON,
+    con le voci come tuple (versione, indirizzo, prefisso) invece che come testo."""
+    if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise ValueError("Formato binario della lista IP non riconosciuto")
+
+    revision, offset = _read_varint(data, len(BINARY_MAGIC))
+    full = data[offset] == 1
+    offset += 1
+
+    sections = []
+    for _ in range(1 if full else 2):
+        networks = []
+        for version, width in ((4, 32), (6, 128)):
+            count, offset = _read_varint(data, offset)
+            value = 0
+            for _ in range(count):
+                token, offset = _read_varint(data, offset)
+                value += token >> 1
+                prefix = width
+                if token & 1:
+                    prefix = data[offset]
+                    offset += 1
+                networks.append((version, value, prefix))
+        sections.append(networks)
+
+    if full:
+        return {'revision': revision, 'full': True, 'data': sections[0]}
+    return {'revision': revision, 'full': False, 'added': sections[0], 'removed': sections[1]}
+
+
+def compute_blocklist_etag(networks):
+    """Calcola l'ETag della lista IP come hash del contenuto, indipendente dall'ordine."""
+    return hashlib.sha256("\n".join(sorted(format_networks(networks))).encode()).hexdigest()[:32]
+
+
+def save_blocklist():
+    """Salva la lista degli IP, la sua revisione e i metadati per le richieste condizionali."""
+    with open(IP_BLOCKLIST_FILE, 'w') as f:
+        json.dump({
+            'timestamp': datetime.datetime.now().isoformat(),
+            'revision': blocklist_revision,
+            'etag': blocklist_etag,
+            'last_modified': blocklist_last_modified.isoformat() if blocklist_last_modified else None,
+            'server_etag': server_etag,
+            'server_last_modified': server_last_modified,
+            'ips': format_networks(ip_blocklist)
+        }, f, indent=4)
+
+
 def update_blocklist():
-    """Aggiorna la lista degli IP da bloccare dal SERVER."""
-    global ip_blocklist
+    """Aggiorna la lista degli IP da bloccare dal SERVER, scaricando solo le modifiche se possibile."""
+    global ip_blocklist, blocklist_revision, blocklist_history
+    global blocklist_etag, blocklist_last_modified, blocklist_binary, blocklist_text
+    global server_etag, server_last_modified
 
     try:
-        # Richiede la lista degli IP da bloccare
-        response = requests.get(f"{SERVER_URL}/api/blocklist")
+        # Richiede la lista degli IP da bloccare (solo le modifiche se la revisione è nota)
+        params = {'since': blocklist_revision} if blocklist_revision else None
+        headers = {'Accept': f"{BINARY_MIMETYPE}, application/json;q=0.5"}
+        if server_etag:
+            headers['If-None-Match'] = server_etag
+        if server_last_modified:
+            headers['If-Modified-Since'] = server_last_modified
+        response = requests.get(f"{SERVER_URL}/api/blocklist", params=params, headers=headers)
+
+        if response.status_code == 304:
+            # Lista invariata: nessun parsing né scrittura su disco
+            return True
 
         if response.status_code == 200:
-            data = response.json()
-            ip_blocklist = data.get('data', [])
-
-            # Salva la lista degli IP
-            with open(IP_BLOCKLIST_FILE, 'w') as f:
-                json.dump({
-                    'timestamp': datetime.datetime.now().isoformat(),
-                    'ips': ip_blocklist
-                }, f, indent=4)
+            # La lista viene conservata come tuple (versione, indirizzo, prefisso): la risposta
+            # binaria le contiene già, quella JSON viene convertita una volta qui
+            if response.headers.get('Content-Type', '').startswith(BINARY_MIMETYPE):
+                data = decode_blocklist(response.content)
+            else:
+                data = response.json()
+                for section in ('data', 'added', 'removed'):
+                    if section in data:
+                        data[section] = parse_networks(data[section])
+            revision = data.get('revision', 0)
+
+            with blocklist_lock:
+                if data.get('full', True):
+                    new_list = data.get('data', [])
+                    old_set, new_set = set(ip_blocklist), set(new_list)
+                    added = [network for network in new_list if network not in old_set]
+                    removed = [network for network in ip_blocklist if network not in new_set]
+                else:
+                    added = data.get('added', [])
+                    removed = data.get('removed', [])
+                    new_list = apply_blocklist_delta(ip_blocklist, added, removed)
+
+                # Registra l'aggiornamento per poter inviare delta ai CLIENT
+                if revision != blocklist_revision or added or removed:
+                    blocklist_history = (blocklist_history +
+                                         [(blocklist_revision, revision, added, removed)])[-BLOCKLIST_HISTORY_SIZE:]
+
+                if added or removed or blocklist_etag is None:
+                    blocklist_etag = compute_blocklist_etag(new_list)
+                    blocklist_last_modified = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+                ip_blocklist = new_list
+                blocklist_revision = revision
+                blocklist_binary = None
+                blocklist_text = None
+                server_etag = response.headers.get('ETag')
+                server_last_modified = response.headers.get('Last-Modified')
+
+                # Salva la lista degli IP
+                save_blocklist()
 
             return True
         else:
@@ -266,6 +522,30 @@ def update_blocklist():
         return False
 
 
+def get_blocklist_delta(since):
+    """Unisce gli aggiornamenti successivi alla revisione indicata.
+
+    Restituisce None se la revisione non è più coperta dalla cronologia.
+    """
+    if since == blocklist_revision:
+        return [], []
+
+    pending = [entry for entry in blocklist_history if entry[1] > since]
+    if not pending or pending[0][0] != since:
+        return None
+
+    # Per ogni rete conta solo l'ultima modifica
+    last_action = {}
+    for _, _, added, removed in pending:
+        for network in added:
+            last_action[network] = 'add'
+        for network in removed:
+            last_action[network] = 'remove'
+
+    return ([network for network, action in last_action.items() if action == 'add'],
+            [network for network, action in last_action.items() if action == 'remove'])
+
+
 def periodic_scan():
     """Funzione eseguita periodicamente per scansionare la rete e inviare i dati."""
     while True:
@@ -281,18 +561,105 @@ def periodic_blocklist_update():
         time.sleep(BLOCKLIST_UPDATE_INTERVAL)
 
 
+def udp_discovery_responder():
+    """Risponde ai broadcast UDP dei CLIENT con il codice del BOX e la porta delle API."""
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('0.0.0.0', DISCOVERY_UDP_PORT))
+    except OSError as e:
+        print(f"Impossibile avviare la discovery UDP sulla porta {DISCOVERY_UDP_PORT}: {e}")
+        return
+
+    while True:
+        try:
+            data, address = sock.recvfrom(1024)
+            if not data.startswith(DISCOVERY_MAGIC):
+                continue
+
+            sock.sendto(json.dumps({
+                'status': 'success',
+                'box_name': socket.gethostname(),
+                'box_code': box_code,
+                'api_port': API_PORT
+            }).encode(), address)
+        except Exception as e:
+            print(f"Errore nella risposta alla discovery UDP: {e}")
+
+
 # API per il CLIENT
 
+def is_not_modified():
+    """Verifica If-None-Match / If-Modified-Since rispetto alla lista corrente (ETag debole)."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(blocklist_etag)
+    if request.if_modified_since and blocklist_last_modified:
+        return blocklist_last_modified <= request.if_modified_since
+    return False
+
+
+def set_cache_headers(response):
+    """Aggiunge ETag e Last-Modified della lista alla risposta.
+
+    L'ETag identifica il contenuto della lista, servito in più rappresentazioni (JSON o
+    binaria, completa o delta): è quindi debole e la risposta varia con Accept.
+    """
+    response.vary.add('Accept')
+    if blocklist_etag:
+        response.set_etag(blocklist_etag, weak=True)
+    if blocklist_last_modified:
+        response.last_modified = blocklist_last_modified
+    return response
+
+
 @app.route('/api/blocklist', methods=['GET'])
 def get_blocklist():
-    """API che fornisce la lista di IP da bloccare al CLIENT."""
-    global ip_blocklist
-
-    return jsonify({
-        'status': 'success',
-        'timestamp': datetime.datetime.now().isoformat(),
-        'data': ip_blocklist
-    })
+    """API che fornisce la lista di IP da bloccare al CLIENT.
+    Con il parametro since=<revisione> restituisce solo le modifiche successive.
+    Supporta le richieste condizionali con If-None-Match e If-Modified-Since.
+    Con Accept: application/vnd.futuro.blocklist risponde nel formato binario compatto."""
+    global blocklist_binary, blocklist_text
+
+    since = request.args.get('since', type=int)
+    binary = request.accept_mimetypes.best_match(['application/json', BINARY_MIMETYPE]) == BINARY_MIMETYPE
+
+    with blocklist_lock:
+        if blocklist_etag and is_not_modified():
+            return set_cache_headers(app.response_class(status=304))
+
+        delta = get_blocklist_delta(since) if since is not None else None
+
+        if binary:
+            if delta is not None:
+                body = encode_blocklist(blocklist_revision, False, *delta)
+            else:
+                # La lista completa viene codificata una sola volta per revisione
+                if blocklist_binary is None:
+                    blocklist_binary = encode_blocklist(blocklist_revision, True, ip_blocklist)
+                body = blocklist_binary
+            return set_cache_headers(app.response_class(body, mimetype=BINARY_MIMETYPE))
+
+        if delta is not None:
+            added, removed = delta
+            return set_cache_headers(jsonify({
+                'status': 'success',
+                'timestamp': datetime.datetime.now().isoformat(),
+                'revision': blocklist_revision,
+                'full': False,
+                'added': format_networks(added),
+                'removed': format_networks(removed)
+            }))
+
+        # La forma testuale della lista completa viene calcolata una sola volta per revisione
+        if blocklist_text is None:
+            blocklist_text = format_networks(ip_blocklist)
+        return set_cache_headers(jsonify({
+            'status': 'success',
+            'timestamp': datetime.datetime.now().isoformat(),
+            'revision': blocklist_revision,
+            'full': True,
+            'data': blocklist_text
+        }))
 
 
 @app.route('/api/report', methods=['POST'])
@@ -311,22 +678,10 @@ def receive_client_report():
         data['timestamp'] = datetime.datetime.now().isoformat()
 
         # Salva il report del client
-        client_reports = []
-        if os.path.exists('client_reports.json'):
-            try:
-                with open('client_reports.json', 'r') as f:
-                    file_data = json.load(f)
-                    client_reports = file_data.get('reports', [])
-            except:
-                pass
-
-        client_reports.append(data)
-
-        with open('client_reports.json', 'w') as f:
-            json.dump({
-                'timestamp': datetime.datetime.now().isoformat(),
-                'reports': client_reports
-            }, f, indent=4)
+        with client_reports_lock:
+            client_reports = load_client_reports()
+            client_reports.append(data)
+            save_client_reports(client_reports)
 
         return jsonify({
             'status': 'success',
@@ -361,7 +716,13 @@ if __name__ == '__main__':
         try:
             with open(IP_BLOCKLIST_FILE, 'r') as f:
                 data = json.load(f)
-                ip_blocklist = data.get('ips', [])
+                ip_blocklist = parse_networks(data.get('ips', []))
+                blocklist_revision = data.get('revision', 0)
+                blocklist_etag = data.get('etag') or compute_blocklist_etag(ip_blocklist)
+                server_etag = data.get('server_etag')
+                server_last_modified = data.get('server_last_modified')
+                if data.get('last_modified'):
+                    blocklist_last_modified = datetime.datetime.fromisoformat(data['last_modified'])
         except:
             ip_blocklist = []
 
@@ -374,19 +735,21 @@ if __name__ == '__main__':
             network_devices = []
 
     # Inizializza il file dei report client se non esiste
-    if not os.path.exists('client_reports.json'):
-        with open('client_reports.json', 'w') as f:
+    if not os.path.exists(CLIENT_REPORTS_FILE):
+        with open(CLIENT_REPORTS_FILE, 'w') as f:
             json.dump({'reports': []}, f, indent=4)
 
     # Avvia i thread per le attività periodiche
     scan_thread = threading.Thread(target=periodic_scan, daemon=True)
     blocklist_thread = threading.Thread(target=periodic_blocklist_update, daemon=True)
+    discovery_thread = threading.Thread(target=udp_discovery_responder, daemon=True)
 
     scan_thread.start()
     blocklist_thread.start()
+    discovery_thread.start()
 
     # Aggiorna la lista degli IP da bloccare all'avvio
     update_blocklist()
 
     # Avvia il server Flask
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=API_PORT, debug=True)
\ No newline at end of file
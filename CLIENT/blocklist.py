@@ -0,0 +1,227 @@
+# Matcher della lista di IP bloccati
+# Compila la lista scaricata dal BOX in strutture di ricerca veloci:
+# 1. Un set di interi per gli indirizzi singoli (IPv4 e IPv6)
+# 2. Intervalli ordinati e fusi per i range CIDR, interrogati con bisect
+# 3. Una ricerca a lotti per verificare tutti gli indirizzi di un ciclo in una volta
+# La lista può arrivare anche nel formato binario compatto (BINARY_MIMETYPE):
+# indirizzi interi ordinati, codificati come differenze varint con la lunghezza
+# del prefisso, caricati nel matcher senza analizzare stringhe.
+
+import bisect
+import ipaddress
+import socket
+
+_FAMILIES = ((4, socket.AF_INET), (6, socket.AF_INET6))
+_V4_MAPPED_PREFIX = 0xFFFF
+_WIDTH = {4: 32, 6: 128}
+
+BINARY_MIMETYPE = 'application/vnd.futuro.blocklist'
+BINARY_MAGIC = b'FBL1'
+
+
+def parse_ip(ip):
+    """Converte un indirizzo testuale in (versione, intero). Restituisce None se non valido."""
+    for version, family in _FAMILIES:
+        try:
+            value = int.from_bytes(socket.inet_pton(family, ip), 'big')
+        except (OSError, TypeError, ValueError):
+            continue
+        # Gli indirizzi IPv4-mapped (::ffff:a.b.c.d) dei socket dual-stack vengono trattati come IPv4
+        if version == 6 and value >> 32 == _V4_MAPPED_PREFIX:
+            return 4, value & 0xFFFFFFFF
+        return version, value
+    return None
+
+
+def parse_network(entry):
+    """Converte un IP o un range CIDR testuale in (versione, indirizzo di rete, lunghezza prefisso).
+
+    Restituisce None se la voce non è valida.
+    """
+    entry = str(entry).strip()
+    if '/' not in entry:
+        parsed = parse_ip(entry)
+        return parsed and (parsed[0], parsed[1], _WIDTH[parsed[0]])
+    try:
+        network = ipaddress.ip_network(entry, strict=False)
+    except ValueError:
+        return None
+    return network.version, int(network.network_address), network.prefixlen
+
+
+def format_network(version, value, prefix):
+    """Converte (versione, indirizzo, prefisso) in forma testuale (IP singolo o CIDR)."""
+    family = socket.AF_INET if version == 4 else socket.AF_INET6
+    address = socket.inet_ntop(family, value.to_bytes(_WIDTH[version] // 8, 'big'))
+    return address if prefix == _WIDTH[version] else f"{address}/{prefix}"
+
+
+def _read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _read_networks(data, offset, networks):
+    """Legge una sezione di reti: per ogni versione il numero di voci e le differenze ordinate."""
+    for version in (4, 6):
+        count, offset = _read_varint(data, offset)
+        width = _WIDTH[version]
+        value = 0
+        for _ in range(count):
+            token, offset = _read_varint(data, offset)
+            value += token >> 1
+            if token & 1:
+                # Bit basso a 1: segue un byte con la lunghezza del prefisso
+                prefix = data[offset]
+                offset += 1
+            else:
+                prefix = width
+            networks.add((version, value, prefix))
+    return offset
+
+
+def decode_blocklist(data):
+    """Decodifica una risposta nel formato binario compatto.
+
+    Restituisce un dizionario con le stesse chiavi della risposta JSON
+    (revision, full, data oppure added/removed), con le reti come tuple
+    (versione, indirizzo, prefisso) al posto delle stringhe.
+    """
+    if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise ValueError("Formato binario della lista IP non riconosciuto")
+
+    revision, offset = _read_varint(data, len(BINARY_MAGIC))
+    full = data[offset] == 1
+    offset += 1
+
+    if full:
+        networks = set()
+        _read_networks(data, offset, networks)
+        return {'revision': revision, 'full': True, 'data': networks}
+
+    added, removed = set(), set()
+    offset = _read_networks(data, offset, added)
+    _read_networks(data, offset, removed)
+    return {'revision': revision, 'full': False, 'added': added, 'removed': removed}
+
+
+def _merge_intervals(intervals):
+    """Ordina e fonde intervalli sovrapposti o adiacenti."""
+    starts, ends = [], []
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1] + 1:
+            if end > ends[-1]:
+                ends[-1] = end
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+class BlocklistMatcher:
+    """Struttura di ricerca immutabile compilata da una lista di IP e range CIDR.
+
+    Le voci possono essere stringhe o tuple (versione, indirizzo, prefisso)
+    già decodificate. Viene ricostruita da zero ad ogni aggiornamento della lista e poi sostituita
+    con un solo assegnamento, così i thread di monitoraggio non vedono mai uno
+    stato parziale.
+    """
+
+    def __init__(self, entries=()):
+        hosts = {4: set(), 6: set()}
+        ranges = {4: [], 6: []}
+        self.invalid = 0
+
+        for entry in entries:
+            network = entry if isinstance(entry, tuple) else parse_network(entry)
+            if not network:
+                self.invalid += 1
+                continue
+
+            version, value, prefix = network
+            host_bits = _WIDTH[version] - prefix
+            if host_bits == 0:
+                hosts[version].add(value)
+            else:
+                first = value >> host_bits << host_bits
+                ranges[version].append((first, first | ((1 << host_bits) - 1)))
+
+        self._hosts = {version: frozenset(values) for version, values in hosts.items()}
+        self._starts = {}
+        self._ends = {}
+        for version, intervals in ranges.items():
+            self._starts[version], self._ends[version] = _merge_intervals(intervals)
+
+        self.size = sum(len(values) for values in self._hosts.values()) + \
+            sum(len(intervals) for intervals in ranges.values())
+
+    def __len__(self):
+        return self.size
+
+    def _in_ranges(self, version, value):
+        starts = self._starts[version]
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= self._ends[version][i]
+
+    def contains_int(self, version, value):
+        """Verifica un indirizzo già convertito in intero (4 o 6 come versione)."""
+        if version == 6 and value >> 32 == _V4_MAPPED_PREFIX:
+            version, value = 4, value & 0xFFFFFFFF
+        return value in self._hosts[version] or self._in_ranges(version, value)
+
+    def contains(self, ip):
+        """Verifica se un IP testuale è nella lista."""
+        parsed = parse_ip(ip)
+        return bool(parsed) and self.contains_int(*parsed)
+
+    def match_ints(self, version, values):
+        """Restituisce il sottoinsieme di interi (di una sola versione) presenti nella lista.
+
+        I valori vengono deduplicati, intersecati col set degli host e poi
+        confrontati con i range in un'unica scansione ordinata.
+        """
+        values = set(values)
+        if version == 6:
+            mapped = {v for v in values if v >> 32 == _V4_MAPPED_PREFIX}
+            if mapped:
+                values -= mapped
+                hits_v4 = self.match_ints(4, (v & 0xFFFFFFFF for v in mapped))
+                hits = {v for v in mapped if v & 0xFFFFFFFF in hits_v4}
+                return hits | self.match_ints(6, values)
+
+        hits = values & self._hosts[version]
+        starts = self._starts[version]
+        if not starts:
+            return hits
+
+        ends = self._ends[version]
+        i = 0
+        for value in sorted(values - hits):
+            while i < len(starts) and ends[i] < value:
+                i += 1
+            if i == len(starts):
+                break
+            if starts[i] <= value:
+                hits.add(value)
+        return hits
+
+    def match_many(self, ips):
+        """Verifica un lotto di IP testuali e restituisce il set di quelli bloccati."""
+        by_version = {4: {}, 6: {}}
+        for ip in set(ips):
+            parsed = parse_ip(ip)
+            if parsed:
+                by_version[parsed[0]].setdefault(parsed[1], []).append(ip)
+
+        blocked = set()
+        for version, values in by_version.items():
+            if values:
+                for value in self.match_ints(version, values):
+                    blocked.update(values[value])
+        return blocked
@@ -0,0 +1,148 @@
+# Filtro BPF per lo sniffer del CLIENT
+# Traduce la lista di IP bloccati in un'espressione BPF (sintassi tcpdump) da
+# installare sul socket di cattura, così solo i pacchetti da/verso indirizzi
+# bloccati arrivano a Python. La lista viene riassunta in un numero limitato di
+# prefissi: il filtro può lasciar passare qualche indirizzo in più, mai in meno,
+# perché il controllo esatto resta a packet_callback. Se per restare nel limite
+# bisognerebbe allargare i prefissi oltre MIN_PREFIX_LENGTH, il filtro lascerebbe
+# passare reti intere: in quel caso si usa COARSE_FILTER.
+
+import heapq
+import ipaddress
+
+MAX_FILTER_TERMS = 400  # Numero massimo di prefissi nel filtro (limite BPF: 4096 istruzioni)
+BPF_MAXINSNS = 4096  # Istruzioni massime di un programma BPF accettato dal kernel
+MIN_PREFIX_LENGTH = {4: 16, 6: 48}  # Prefisso più largo che l'aggregazione può creare
+COARSE_FILTER = "ip or ip6"  # Filtro di ripiego quando la lista non può essere compilata
+
+_WIDTH = {4: 32, 6: 128}
+
+
+def _to_prefixes(entries):
+    """Converte la lista (stringhe o tuple (versione, indirizzo, prefisso)) in prefissi
+    (valore, lunghezza) per versione, già fusi."""
+    networks = {4: [], 6: []}
+    for entry in entries:
+        try:
+            if isinstance(entry, tuple):
+                version, value, length = entry
+                network_class = ipaddress.IPv4Network if version == 4 else ipaddress.IPv6Network
+                network = network_class((value, length), strict=False)
+            else:
+                network = ipaddress.ip_network(str(entry).strip(), strict=False)
+        except ValueError:
+            continue
+        networks[network.version].append(network)
+
+    prefixes = {}
+    for version, nets in networks.items():
+        prefixes[version] = [(int(n.network_address), n.prefixlen)
+                             for n in ipaddress.collapse_addresses(nets)]
+    return prefixes
+
+
+def aggregate_prefixes(prefixes, max_terms, width):
+    """Riduce una lista ordinata di prefissi a max_terms fondendo i vicini.
+
+    Ad ogni passo fonde la coppia di prefissi adiacenti il cui super-prefisso
+    comune copre meno indirizzi, assorbendo gli eventuali prefissi che vi
+    ricadono dentro.
+    """
+    if len(prefixes) <= max_terms:
+        return list(prefixes)
+
+    values = [value for value, _ in prefixes]
+    lengths = [length for _, length in prefixes]
+    prev = list(range(-1, len(prefixes) - 1))
+    nxt = list(range(1, len(prefixes) + 1))
+    nxt[-1] = -1
+    alive = [True] * len(prefixes)
+    stamp = [0] * len(prefixes)
+    count = len(prefixes)
+
+    def last(i):
+        return values[i] + (1 << (width - lengths[i])) - 1
+
+    def supernet(i, j):
+        length = min(width - (values[i] ^ last(j)).bit_length(), lengths[i], lengths[j])
+        mask = ((1 << width) - 1) ^ ((1 << (width - length)) - 1)
+        return values[i] & mask, length
+
+    heap = []
+
+    def push(i, j):
+        if i != -1 and j != -1:
+            _, length = supernet(i, j)
+            heapq.heappush(heap, (width - length, i, j, stamp[i], stamp[j]))
+
+    def remove(i):
+        nonlocal count
+        alive[i] = False
+        count -= 1
+        if prev[i] != -1:
+            nxt[prev[i]] = nxt[i]
+        if nxt[i] != -1:
+            prev[nxt[i]] = prev[i]
+
+    for i in range(len(prefixes) - 1):
+        push(i, i + 1)
+
+    while count > max_terms and heap:
+        _, i, j, stamp_i, stamp_j = heapq.heappop(heap)
+        if not (alive[i] and alive[j]) or stamp[i] != stamp_i or stamp[j] != stamp_j:
+            continue
+
+        values[i], lengths[i] = supernet(i, j)
+        stamp[i] += 1
+        remove(j)
+
+        # Assorbe i vicini contenuti nel nuovo prefisso
+        while prev[i] != -1 and values[prev[i]] >= values[i]:
+            remove(prev[i])
+        while nxt[i] != -1 and last(nxt[i]) <= last(i):
+            remove(nxt[i])
+
+        push(prev[i], i)
+        push(i, nxt[i])
+
+    return [(values[i], lengths[i]) for i in range(len(prefixes)) if alive[i]]
+
+
+def _format_term(version, value, length):
+    address = ipaddress.ip_address(value) if version == 4 else ipaddress.IPv6Address(value)
+    keyword = "ip" if version == 4 else "ip6"
+    if length == _WIDTH[version]:
+        return f"{keyword} host {address}"
+    return f"{keyword} net {address}/{length}"
+
+
+def build_bpf_filter(entries, max_terms=MAX_FILTER_TERMS):
+    """Costruisce l'espressione BPF per la lista di IP bloccati.
+
+    Restituisce COARSE_FILTER se la lista è vuota o non contiene voci valide, o se
+    l'aggregazione creerebbe prefissi più larghi di MIN_PREFIX_LENGTH.
+    """
+    prefixes = _to_prefixes(entries)
+    total = sum(len(p) for p in prefixes.values())
+    if total == 0:
+        return COARSE_FILTER
+
+    terms = []
+    for version, family_prefixes in prefixes.items():
+        if not family_prefixes:
+            continue
+        # Il budget di termini viene diviso in proporzione al numero di prefissi
+        budget = max(1, max_terms * len(family_prefixes) // total)
+        original = set(family_prefixes)
+        for value, length in aggregate_prefixes(family_prefixes, budget, _WIDTH[version]):
+            if length < MIN_PREFIX_LENGTH[version] and (value, length) not in original:
+                return COARSE_FILTER
+            terms.append(_format_term(version, value, length))
+
+    return " or ".join(terms)
+
+
+def check_program(program):
+    """Verifica che un programma compilato (bpf_program) rientri nel limite del kernel."""
+    if program.bf_len > BPF_MAXINSNS:
+        raise ValueError(f"{program.bf_len} istruzioni, limite {BPF_MAXINSNS}")
@@ -0,0 +1,189 @@
+# Motore di cattura AF_PACKET per il CLIENT (solo Linux)
+# Alternativa allo sniffer Scapy: legge i frame da un socket AF_PACKET,
+# opzionalmente tramite ring buffer PACKET_MMAP, e analizza solo gli header
+# Ethernet/IPv4/IPv6 con struct e memoryview, senza copiare i pacchetti.
+# Gli header vengono passati come tuple di interi, a lotti, alla funzione on_batch.
+
+import mmap
+import select
+import socket
+import struct
+import time
+
+try:
+    from scapy.arch.linux import attach_filter
+except ImportError:
+    attach_filter = None
+
+# Costanti da linux/if_ether.h e linux/if_packet.h
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_8021Q = 0x8100
+ETH_P_8021AD = 0x88A8
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V2 = 1
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+HEADER_SNAPLEN = 128  # Byte letti per frame: bastano per Ethernet + VLAN + header IPv6
+RING_BLOCK_SIZE = 1 << 20
+RING_BLOCK_COUNT = 8
+RING_FRAME_SIZE = 256  # I frame più lunghi vengono troncati: servono solo gli header
+
+_TPACKET2_HDR = struct.Struct('IIIHH')  # tp_status, tp_len, tp_snaplen, tp_mac, tp_net
+_ETH_TYPE = struct.Struct('!H')
+_PORTS = struct.Struct('!HH')
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+
+def parse_frame(frame):
+    """Estrae gli header di un frame Ethernet come tupla di interi.
+
+    Restituisce (versione, sorgente, destinazione, protocollo, porta sorgente,
+    porta destinazione, lunghezza IP), con porte a 0 se non TCP/UDP, oppure
+    None per i frame che non sono IPv4/IPv6 o sono troncati.
+    """
+    if len(frame) < 14:
+        return None
+
+    offset = 12
+    eth_type = _ETH_TYPE.unpack_from(frame, offset)[0]
+    while eth_type in (ETH_P_8021Q, ETH_P_8021AD) and len(frame) >= offset + 6:
+        offset += 4
+        eth_type = _ETH_TYPE.unpack_from(frame, offset)[0]
+    offset += 2
+
+    if eth_type == ETH_P_IP and len(frame) >= offset + 20:
+        version = 4
+        src = int.from_bytes(frame[offset + 12:offset + 16], 'big')
+        dst = int.from_bytes(frame[offset + 16:offset + 20], 'big')
+        proto = frame[offset + 9]
+        length = _ETH_TYPE.unpack_from(frame, offset + 2)[0]
+        # I frammenti successivi al primo non contengono le porte
+        fragment = _ETH_TYPE.unpack_from(frame, offset + 6)[0] & 0x1FFF
+        l4_offset = offset + (frame[offset] & 0x0F) * 4 if not fragment else None
+    elif eth_type == ETH_P_IPV6 and len(frame) >= offset + 40:
+        version = 6
+        src = int.from_bytes(frame[offset + 8:offset + 24], 'big')
+        dst = int.from_bytes(frame[offset + 24:offset + 40], 'big')
+        proto = frame[offset + 6]
+        length = _ETH_TYPE.unpack_from(frame, offset + 4)[0] + 40
+        l4_offset = offset + 40
+    else:
+        return None
+
+    sport = dport = 0
+    if proto in (IPPROTO_TCP, IPPROTO_UDP) and l4_offset and len(frame) >= l4_offset + 4:
+        sport, dport = _PORTS.unpack_from(frame, l4_offset)
+    return version, src, dst, proto, sport, dport, length
+
+
+class RawCapture:
+    """Cattura header-only su socket AF_PACKET con consegna a lotti."""
+
+    def __init__(self, on_batch, use_mmap=True, batch_size=256, batch_timeout=0.2):
+        self.on_batch = on_batch
+        self.use_mmap = use_mmap
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        self._ring = None
+        self._running = False
+
+        if use_mmap:
+            try:
+                self._setup_ring()
+            except (OSError, ValueError) as e:
+                print(f"PACKET_MMAP non disponibile, uso recv: {e}")
+                self._ring = None
+
+    def _setup_ring(self):
+        frame_count = RING_BLOCK_SIZE * RING_BLOCK_COUNT // RING_FRAME_SIZE
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V2)
+        self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING,
+                             struct.pack('IIII', RING_BLOCK_SIZE, RING_BLOCK_COUNT,
+                                         RING_FRAME_SIZE, frame_count))
+        self._ring = mmap.mmap(self.sock.fileno(), RING_BLOCK_SIZE * RING_BLOCK_COUNT,
+                               mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self._frame_count = frame_count
+
+    def set_filter(self, filter_exp):
+        """Installa (o sostituisce) un filtro BPF sul socket. Restituisce True se installato."""
+        if not filter_exp or attach_filter is None:
+            return False
+        try:
+            attach_filter(self.sock, filter_exp, None)
+            return True
+        except Exception as e:
+            print(f"Impossibile installare il filtro BPF sul socket AF_PACKET: {e}")
+            return False
+
+    def stop(self):
+        self._running = False
+
+    def run(self):
+        """Ciclo di cattura bloccante: va eseguito in un thread dedicato."""
+        self._running = True
+        if self._ring is not None:
+            self._run_ring()
+        else:
+            self._run_recv()
+
+    def _flush(self, batch):
+        if batch:
+            try:
+                self.on_batch(batch)
+            except Exception as e:
+                print(f"Errore nell'elaborazione dei pacchetti: {e}")
+        return [], time.monotonic()
+
+    def _run_recv(self):
+        buffer = bytearray(HEADER_SNAPLEN)
+        view = memoryview(buffer)
+        self.sock.settimeout(self.batch_timeout)
+        batch, started = [], time.monotonic()
+
+        while self._running:
+            try:
+                # recv_into con un buffer corto: il kernel copia solo gli header
+                size = self.sock.recv_into(buffer, HEADER_SNAPLEN)
+                headers = parse_frame(view[:size])
+                if headers:
+                    batch.append(headers)
+            except socket.timeout:
+                pass
+
+            if len(batch) >= self.batch_size or time.monotonic() - started >= self.batch_timeout:
+                batch, started = self._flush(batch)
+
+    def _run_ring(self):
+        ring = self._ring
+        view = memoryview(ring)
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN | select.POLLERR)
+        frame = 0
+        batch, started = [], time.monotonic()
+
+        while self._running:
+            offset = frame * RING_FRAME_SIZE
+            status, _, snaplen, mac, _ = _TPACKET2_HDR.unpack_from(ring, offset)
+
+            if status & TP_STATUS_USER:
+                headers = parse_frame(view[offset + mac:offset + mac + snaplen])
+                if headers:
+                    batch.append(headers)
+                # Restituisce il frame al kernel
+                struct.pack_into('I', ring, offset, TP_STATUS_KERNEL)
+                frame = (frame + 1) % self._frame_count
+            else:
+                if batch:
+                    batch, started = self._flush(batch)
+                poller.poll(int(self.batch_timeout * 1000))
+                continue
+
+            if len(batch) >= self.batch_size or time.monotonic() - started >= self.batch_timeout:
+                batch, started = self._flush(batch)
@@ -0,0 +1,161 @@
+# Tracciamento delle connessioni del CLIENT (solo Linux)
+# Sostituisce il polling di psutil.net_connections: i socket TCP/UDP vengono
+# letti con un dump NETLINK_SOCK_DIAG (o da /proc/net come ripiego), senza
+# attraversare la tabella dei file descriptor di ogni processo. Una tabella in
+# memoria dei flussi attivi, indicizzata per 5-tupla, permette di restituire
+# ad ogni ciclo solo i flussi nuovi.
+
+import os
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+TCP_LISTEN = 10
+ALL_STATES = (1 << 12) - 1
+
+_NLMSG_HDR = struct.Struct('=LHHLL')
+_INET_DIAG_REQ_V2 = struct.Struct('=BBBxL48s')
+_INET_DIAG_MSG = struct.Struct('=BBBB48sLLLLL')
+_SOCKID_PORTS = struct.Struct('!HH')
+
+PROTOCOLS = ((socket.IPPROTO_TCP, 'tcp'), (socket.IPPROTO_UDP, 'udp'))
+FAMILIES = ((socket.AF_INET, 4, ''), (socket.AF_INET6, 6, '6'))
+
+# Flusso di rete: versione IP e indirizzi come interi, porte in ordine host
+Flow = namedtuple('Flow', ['proto', 'version', 'laddr', 'lport', 'raddr', 'rport', 'inode', 'uid'])
+
+
+def _recv_all(sock, seq):
+    """Legge le risposte di un dump netlink fino a NLMSG_DONE."""
+    while True:
+        data = sock.recv(1 << 16)
+        offset = 0
+        while offset + _NLMSG_HDR.size <= len(data):
+            length, msg_type, _, msg_seq, _ = _NLMSG_HDR.unpack_from(data, offset)
+            if length < _NLMSG_HDR.size:
+                return
+            if msg_seq == seq:
+                if msg_type == NLMSG_DONE:
+                    return
+                if msg_type == NLMSG_ERROR:
+                    error = struct.unpack_from('=i', data, offset + _NLMSG_HDR.size)[0]
+                    raise OSError(-error, os.strerror(-error))
+                yield data[offset + _NLMSG_HDR.size:offset + length]
+            offset += (length + 3) & ~3
+
+
+def dump_sock_diag(sock, proto, family, version, seq):
+    """Esegue un dump SOCK_DIAG_BY_FAMILY e restituisce i flussi connessi."""
+    states = ALL_STATES & ~(1 << TCP_LISTEN) if proto == socket.IPPROTO_TCP else ALL_STATES
+    request = _INET_DIAG_REQ_V2.pack(family, proto, 0, states, b'\0' * 48)
+    header = _NLMSG_HDR.pack(_NLMSG_HDR.size + len(request), SOCK_DIAG_BY_FAMILY,
+                             NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+    sock.sendto(header + request, (0, 0))
+
+    address_size = 4 if version == 4 else 16
+    for payload in _recv_all(sock, seq):
+        if len(payload) < _INET_DIAG_MSG.size:
+            continue
+        _, _, _, _, sockid, _, _, _, uid, inode = _INET_DIAG_MSG.unpack_from(payload)
+        sport, dport = _SOCKID_PORTS.unpack_from(sockid)
+        yield Flow(proto, version,
+                   int.from_bytes(sockid[4:4 + address_size], 'big'), sport,
+                   int.from_bytes(sockid[20:20 + address_size], 'big'), dport,
+                   inode, uid)
+
+
+def _parse_proc_address(text):
+    """Converte un indirizzo di /proc/net (esadecimale, word in ordine host) in (intero, porta)."""
+    address, port = text.split(':')
+    raw = bytes.fromhex(address)
+    raw = b''.join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    return int.from_bytes(raw, 'big'), int(port, 16)
+
+
+def read_proc_net():
+    """Legge i socket connessi da /proc/net/{tcp,udp}{,6}."""
+    for proto, proto_name in PROTOCOLS:
+        for _, version, suffix in FAMILIES:
+            try:
+                with open(f"/proc/net/{proto_name}{suffix}") as f:
+                    next(f)
+                    for line in f:
+                        fields = line.split()
+                        if len(fields) < 10 or int(fields[3], 16) == TCP_LISTEN:
+                            continue
+                        laddr, lport = _parse_proc_address(fields[1])
+                        raddr, rport = _parse_proc_address(fields[2])
+                        yield Flow(proto, version, laddr, lport, raddr, rport,
+                                   int(fields[9]), int(fields[7]))
+            except (OSError, StopIteration):
+                continue
+
+
+class ConnectionTracker:
+    """Tabella dei flussi attivi aggiornata con dump incrementali."""
+
+    def __init__(self):
+        self.flows = {}  # 5-tupla -> {'flow': Flow, 'first_seen': ..., 'last_seen': ...}
+        self._seq = 0
+        self._lock = threading.Lock()
+        try:
+            self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_SOCK_DIAG)
+        except (AttributeError, OSError) as e:
+            print(f"NETLINK_SOCK_DIAG non disponibile, uso /proc/net: {e}")
+            self._sock = None
+
+    def _dump(self):
+        with self._lock:
+            return self._dump_locked()
+
+    def _dump_locked(self):
+        if self._sock is not None:
+            try:
+                flows = []
+                for proto, _ in PROTOCOLS:
+                    for family, version, _ in FAMILIES:
+                        self._seq += 1
+                        flows.extend(dump_sock_diag(self._sock, proto, family, version, self._seq))
+                return flows
+            except OSError as e:
+                print(f"Errore nel dump NETLINK_SOCK_DIAG, uso /proc/net: {e}")
+                self._sock.close()
+                self._sock = None
+        return list(read_proc_net())
+
+    def poll(self):
+        """Aggiorna la tabella e restituisce i flussi comparsi dall'ultimo ciclo."""
+        now = time.time()
+        current = {}
+        for flow in self._dump():
+            # Salta i socket non connessi (UDP senza destinazione)
+            if not flow.raddr or not flow.rport:
+                continue
+            current[flow[:6]] = flow
+
+        new_flows = []
+        flows = {}
+        for key, flow in current.items():
+            entry = self.flows.get(key)
+            if entry is None:
+                entry = {'flow': flow, 'first_seen': now}
+                new_flows.append(flow)
+            entry['last_seen'] = now
+            flows[key] = entry
+
+        # I flussi non più presenti nel dump vengono rimossi
+        self.flows = flows
+        return new_flows
+
+    def find_flows(self, version, raddr):
+        """Esegue un dump e restituisce i flussi verso l'indirizzo remoto indicato."""
+        return [flow for flow in self._dump() if flow.version == version and flow.raddr == raddr]
+
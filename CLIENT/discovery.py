@@ -0,0 +1,126 @@
+# Individuazione del BOX
+# 1. Broadcast UDP: un solo datagramma a cui il BOX risponde con il suo codice
+# 2. Scansione parallela: sonda tutti gli host di una rete (di qualsiasi
+#    dimensione CIDR) con richieste HTTP /api/discover concorrenti tramite
+#    asyncio, con un limite alle connessioni aperte, fermandosi alla prima
+#    risposta valida
+
+import asyncio
+import ipaddress
+import itertools
+import json
+import socket
+import time
+
+DISCOVERY_CONCURRENCY = 128  # Connessioni contemporanee massime
+PROBE_TIMEOUT = 1  # Timeout di ogni sonda in secondi
+MAX_SCAN_HOSTS = 65536  # Limite di host sondati per reti molto grandi
+MAX_RESPONSE_SIZE = 65536
+DISCOVERY_UDP_PORT = 5002  # Porta UDP su cui il BOX risponde ai broadcast
+DISCOVERY_MAGIC = b"FUTURO_DISCOVER"
+BROADCAST_TIMEOUT = 1.5  # Attesa massima delle risposte al broadcast in secondi
+
+
+def broadcast_discover(network_cidr=None, port=DISCOVERY_UDP_PORT, timeout=BROADCAST_TIMEOUT):
+    """Invia un broadcast UDP di discovery e restituisce (ip, risposta) del primo BOX che risponde."""
+    targets = {'255.255.255.255'}
+    if network_cidr:
+        network = ipaddress.ip_network(network_cidr, strict=False)
+        if network.version == 4:
+            targets.add(str(network.broadcast_address))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        for target in targets:
+            try:
+                sock.sendto(DISCOVERY_MAGIC, (target, port))
+            except OSError:
+                continue
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            sock.settimeout(remaining)
+            try:
+                data, address = sock.recvfrom(MAX_RESPONSE_SIZE)
+            except socket.timeout:
+                return None
+            try:
+                response = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(response, dict) and response.get('box_code'):
+                return address[0], response
+    finally:
+        sock.close()
+
+
+async def _read_response(reader):
+    """Legge la risposta fino alla chiusura della connessione (HTTP/1.0), al più MAX_RESPONSE_SIZE byte."""
+    response = b""
+    while len(response) < MAX_RESPONSE_SIZE:
+        chunk = await reader.read(MAX_RESPONSE_SIZE - len(response))
+        if not chunk:
+            break
+        response += chunk
+    return response
+
+
+async def probe_box(ip, port, timeout=PROBE_TIMEOUT):
+    """Interroga /api/discover su un host. Restituisce la risposta JSON se è un BOX valido."""
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        writer.write(f"GET /api/discover HTTP/1.0\r\nHost: {ip}:{port}\r\n\r\n".encode())
+        await writer.drain()
+        # Intestazioni e corpo possono arrivare in segmenti separati: si legge fino a EOF
+        response = await asyncio.wait_for(_read_response(reader), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+
+    head, _, body = response.partition(b"\r\n\r\n")
+    status_line = head.split(b"\r\n", 1)[0].split()
+    if len(status_line) < 2 or status_line[1] != b"200":
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if isinstance(data, dict) and data.get('box_code'):
+        return data
+    return None
+
+
+async def _scan(hosts, port, concurrency, timeout):
+    found = asyncio.get_running_loop().create_future()
+
+    async def worker():
+        # I worker condividono lo stesso iteratore: al massimo `concurrency` sonde attive
+        for ip in hosts:
+            if found.done():
+                return
+            if await probe_box(ip, port, timeout) and not found.done():
+                found.set_result(ip)
+                return
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+    finished = asyncio.ensure_future(asyncio.gather(*workers))
+    await asyncio.wait([found, finished], return_when=asyncio.FIRST_COMPLETED)
+
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    return found.result() if found.done() else None
+
+
+def scan_network_for_box(network_cidr, port, concurrency=DISCOVERY_CONCURRENCY, timeout=PROBE_TIMEOUT):
+    """Sonda in parallelo gli host di network_cidr e restituisce l'IP del primo BOX trovato."""
+    network = ipaddress.ip_network(network_cidr, strict=False)
+    hosts = (str(ip) for ip in itertools.islice(network.hosts(), MAX_SCAN_HOSTS))
+    return asyncio.run(_scan(hosts, port, concurrency, timeout))
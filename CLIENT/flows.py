@@ -0,0 +1,116 @@
+# Tabella dello stato dei flussi bloccati del CLIENT
+# Ogni flusso (5-tupla) verso un IP bloccato viene registrato una sola volta:
+# l'azione di blocco avviene al primo pacchetto/connessione e i successivi
+# aggiornano solo i contatori. I flussi inattivi da più di FLOW_TTL secondi
+# vengono rimossi e conservati finché non vengono inclusi in un report verso
+# il BOX (al più REPORT_MAX_FLOWS per report, gli altri nei successivi); se il
+# BOX non è raggiungibile ne vengono conservati al più EXPIRED_MAX_FLOWS e i
+# più vecchi vengono scartati.
+
+import datetime
+import threading
+import time
+
+FLOW_TTL = 300  # Secondi di inattività dopo i quali un flusso viene rimosso
+REPORT_MAX_FLOWS = 100  # Numero massimo di flussi inclusi in un report
+EXPIRED_MAX_FLOWS = 10000  # Numero massimo di flussi scaduti in attesa del report
+
+
+def flow_key(proto, local_ip, local_port, remote_ip, remote_port):
+    """Costruisce la chiave di un flusso (protocollo, locale, remoto)."""
+    return (proto, local_ip, local_port or 0, remote_ip, remote_port or 0)
+
+
+class FlowTable:
+    """Stato dei flussi verso IP bloccati, con scadenza per inattività."""
+
+    def __init__(self, ttl=FLOW_TTL, max_expired=EXPIRED_MAX_FLOWS):
+        self.ttl = ttl
+        self.max_expired = max_expired
+        self._flows = {}
+        self._expired = []
+        self._dropped = 0  # Flussi scaduti scartati senza essere riportati
+        self._last_eviction = time.monotonic()
+        self._lock = threading.Lock()
+
+    def observe(self, key, packets=1, size=0):
+        """Registra traffico su un flusso. Restituisce True se il flusso è nuovo."""
+        now = time.time()
+        with self._lock:
+            state = self._flows.get(key)
+            is_new = state is None
+            if is_new:
+                state = {'first_seen': now, 'packets': 0, 'bytes': 0, 'action': None, 'reported_seen': 0}
+                self._flows[key] = state
+            state['last_seen'] = now
+            state['packets'] += packets
+            state['bytes'] += size
+
+        if time.monotonic() - self._last_eviction >= self.ttl / 10:
+            self.evict()
+        return is_new
+
+    def set_action(self, key, action):
+        """Registra l'azione eseguita sul flusso (es. processo terminato)."""
+        with self._lock:
+            if key in self._flows:
+                self._flows[key]['action'] = action
+
+    def evict(self):
+        """Rimuove i flussi inattivi da più di ttl secondi."""
+        cutoff = time.time() - self.ttl
+        dropped = 0
+        with self._lock:
+            for key in [k for k, state in self._flows.items() if state['last_seen'] < cutoff]:
+                state = self._flows.pop(key)
+                # Conservato solo se ha traffico non ancora riportato
+                if state['last_seen'] > state['reported_seen']:
+                    self._expired.append((key, state))
+            if len(self._expired) > self.max_expired:
+                # Report non inviati (BOX non raggiungibile): si scartano i flussi scaduti da più tempo
+                dropped = len(self._expired) - self.max_expired
+                del self._expired[:dropped]
+                self._dropped += dropped
+            total = self._dropped
+            self._last_eviction = time.monotonic()
+
+        if dropped:
+            print(f"Scartati {dropped} flussi scaduti non ancora riportati al BOX ({total} in totale)")
+
+    def report(self):
+        """Restituisce le statistiche dei flussi con traffico non ancora riportato.
+
+        Il report va confermato con mark_reported(marker) dopo l'invio al BOX: il
+        marker contiene solo i flussi inclusi, gli altri restano per i report successivi.
+        """
+        with self._lock:
+            flows = [(key, dict(state)) for key, state in list(self._flows.items()) + self._expired
+                     if state['last_seen'] > state['reported_seen']]
+
+        flows.sort(key=lambda item: item[1]['packets'], reverse=True)
+        flows = flows[:REPORT_MAX_FLOWS]
+        marker = {(key, state['first_seen']): state['last_seen'] for key, state in flows}
+        stats = [{
+            'protocollo': key[0],
+            'ip_locale': key[1],
+            'porta_locale': key[2],
+            'ip_remoto': key[3],
+            'porta_remota': key[4],
+            'primo_rilevamento': datetime.datetime.fromtimestamp(state['first_seen']).isoformat(),
+            'ultimo_rilevamento': datetime.datetime.fromtimestamp(state['last_seen']).isoformat(),
+            'pacchetti': state['packets'],
+            'byte': state['bytes'],
+            'azione': state['action']
+        } for key, state in flows]
+        return stats, marker
+
+    def mark_reported(self, marker):
+        """Conferma l'invio del report: i flussi scaduti riportati vengono scartati."""
+        with self._lock:
+            for key, state in self._flows.items():
+                last_seen = marker.get((key, state['first_seen']))
+                if last_seen is not None:
+                    state['reported_seen'] = last_seen
+            # Restano i flussi scaduti non inclusi nel report
+            self._expired = [(key, state) for key, state in self._expired
+                             if (key, state['first_seen']) not in marker]
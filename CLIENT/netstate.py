@@ -0,0 +1,159 @@
+# Stato delle interfacce di rete locali
+# Le informazioni (IP, MAC, CIDR, gateway) vengono calcolate una sola volta e
+# tenute in cache. Un thread le aggiorna periodicamente e, su Linux, anche
+# quando il kernel notifica cambi di indirizzi o di rotte via netlink.
+
+import ipaddress
+import os
+import select
+import socket
+import threading
+import time
+
+import psutil
+
+REFRESH_INTERVAL = 300  # Aggiornamento periodico in secondi
+EVENT_DEBOUNCE = 1  # Attesa dopo un evento netlink per raggruppare le notifiche
+
+# Gruppi multicast di NETLINK_ROUTE (linux/rtnetlink.h)
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+
+FALLBACK_NETWORK_INFO = {
+    'interface': "default",
+    'gateway': "192.168.1.1",
+    'ip_private': "192.168.1.100",
+    'netmask': "255.255.255.0",
+    'network_cidr': "192.168.1.0/24",
+    'mac_address': "00:00:00:00:00:00",
+    'local_ips': frozenset(["192.168.1.100"])
+}
+
+
+def _get_primary_ip():
+    """Determina l'IP dell'interfaccia usata per uscire verso internet."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("8.8.8.8", 80))  # Nessun pacchetto viene inviato, serve solo a scegliere la rotta
+        return s.getsockname()[0]
+    finally:
+        s.close()
+
+
+def _get_default_gateway():
+    """Legge il gateway predefinito da /proc/net/route (solo Linux)."""
+    try:
+        with open('/proc/net/route') as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if len(fields) > 2 and fields[1] == '00000000':
+                    return socket.inet_ntoa(int(fields[2], 16).to_bytes(4, 'little'))
+    except (OSError, ValueError, StopIteration):
+        pass
+    return None
+
+
+def detect_network_info():
+    """Calcola le informazioni sulla rete locale senza lanciare processi esterni."""
+    network_info = {'ip_private': _get_primary_ip()}
+    ip_parts = network_info['ip_private'].split('.')
+
+    # Valori di default: rete /24 con gateway .1
+    network_info['interface'] = "default"
+    network_info['netmask'] = "255.255.255.0"
+    network_info['mac_address'] = "00:00:00:00:00:00"
+
+    local_ips = set()
+    for interface, addresses in psutil.net_if_addrs().items():
+        interface_ips = [a for a in addresses if a.family in (socket.AF_INET, socket.AF_INET6)]
+        local_ips.update(a.address.split('%')[0] for a in interface_ips)
+
+        for address in interface_ips:
+            if address.address == network_info['ip_private']:
+                network_info['interface'] = interface
+                if address.netmask:
+                    network_info['netmask'] = address.netmask
+                for link in addresses:
+                    if link.family == psutil.AF_LINK and link.address:
+                        network_info['mac_address'] = link.address.replace('-', ':').lower()
+                        break
+
+    network = ipaddress.IPv4Network(f"{network_info['ip_private']}/{network_info['netmask']}", strict=False)
+    network_info['network_cidr'] = str(network)
+    network_info['gateway'] = (_get_default_gateway() if os.name == 'posix' else None) or \
+        f"{ip_parts[0]}.{ip_parts[1]}.{ip_parts[2]}.1"
+    network_info['local_ips'] = frozenset(local_ips | {network_info['ip_private']})
+
+    return network_info
+
+
+def _open_route_monitor():
+    """Apre un socket netlink iscritto ai cambi di link, indirizzi e rotte (solo Linux)."""
+    if not hasattr(socket, 'AF_NETLINK'):
+        return None
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE |
+                   RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE))
+        sock.setblocking(False)
+        return sock
+    except OSError as e:
+        print(f"Monitoraggio netlink non disponibile: {e}")
+        return None
+
+
+class NetworkState:
+    """Cache condivisa delle informazioni di rete locali."""
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._info = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def refresh(self):
+        """Ricalcola le informazioni di rete e sostituisce quelle in cache."""
+        try:
+            info = detect_network_info()
+        except Exception as e:
+            print(f"Errore nel determinare le informazioni di rete: {e}")
+            info = self._info or dict(FALLBACK_NETWORK_INFO)
+
+        self._info = info
+        return info
+
+    def get(self):
+        """Restituisce le informazioni in cache, calcolandole alla prima richiesta."""
+        info = self._info
+        if info is None:
+            with self._lock:
+                info = self._info or self.refresh()
+        return info
+
+    def start(self):
+        """Avvia il thread di aggiornamento (timer + eventi netlink)."""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        monitor = _open_route_monitor()
+        while True:
+            if monitor is None:
+                time.sleep(self.refresh_interval)
+            else:
+                readable, _, _ = select.select([monitor], [], [], self.refresh_interval)
+                if readable:
+                    # Raggruppa le notifiche ravvicinate in un solo aggiornamento
+                    time.sleep(EVENT_DEBOUNCE)
+                    try:
+                        while monitor.recv(65536):
+                            pass
+                    except (BlockingIOError, InterruptedError):
+                        pass
+            self.refresh()
@@ -15,80 +15,75 @@ import os
 import datetime
 import ipaddress
 import psutil
-from scapy.all import IP, sniff
-import subprocess
+from scapy.all import IP, TCP, UDP, AsyncSniffer
+from scapy.arch.common import compile_filter
+from blocklist import BlocklistMatcher, BINARY_MIMETYPE, decode_blocklist, format_network, parse_ip, parse_network
+from bpf import build_bpf_filter, check_program, COARSE_FILTER, MAX_FILTER_TERMS
+from netstate import NetworkState
+from capture import RawCapture
+from connections import ConnectionTracker
+from procindex import LRUCache, SocketInodeIndex
+from flows import FlowTable, flow_key
+from discovery import broadcast_discover, scan_network_for_box
 
 # Configurazione
 BOX_DISCOVERY_PORT = 5001  # Porta del servizio API del BOX
 BOX_IP_FILE = "box_ip.txt"  # File dove salvare l'IP del BOX
 CLIENT_NAME = socket.gethostname()
 REPORT_INTERVAL = 600  # 10 minuti in secondi
+CAPTURE_ENGINE = "scapy"  # Motore di cattura: "scapy" oppure "raw" (AF_PACKET, solo Linux)
+RAW_CAPTURE_MMAP = True  # Usa il ring buffer PACKET_MMAP con il motore "raw"
+CONNECTION_MONITOR = "sockdiag"  # Monitor delle connessioni: "sockdiag" (netlink, solo Linux) oppure "psutil"
+CONNECTION_POLL_INTERVAL = 0.5  # Intervallo tra due dump dei socket in secondi
+PROTOCOL_NAMES = {6: 'tcp', 17: 'udp', socket.SOCK_STREAM: 'tcp', socket.SOCK_DGRAM: 'udp'}
+LOCAL_NETWORKS = BlocklistMatcher(['127.0.0.0/8', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16'])
 
 # Variabili globali
 box_ip = None
-blocked_ips = []
+blocked_networks = frozenset()  # Reti bloccate come tuple (versione, indirizzo, prefisso)
+blocked_ips_revision = 0  # Revisione della lista ricevuta dal BOX
+blocked_ips_etag = None  # Header ETag dell'ultima lista ricevuta dal BOX
+blocked_ips_last_modified = None  # Header Last-Modified dell'ultima lista ricevuta dal BOX
+blocklist_matcher = BlocklistMatcher()  # Struttura di ricerca compilata da blocked_networks
 threats_detected = 0
 ips_blocked = 0
 active_connections = {}  # Dizionario per tenere traccia delle connessioni attive
+network_state = NetworkState()  # Informazioni di rete locali, aggiornate in background
+sniffer = None  # Sniffer Scapy attivo
+raw_capture = None  # Motore di cattura AF_PACKET attivo
+socket_index = SocketInodeIndex()  # Indice inode del socket -> PID
+resolved_flows = LRUCache()  # IP remoto -> PID già risolti per i flussi segnalati
+connection_lookup = None  # Tracker usato per risolvere i flussi dal percorso di cattura
+flow_table = FlowTable()  # Stato dei flussi verso IP bloccati (5-tupla -> contatori e azione)
+sniffer_filter = None  # Filtro BPF installato sullo sniffer
+sniffer_lock = threading.Lock()
 
 
 def get_network_info():
-    """Ottiene informazioni sulla rete locale con un approccio semplificato."""
-    try:
-        network_info = {}
-
-        # Determina l'IP privato usando socket
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))  # Connessione a Google DNS per determinare l'interfaccia
-        network_info['ip_private'] = s.getsockname()[0]
-        s.close()
+    """Restituisce le informazioni sulla rete locale dalla cache condivisa."""
+    return network_state.get()
 
-        # Semplificazione: assume che la rete sia una /24 (classe C)
-        # Prende i primi 3 ottetti dell'IP e aggiunge .0/24
-        ip_parts = network_info['ip_private'].split('.')
-        network_info['network_cidr'] = f"{ip_parts[0]}.{ip_parts[1]}.{ip_parts[2]}.0/24"
 
-        # Imposta netmask standard per rete /24
-        network_info['netmask'] = "255.255.255.0"
-
-        # Per il gateway, usa l'indirizzo .1 come comune default
-        network_info['gateway'] = f"{ip_parts[0]}.{ip_parts[1]}.{ip_parts[2]}.1"
+def scan_network_sequential(network_cidr):
+    """Scansione sequenziale della rete, usata come ripiego se quella parallela non è disponibile."""
+    try:
+        network = ipaddress.ip_network(network_cidr, strict=False)
+        for ip in network.hosts():
+            ip_str = str(ip)
 
-        # Per il MAC, ottiene informazioni dall'interfaccia di rete attiva
-        try:
-            if os.name == 'nt':  # Windows
-                output = subprocess.check_output("ipconfig /all", shell=True, text=True)
-                for line in output.split('\n'):
-                    if "Physical Address" in line and ":" in line:
-                        mac = line.split(":")[-1].strip()
-                        if mac and mac != "":
-                            network_info['mac_address'] = mac
-                            break
-            else:  # Linux/Unix
-                output = subprocess.check_output("ifconfig || ip link", shell=True, text=True)
-                for line in output.split('\n'):
-                    if ("ether" in line or "HWaddr" in line) and network_info['ip_private'] in output:
-                        parts = line.split()
-                        for i, part in enumerate(parts):
-                            if part.lower() in ["ether", "hwaddr"] and i + 1 < len(parts):
-                                network_info['mac_address'] = parts[i + 1]
-                                break
-        except:
-            # Fallback se non riesce a ottenere il MAC
-            network_info['mac_address'] = "00:00:00:00:00:00"
+            try:
+                print(ip_str)
+                # Prova a contattare l'API di discovery
+                response = requests.get(f"http://{ip_str}:{BOX_DISCOVERY_PORT}/api/discover", timeout=1)
 
-        return network_info
+                if response.status_code == 200:
+                    return ip_str
+            except:
+                pass
     except Exception as e:
-        print(f"Errore nel determinare le informazioni di rete: {e}")
-        # Fallback con valori predefiniti
-        return {
-            'interface': "default",
-            'gateway': "192.168.1.1",
-            'ip_private': "192.168.1.100",
-            'netmask': "255.255.255.0",
-            'network_cidr': "192.168.1.0/24",
-            'mac_address': "00:00:00:00:00:00"
-        }
+        print(f"Errore durante la scansione della rete: {e}")
+
+    return None
 
 
 def discover_box():
@@ -115,69 +110,134 @@ def discover_box():
     if not network_info:
         print("Impossibile ottenere informazioni di rete. Utilizzo rete predefinita 192.168.1.0/24")
         network_cidr = "192.168.1.0/24"
-        our_ip = "192.168.1.100"  # IP di fallback
     else:
         network_cidr = network_info['network_cidr']
-        our_ip = network_info['ip_private']
 
     print(f"Ricerca del BOX nella rete {network_cidr}...")
 
-    # Scansiona tutti gli IP nella rete (escluso il broadcast e il proprio IP)
+    # Prima prova con un broadcast UDP: una sola richiesta invece di una per host
+    found_ip = None
     try:
-        network = ipaddress.IPv4Network(network_cidr, strict=False)
-        for ip in network.hosts():
-            ip_str = str(ip)
-
-            # Salta il proprio IP
-            #if ip_str == our_ip:
-            #    continue
+        found = broadcast_discover(network_cidr)
+        if found:
+            found_ip = found[0]
+    except Exception as e:
+        print(f"Errore nella discovery via broadcast: {e}")
 
-            try:
-                print(ip_str)
-                # Prova a contattare l'API di discovery
-                response = requests.get(f"http://{ip_str}:{BOX_DISCOVERY_PORT}/api/discover", timeout=1)
+    # Altrimenti scansiona tutti gli IP della rete in parallelo, con la scansione sequenziale come ripiego
+    if not found_ip:
+        try:
+            found_ip = scan_network_for_box(network_cidr, BOX_DISCOVERY_PORT)
+        except Exception as e:
+            print(f"Errore nella scansione parallela: {e}")
+        if not found_ip:
+            print("BOX non trovato con la scansione parallela, uso la scansione sequenziale")
+            found_ip = scan_network_sequential(network_cidr)
 
-                if response.status_code == 200:
-                    box_ip = ip_str
+    if found_ip:
+        box_ip = found_ip
 
-                    # Salva l'IP del BOX
-                    with open(BOX_IP_FILE, 'w') as f:
-                        f.write(box_ip)
+        # Salva l'IP del BOX
+        with open(BOX_IP_FILE, 'w') as f:
+            f.write(box_ip)
 
-                    print(f"BOX trovato all'IP: {box_ip}")
-                    return box_ip
-            except:
-                pass
-    except Exception as e:
-        print(f"Errore durante la scansione della rete: {e}")
+        print(f"BOX trovato all'IP: {box_ip}")
+        return box_ip
 
     print("BOX non trovato nella rete locale.")
     return None
 
 
+def parse_blocked_ips(ips):
+    """Converte una lista di IP e range CIDR testuali in reti, scartando le voci non valide."""
+    networks = set()
+    invalid = 0
+    for ip in ips:
+        network = parse_network(ip)
+        if network:
+            networks.add(network)
+        else:
+            invalid += 1
+    if invalid:
+        print(f"Ignorate {invalid} voci non valide nella lista IP.")
+    return networks
+
+
+def set_blocked_networks(networks, revision=0):
+    """Compila la nuova lista di reti bloccate e la sostituisce in modo atomico."""
+    global blocked_networks, blocked_ips_revision, blocklist_matcher
+
+    networks = frozenset(networks)
+    blocklist_matcher = BlocklistMatcher(networks)
+    blocked_networks = networks
+    blocked_ips_revision = revision
+
+    # Ricompila il filtro dello sniffer per la nuova lista
+    if sniffer or raw_capture:
+        update_sniffer_filter()
+
+
 def get_blocked_ips():
-    """Scarica la lista di IP da bloccare dal BOX."""
-    global blocked_ips
+    """Scarica la lista di IP da bloccare dal BOX, solo le modifiche se la revisione è nota.
+
+    La richiesta è condizionale: se la lista non è cambiata il BOX risponde 304.
+    """
+    global blocked_ips_etag, blocked_ips_last_modified
 
     if not box_ip:
         print("Impossibile ottenere la lista di IP: BOX non trovato.")
         return False
 
     try:
-        response = requests.get(f"http://{box_ip}:{BOX_DISCOVERY_PORT}/api/blocklist")
+        params = {'since': blocked_ips_revision} if blocked_ips_revision else None
+        # Preferisce il formato binario compatto, caricato senza analizzare stringhe
+        headers = {'Accept': f"{BINARY_MIMETYPE}, application/json;q=0.5"}
+        if blocked_ips_etag:
+            headers['If-None-Match'] = blocked_ips_etag
+        if blocked_ips_last_modified:
+            headers['If-Modified-Since'] = blocked_ips_last_modified
+        response = requests.get(f"http://{box_ip}:{BOX_DISCOVERY_PORT}/api/blocklist",
+                                params=params, headers=headers)
+
+        if response.status_code == 304:
+            print("Lista IP da bloccare già aggiornata.")
+            return True
 
         if response.status_code == 200:
-            data = response.json()
-            blocked_ips = data.get('data', [])
+            if response.headers.get('Content-Type', '').startswith(BINARY_MIMETYPE):
+                data = decode_blocklist(response.content)
+            else:
+                data = response.json()
+                for field in ('data', 'added', 'removed'):
+                    if field in data:
+                        data[field] = parse_blocked_ips(data[field])
+            revision = data.get('revision', 0)
+
+            if data.get('full', True):
+                networks = data.get('data', set())
+            else:
+                added = data.get('added', set())
+                removed = data.get('removed', set())
+                if not added and not removed and revision == blocked_ips_revision:
+                    print("Lista IP da bloccare già aggiornata.")
+                    return True
+                networks = (blocked_networks - removed) | added
+
+            set_blocked_networks(networks, revision)
+            blocked_ips_etag = response.headers.get('ETag')
+            blocked_ips_last_modified = response.headers.get('Last-Modified')
 
             # Salva la lista degli IP bloccati
             with open("blocked_ips.json", 'w') as f:
                 json.dump({
                     'timestamp': datetime.datetime.now().isoformat(),
-                    'ips': blocked_ips
+                    'revision': revision,
+                    'etag': blocked_ips_etag,
+                    'last_modified': blocked_ips_last_modified,
+                    'ips': [format_network(*network) for network in sorted(networks)]
                 }, f, indent=4)
 
-            print(f"Lista di {len(blocked_ips)} IP da bloccare aggiornata.")
+            print(f"Lista di {len(networks)} IP da bloccare aggiornata (revisione {revision}).")
             return True
         else:
             print(f"Errore nel download della lista IP: {response.status_code}")
@@ -195,18 +255,43 @@ def get_process_by_pid(pid):
         return None
 
 
+def find_pids_for_remote(remote_ip):
+    """Trova i PID dei processi connessi a un IP remoto, usando la cache dei flussi risolti."""
+    global connection_lookup
+
+    pids = resolved_flows.get(remote_ip)
+    if pids and any(psutil.pid_exists(pid) for pid in pids):
+        return pids
+
+    pids = set()
+    if os.name == 'posix':  # Linux
+        parsed = parse_ip(remote_ip)
+        if parsed:
+            if connection_lookup is None:
+                connection_lookup = ConnectionTracker()
+            for flow in connection_lookup.find_flows(*parsed):
+                pid = socket_index.lookup(flow.inode) if flow.inode else None
+                if pid:
+                    pids.add(pid)
+    else:  # Windows
+        for conn in psutil.net_connections(kind='inet'):
+            if conn.raddr and conn.raddr.ip == remote_ip and conn.pid:
+                pids.add(conn.pid)
+
+    if pids:
+        resolved_flows.put(remote_ip, pids)
+    else:
+        resolved_flows.pop(remote_ip)
+    return pids
+
+
 def get_process_by_connection(conn):
     """Trova il processo associato a una connessione."""
     try:
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-            try:
-                connections = proc.connections()
-                for c in connections:
-                    if (c.laddr.port == conn.laddr.port and c.laddr.ip == conn.laddr.ip and
-                            c.raddr.port == conn.raddr.port and c.raddr.ip == conn.raddr.ip):
-                        return proc
-            except:
-                continue
+        if conn.pid:
+            return get_process_by_pid(conn.pid)
+        for pid in find_pids_for_remote(conn.raddr.ip):
+            return get_process_by_pid(pid)
         return None
     except Exception as e:
         print(f"Errore nel trovare il processo per la connessione: {e}")
@@ -240,122 +325,251 @@ def kill_process(process):
 
 def is_ip_blocked(ip):
     """Verifica se un IP è nella lista di quelli da bloccare."""
-    return ip in blocked_ips
+    return blocklist_matcher.contains(ip)
 
 
 def monitor_connections_with_psutil():
     """Monitora le connessioni di rete utilizzando psutil."""
-    global threats_detected
-
     while True:
-        if not blocked_ips:
+        if not blocked_networks:
             time.sleep(5)
             continue
 
         try:
-            # Ottieni tutte le connessioni
-            connections = psutil.net_connections(kind='inet')
+            # Ottieni tutte le connessioni con indirizzo remoto
+            connections = [conn for conn in psutil.net_connections(kind='inet') if conn.raddr]
+
+            # Verifica tutti gli IP remoti del ciclo in un solo lotto
+            blocked = blocklist_matcher.match_many(conn.raddr.ip for conn in connections)
 
             for conn in connections:
-                # Salta le connessioni senza indirizzo remoto
-                if not conn.raddr:
-                    continue
+                if conn.raddr.ip in blocked:
+                    key = flow_key(PROTOCOL_NAMES.get(conn.type, str(conn.type)),
+                                   conn.laddr.ip, conn.laddr.port, conn.raddr.ip, conn.raddr.port)
+                    handle_blocked_flow(key, packets=0, pid=conn.pid)
+
+            time.sleep(1)  # Controlla ogni secondo
+        except Exception as e:
+            print(f"Errore nel monitoraggio delle connessioni: {e}")
+            time.sleep(5)  # Pausa più lunga in caso di errore
 
-                remote_ip = conn.raddr.ip
 
-                # Verifica se l'IP è bloccato
-                if is_ip_blocked(remote_ip):
-                    threats_detected += 1
-                    print(f"Rilevata connessione a IP bloccato: {remote_ip}")
+def monitor_connections_with_sockdiag():
+    """Monitora le connessioni con dump NETLINK_SOCK_DIAG, verificando solo i flussi nuovi."""
+    tracker = ConnectionTracker()
+    checked_matcher = None
+    socket_index.refresh()
 
-                    # Trova e termina il processo
-                    process = get_process_by_pid(conn.pid)
-                    if process:
-                        kill_process(process)
+    while True:
+        if not blocked_networks:
+            time.sleep(5)
+            continue
 
-            time.sleep(1)  # Controlla ogni secondo
+        try:
+            new_flows = tracker.poll()
+
+            # Se la lista è cambiata vanno ricontrollati anche i flussi già noti
+            matcher = blocklist_matcher
+            if matcher is not checked_matcher:
+                new_flows = [entry['flow'] for entry in tracker.flows.values()]
+                checked_matcher = matcher
+
+            remotes = {4: set(), 6: set()}
+            for flow in new_flows:
+                remotes[flow.version].add(flow.raddr)
+            blocked = {(version, value) for version, values in remotes.items()
+                       for value in matcher.match_ints(version, values)}
+
+            for flow in new_flows:
+                if (flow.version, flow.raddr) not in blocked:
+                    continue
+
+                key = flow_key(PROTOCOL_NAMES.get(flow.proto, str(flow.proto)),
+                               int_to_ip(flow.version, flow.laddr), flow.lport,
+                               int_to_ip(flow.version, flow.raddr), flow.rport)
+                # Il processo proprietario del socket si ricava dall'inode
+                pid = socket_index.lookup(flow.inode) if flow.inode else None
+                handle_blocked_flow(key, packets=0, pid=pid or None)
+
+            time.sleep(CONNECTION_POLL_INTERVAL)
         except Exception as e:
             print(f"Errore nel monitoraggio delle connessioni: {e}")
             time.sleep(5)  # Pausa più lunga in caso di errore
 
 
-def packet_callback(packet):
-    """Callback per l'analisi dei pacchetti con Scapy."""
+def is_local_ip(ip):
+    """Verifica se un IP appartiene alle reti locali, private o di loopback."""
+    return LOCAL_NETWORKS.contains(ip)
+
+
+def int_to_ip(version, value):
+    """Converte un indirizzo intero nella forma testuale."""
+    return str(ipaddress.IPv4Address(value) if version == 4 else ipaddress.IPv6Address(value))
+
+
+def handle_blocked_flow(key, packets=1, size=0, pid=None):
+    """Registra il traffico di un flusso bloccato e, solo al primo rilevamento, termina i processi.
+
+    Se il PID non è noto viene cercato tra i processi connessi all'IP remoto.
+    """
     global threats_detected
 
+    if not flow_table.observe(key, packets, size):
+        return  # Flusso già gestito: si aggiornano solo i contatori
+
+    remote_ip = key[3]
+    threats_detected += 1
+    print(f"Rilevato flusso da/verso IP bloccato: {remote_ip}:{key[4]} ({key[0]})")
+
+    # Trova i processi connessi all'IP tramite l'indice dei socket
+    action = "nessun processo"
+    try:
+        for candidate in ([pid] if pid else find_pids_for_remote(remote_ip)):
+            process = get_process_by_pid(candidate)
+            if process and kill_process(process):
+                action = "processo terminato"
+    except Exception as e:
+        print(f"Errore nel trovare il processo per l'IP {remote_ip}: {e}")
+        action = "errore"
+    flow_table.set_action(key, action)
+
+
+def packet_callback(packet):
+    """Callback per l'analisi dei pacchetti con Scapy."""
     if IP in packet:
         src_ip = packet[IP].src
         dst_ip = packet[IP].dst
 
-        # Ottieni l'IP locale
-        network_info = get_network_info()
-        if not network_info:
-            return
-
-        local_ip = network_info['ip_private']
+        # Ottieni gli IP locali (dalla cache, nessuna chiamata di sistema per pacchetto)
+        local_ips = get_network_info()['local_ips']
 
-        # Determina l'IP remoto (diverso dall'IP locale)
-        remote_ip = src_ip if src_ip != local_ip else dst_ip
+        # Determina l'IP remoto (diverso dagli IP locali)
+        outgoing = src_ip in local_ips
+        remote_ip = dst_ip if outgoing else src_ip
 
         # Salta gli IP locali o di loopback
-        if (remote_ip.startswith('127.') or
-                remote_ip.startswith('10.') or
-                remote_ip.startswith('172.16.') or
-                remote_ip.startswith('192.168.')):
+        if is_local_ip(remote_ip):
             return
 
         # Verifica se l'IP è bloccato
         if is_ip_blocked(remote_ip):
-            threats_detected += 1
-            print(f"Rilevato pacchetto da/verso IP bloccato: {remote_ip}")
-
-            # Usa ss o netstat per trovare il processo che usa questa connessione
-            if os.name == 'posix':  # Linux
-                # Usa ss per trovare il processo
-                try:
-                    cmd = f"ss -p | grep {remote_ip}"
-                    output = subprocess.check_output(cmd, shell=True, text=True)
-
-                    for line in output.splitlines():
-                        if "pid=" in line:
-                            pid_part = line.split("pid=")[1].split(",")[0]
-                            try:
-                                pid = int(pid_part)
-                                process = get_process_by_pid(pid)
-                                if process:
-                                    kill_process(process)
-                            except:
-                                continue
-                except:
-                    pass
-            else:  # Windows
-                # Usa netstat per trovare il processo
-                try:
-                    cmd = f"netstat -ano | findstr {remote_ip}"
-                    output = subprocess.check_output(cmd, shell=True, text=True)
-
-                    for line in output.splitlines():
-                        parts = line.split()
-                        if len(parts) >= 5:
-                            try:
-                                pid = int(parts[4])
-                                process = get_process_by_pid(pid)
-                                if process:
-                                    kill_process(process)
-                            except:
-                                continue
-                except:
-                    pass
+            sport = dport = 0
+            if TCP in packet or UDP in packet:
+                transport = packet[TCP] if TCP in packet else packet[UDP]
+                sport, dport = transport.sport, transport.dport
+
+            if outgoing:
+                key = flow_key(PROTOCOL_NAMES.get(packet[IP].proto, str(packet[IP].proto)),
+                               src_ip, sport, dst_ip, dport)
+            else:
+                key = flow_key(PROTOCOL_NAMES.get(packet[IP].proto, str(packet[IP].proto)),
+                               dst_ip, dport, src_ip, sport)
+            handle_blocked_flow(key, size=len(packet))
+
+
+_local_ip_ints = (None, frozenset())
+
+
+def get_local_ip_ints():
+    """Restituisce gli IP locali come coppie (versione, intero), ricalcolate solo se cambiano."""
+    global _local_ip_ints
+
+    local_ips = get_network_info()['local_ips']
+    if _local_ip_ints[0] is not local_ips:
+        _local_ip_ints = (local_ips, frozenset(filter(None, map(parse_ip, local_ips))))
+    return _local_ip_ints[1]
+
+
+def process_packet_batch(batch):
+    """Verifica a lotti gli header (versione, indirizzi, protocollo, porte, lunghezza) del motore AF_PACKET."""
+    local_ints = get_local_ip_ints()
+    remotes = {4: set(), 6: set()}
+    packets = []
+
+    for version, src, dst, proto, sport, dport, length in batch:
+        if (version, src) in local_ints:
+            packet = (version, proto, src, sport, dst, dport, length)
+        else:
+            packet = (version, proto, dst, dport, src, sport, length)
+        if not LOCAL_NETWORKS.contains_int(version, packet[4]):
+            remotes[version].add(packet[4])
+            packets.append(packet)
+
+    matcher = blocklist_matcher
+    blocked = {(version, value) for version, values in remotes.items()
+               for value in matcher.match_ints(version, values)}
+    if not blocked:
+        return
+
+    # Solo i pacchetti dei flussi bloccati vengono convertiti e registrati
+    for version, proto, local, local_port, remote, remote_port, length in packets:
+        if (version, remote) in blocked:
+            key = flow_key(PROTOCOL_NAMES.get(proto, str(proto)), int_to_ip(version, local), local_port,
+                           int_to_ip(version, remote), remote_port)
+            handle_blocked_flow(key, size=length)
+
+
+def select_sniffer_filter():
+    """Sceglie il filtro BPF per la lista corrente, ripiegando su filtri più larghi.
+
+    Con COARSE_FILTER tutti i pacchetti IP arrivano a Python, che li confronta con la lista.
+    """
+    candidates = (build_bpf_filter(blocked_networks), build_bpf_filter(blocked_networks, MAX_FILTER_TERMS // 4),
+                  COARSE_FILTER)
+    for candidate in dict.fromkeys(candidates):
+        try:
+            # Verifica che libpcap riesca a compilarlo entro i limiti del kernel
+            check_program(compile_filter(candidate))
+            if candidate == COARSE_FILTER and blocked_networks:
+                print("Filtro BPF per la lista non utilizzabile: controllo degli IP solo in Python")
+            return candidate
+        except Exception as e:
+            print(f"Impossibile compilare il filtro BPF ({len(candidate)} caratteri): {e}")
+    return None
+
+
+def update_sniffer_filter():
+    """Reinstalla lo sniffer se il filtro BPF per la lista corrente è cambiato."""
+    global sniffer, sniffer_filter
+
+    with sniffer_lock:
+        new_filter = select_sniffer_filter()
+        if (sniffer or raw_capture) and new_filter == sniffer_filter:
+            return
+
+        # Con il motore AF_PACKET il filtro viene sostituito direttamente sul socket
+        if raw_capture:
+            if raw_capture.set_filter(new_filter):
+                sniffer_filter = new_filter
+            return
+
+        if sniffer:
+            try:
+                sniffer.stop()
+            except Exception as e:
+                print(f"Errore nell'arresto dello sniffer: {e}")
+
+        sniffer = AsyncSniffer(prn=packet_callback, store=0, filter=new_filter)
+        sniffer.start()
+        sniffer_filter = new_filter
+        print(f"Sniffer avviato con filtro BPF di {len(new_filter or '')} caratteri.")
 
 
 def monitor_connections_with_scapy():
     """Monitora le connessioni di rete utilizzando Scapy."""
-    # Avvia lo sniffer di pacchetti in un thread separato
-    sniff_thread = threading.Thread(
-        target=lambda: sniff(prn=packet_callback, store=0),
-        daemon=True
-    )
-    sniff_thread.start()
+    # Lo sniffer gira in un thread separato e riceve solo i pacchetti che superano il filtro BPF
+    update_sniffer_filter()
+
+
+def monitor_connections_with_raw_socket():
+    """Monitora le connessioni di rete leggendo gli header da un socket AF_PACKET."""
+    global raw_capture
+
+    raw_capture = RawCapture(process_packet_batch, use_mmap=RAW_CAPTURE_MMAP)
+    update_sniffer_filter()
+
+    capture_thread = threading.Thread(target=raw_capture.run, daemon=True)
+    capture_thread.start()
 
 
 def send_report_to_box():
@@ -374,6 +588,9 @@ def send_report_to_box():
                 time.sleep(60)
                 continue
 
+            # Statistiche per flusso dall'ultimo report
+            flows, flows_marker = flow_table.report()
+
             # Prepara il report
             report = {
                 'name': CLIENT_NAME,
@@ -381,6 +598,7 @@ def send_report_to_box():
                 'MAC': network_info['mac_address'],
                 'minacce': threats_detected,
                 'ip_bloccati': ips_blocked,
+                'flussi': flows,
                 'timestamp': datetime.datetime.now().isoformat()
             }
 
@@ -397,6 +615,7 @@ def send_report_to_box():
                 # Reset dei contatori dopo l'invio del report
                 threats_detected = 0
                 ips_blocked = 0
+                flow_table.mark_reported(flows_marker)
             else:
                 print(f"Errore nell'invio del report: {response.status_code}")
         except Exception as e:
@@ -407,6 +626,9 @@ def send_report_to_box():
 
 
 if __name__ == '__main__':
+    # Avvia l'aggiornamento in background delle informazioni di rete
+    network_state.start()
+
     # Cerca il BOX nella rete
     if not discover_box():
         print("Impossibile trovare il BOX. Riproveremo più tardi.")
@@ -416,19 +638,28 @@ if __name__ == '__main__':
         try:
             with open("blocked_ips.json", 'r') as f:
                 data = json.load(f)
-                blocked_ips = data.get('ips', [])
+                set_blocked_networks(parse_blocked_ips(data.get('ips', [])), data.get('revision', 0))
+                blocked_ips_etag = data.get('etag')
+                blocked_ips_last_modified = data.get('last_modified')
         except:
-            blocked_ips = []
+            set_blocked_networks([])
 
     # Aggiorna la lista di IP bloccati
     get_blocked_ips()
 
-    # Avvia il thread per il monitoraggio delle connessioni
-    monitoring_thread = threading.Thread(target=monitor_connections_with_psutil, daemon=True)
+    # Avvia il thread per il monitoraggio delle connessioni (netlink solo su Linux)
+    if CONNECTION_MONITOR == "sockdiag" and hasattr(socket, 'AF_NETLINK'):
+        monitor_target = monitor_connections_with_sockdiag
+    else:
+        monitor_target = monitor_connections_with_psutil
+    monitoring_thread = threading.Thread(target=monitor_target, daemon=True)
     monitoring_thread.start()
 
-    # Avvia il monitoraggio con Scapy (opzionale, per una copertura più completa)
-    monitor_connections_with_scapy()
+    # Avvia la cattura dei pacchetti (opzionale, per una copertura più completa)
+    if CAPTURE_ENGINE == "raw":
+        monitor_connections_with_raw_socket()
+    else:
+        monitor_connections_with_scapy()
 
     # Avvia il thread per l'invio periodico dei report
     report_thread = threading.Thread(target=send_report_to_box, daemon=True)
@@ -0,0 +1,125 @@
+# Indice socket -> processo del CLIENT (solo Linux)
+# Mantiene una mappa inode del socket -> PID costruita da /proc/<pid>/fd e
+# aggiornata in modo incrementale: ad ogni refresh vengono letti (readlink)
+# solo i file descriptor nuovi. Una cache LRU ricorda i processi già risolti
+# per i flussi segnalati, così i pacchetti ripetuti non rifanno il lavoro.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MIN_REFRESH_INTERVAL = 0.2  # Intervallo minimo tra due scansioni di /proc in secondi
+FLOW_CACHE_SIZE = 1024
+
+
+class LRUCache:
+    """Cache LRU limitata, sicura tra thread."""
+
+    def __init__(self, max_size=FLOW_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._items.pop(key, None)
+
+
+class SocketInodeIndex:
+    """Mappa inode del socket -> PID mantenuta in modo incrementale."""
+
+    def __init__(self, proc_dir='/proc'):
+        self.proc_dir = proc_dir
+        self._fds = {}  # pid -> {fd: inode o None se non è un socket}
+        self._inodes = {}  # inode -> (pid, fd)
+        self._last_refresh = 0
+        self._lock = threading.Lock()
+
+    def _read_inode(self, pid, fd):
+        try:
+            target = os.readlink(f"{self.proc_dir}/{pid}/fd/{fd}")
+        except OSError:
+            return None
+        if target.startswith('socket:['):
+            return int(target[8:-1])
+        return None
+
+    def _drop_pid(self, pid):
+        for inode in self._fds.pop(pid, {}).values():
+            if inode is not None and self._inodes.get(inode, (None,))[0] == pid:
+                del self._inodes[inode]
+
+    def refresh(self, recheck_other_fds=False):
+        """Aggiorna l'indice leggendo solo i processi e i file descriptor nuovi.
+
+        Con recheck_other_fds vengono riletti anche i descriptor che non erano
+        socket, nel caso il loro numero sia stato riutilizzato per un socket.
+        """
+        with self._lock:
+            pids = {int(name) for name in os.listdir(self.proc_dir) if name.isdigit()}
+
+            for pid in set(self._fds) - pids:
+                self._drop_pid(pid)
+
+            for pid in pids:
+                try:
+                    fds = set(os.listdir(f"{self.proc_dir}/{pid}/fd"))
+                except OSError:
+                    self._drop_pid(pid)
+                    continue
+
+                known = self._fds.setdefault(pid, {})
+                if recheck_other_fds:
+                    for fd in [fd for fd, inode in known.items() if inode is None]:
+                        del known[fd]
+                for fd in set(known) - fds:
+                    inode = known.pop(fd)
+                    if inode is not None and self._inodes.get(inode) == (pid, fd):
+                        del self._inodes[inode]
+                for fd in fds - set(known):
+                    inode = self._read_inode(pid, fd)
+                    known[fd] = inode
+                    if inode is not None:
+                        self._inodes[inode] = (pid, fd)
+
+            self._last_refresh = time.monotonic()
+
+    def _verified(self, inode):
+        """Restituisce il PID se il file descriptor indicizzato punta ancora al socket."""
+        entry = self._inodes.get(inode)
+        if entry is None:
+            return None
+        pid, fd = entry
+        if self._read_inode(pid, fd) == inode:
+            return pid
+
+        # Il numero di fd è stato riutilizzato: il pid va riletto da capo
+        with self._lock:
+            self._drop_pid(pid)
+        return None
+
+    def lookup(self, inode):
+        """Restituisce il PID che possiede il socket, aggiornando l'indice se serve."""
+        pid = self._verified(inode)
+        if pid is None and time.monotonic() - self._last_refresh >= MIN_REFRESH_INTERVAL:
+            self.refresh()
+            pid = self._verified(inode)
+            if pid is None:
+                self.refresh(recheck_other_fds=True)
+                pid = self._verified(inode)
+        return pid
@@ -0,0 +1,155 @@
+# Benchmark degli indici delle tabelle del SERVER
+# Per ogni query della dashboard e della lista IP mostra il piano di esecuzione
+# (EXPLAIN) e il tempo medio prima e dopo gli indici delle migrazioni. Lo stato
+# "prima" viene simulato con IGNORE INDEX, senza modificare lo schema.
+# Le query confrontate sono quelle della dashboard precedenti alle tabelle di
+# aggregazione e all'inventario dei dispositivi, che leggono direttamente le
+# tabelle dei report; al termine vengono misurate anche le query che la
+# dashboard esegue oggi (DASHBOARD_QUERIES), sullo schema attuale.
+# Con --reports N inserisce prima N report sintetici per il BOX BENCHMARK
+# (rimossi al termine), così i piani riflettono tabelle popolate.
+#
+# Uso: python benchmark_indexes.py [--reports N] [--devices N] [--repetitions N]
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmark_ingest import BENCHMARK_BOX_CODE, build_report, cleanup
+from reportdb import DASHBOARD_QUERIES, connect_db, store_reports
+
+# Indici aggiunti dalle migrazioni, per tabella: lo stato "prima" li ignora tutti
+INDEXES = {
+    'box_reports': ['idx_box_reports_box_time'],
+    'detected_devices': ['idx_detected_devices_box_time'],
+    'client_reports': ['idx_client_reports_box_time', 'idx_client_reports_box_client',
+                       'idx_client_reports_box_time_id'],
+    'blocked_ips': ['uq_blocked_ips_ip_address', 'idx_blocked_ips_active']
+}
+
+# Query da misurare (dashboard prima delle tabelle di aggregazione): {tabella} viene
+# sostituito con la tabella e l'eventuale IGNORE INDEX
+QUERIES = {
+    'box_info': ("""
+        SELECT device_name, ip_private, ip_public, mac_address, latency, timestamp
+        FROM {box_reports} WHERE box_code = %s ORDER BY timestamp DESC LIMIT 1
+    """, 1),
+    'security_status': ("""
+        SELECT COUNT(DISTINCT id) as total_reports, SUM(threats_detected) as total_threats,
+               SUM(ips_blocked) as total_blocked
+        FROM {client_reports} WHERE box_code = %s
+    """, 1),
+    'connected_devices': ("""
+        SELECT device_name, ip_address, mac_address, timestamp
+        FROM {detected_devices} WHERE box_code = %s ORDER BY timestamp DESC LIMIT 50
+    """, 1),
+    'client_stats': ("""
+        SELECT client_name, ip_private, mac_address, SUM(threats_detected) as threats_detected,
+               SUM(ips_blocked) as ips_blocked, MAX(timestamp) as last_report
+        FROM {client_reports} WHERE box_code = %s
+        GROUP BY client_name, ip_private, mac_address ORDER BY MAX(timestamp) DESC
+    """, 1),
+    'threats_history': ("""
+        SELECT DATE(timestamp) as date, SUM(threats_detected) as threats_detected, SUM(ips_blocked) as ips_blocked
+        FROM {client_reports} WHERE box_code = %s AND timestamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)
+        GROUP BY DATE(timestamp) ORDER BY date DESC
+    """, 1),
+    'blocklist': ("""
+        SELECT ip_address FROM {blocked_ips} WHERE active = 1
+    """, 0)
+}
+
+
+def table_refs(with_indexes):
+    """Restituisce i riferimenti alle tabelle, con IGNORE INDEX per simulare lo schema senza indici."""
+    if with_indexes:
+        return {table: table for table in INDEXES}
+    return {table: f"{table} IGNORE INDEX ({', '.join(indexes)})" for table, indexes in INDEXES.items()}
+
+
+def populate(conn, reports, devices):
+    """Inserisce report sintetici distribuiti sugli ultimi 30 giorni."""
+    now = datetime.now()
+    data = build_report(devices)
+    batch = []
+    for i in range(reports):
+        batch.append((BENCHMARK_BOX_CODE, data, now - timedelta(minutes=30 * 24 * 60 * i // max(1, reports))))
+        if len(batch) == 100:
+            with conn.cursor() as cursor:
+                store_reports(cursor, batch)
+            conn.commit()
+            batch = []
+    if batch:
+        with conn.cursor() as cursor:
+            store_reports(cursor, batch)
+        conn.commit()
+
+
+def explain(conn, sql, params):
+    with conn.cursor() as cursor:
+        cursor.execute("EXPLAIN " + sql, params)
+        return cursor.fetchall()
+
+
+def measure(conn, sql, params, repetitions):
+    """Restituisce il tempo medio di esecuzione in millisecondi."""
+    total = 0.0
+    for _ in range(repetitions):
+        started = time.perf_counter()
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            cursor.fetchall()
+        total += time.perf_counter() - started
+    return total / repetitions * 1000
+
+
+def print_plan(rows):
+    for row in rows:
+        print(f"    {row.get('table')}: type={row.get('type')} key={row.get('key')} "
+              f"rows={row.get('rows')} extra={row.get('Extra')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN e tempi delle query prima e dopo gli indici")
+    parser.add_argument('--reports', type=int, default=0, help="Report sintetici da inserire")
+    parser.add_argument('--devices', type=int, default=100, help="Dispositivi per report sintetico")
+    parser.add_argument('--repetitions', type=int, default=5, help="Esecuzioni per query")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    if not conn:
+        print("Impossibile connettersi al database")
+        return 1
+
+    try:
+        if args.reports:
+            print(f"Inserimento di {args.reports} report sintetici...")
+            populate(conn, args.reports, args.devices)
+
+        for name, (sql, param_count) in QUERIES.items():
+            params = (BENCHMARK_BOX_CODE,) * param_count
+            print(f"\n== {name}")
+            timings = {}
+            for label, with_indexes in (('prima', False), ('dopo', True)):
+                query = sql.format(**table_refs(with_indexes))
+                print(f"  EXPLAIN {label}:")
+                print_plan(explain(conn, query, params))
+                timings[label] = measure(conn, query, params, args.repetitions)
+            print(f"  tempo medio: prima {timings['prima']:.2f} ms, dopo {timings['dopo']:.2f} ms")
+
+        print("\n== Query attuali della dashboard")
+        for name, sql, param_count in DASHBOARD_QUERIES:
+            params = (BENCHMARK_BOX_CODE,) * param_count
+            print(f"\n== {name}")
+            print_plan(explain(conn, sql, params))
+            print(f"  tempo medio: {measure(conn, sql, params, args.repetitions):.2f} ms")
+    finally:
+        if args.reports:
+            cleanup(conn)
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
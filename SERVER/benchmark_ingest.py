@@ -0,0 +1,126 @@
+# Benchmark dell'inserimento dei report del BOX
+# Misura il tempo di inserimento di un report al crescere del numero di
+# dispositivi (da 10 a 1000), confrontando gli INSERT riga per riga con gli
+# inserimenti multi-riga di store_report. Entrambi i lati svolgono lo stesso
+# lavoro: anche il riferimento riga per riga aggiorna l'inventario dei
+# dispositivi e le tabelle di aggregazione, con le stesse funzioni di
+# store_report, così la differenza misurata è solo quella degli INSERT grezzi.
+# Usa il database configurato in reportdb.py e rimuove le righe inserite al termine.
+#
+# Uso: python benchmark_ingest.py [ripetizioni]
+
+import sys
+import time
+from datetime import datetime
+
+from reportdb import (STORE_DEVICE_SIGHTINGS, connect_db, inventory_rows, report_rows, store_report,
+                      store_rollups, upsert_device_inventory)
+
+BENCHMARK_BOX_CODE = "BENCHMARK"
+DEVICE_COUNTS = (10, 50, 100, 250, 500, 1000)
+CLIENTS_PER_DEVICES = 10  # Un report client ogni 10 dispositivi
+
+
+def build_report(device_count):
+    """Costruisce un report sintetico con il numero di dispositivi indicato."""
+    return {
+        'box_code': BENCHMARK_BOX_CODE,
+        'box_data': {
+            'device_name': 'benchmark',
+            'ip_private': '192.168.1.1',
+            'ip_public': '203.0.113.1',
+            'mac_address': '00:11:22:33:44:55',
+            'latency': 10
+        },
+        'devices': [{
+            'name': f"device-{i}",
+            'ip': f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+            'mac': f"02:00:00:{i >> 16 & 255:02x}:{i >> 8 & 255:02x}:{i & 255:02x}"
+        } for i in range(device_count)],
+        'client_reports': [{
+            'name': f"client-{i}",
+            'ip_priv': f"10.0.0.{i % 256}",
+            'MAC': f"02:00:00:00:00:{i % 256:02x}",
+            'minacce': i,
+            'ip_bloccati': i
+        } for i in range(max(1, device_count // CLIENTS_PER_DEVICES))]
+    }
+
+
+def store_report_row_by_row(cursor, box_code, data, timestamp):
+    """Inserimento precedente: un INSERT (e un round-trip) per ogni dispositivo e client.
+
+    Inventario e aggregazioni vengono aggiornati come in store_reports.
+    """
+    box_rows, device_rows, client_rows = report_rows([(box_code, data, timestamp)])
+    for row in box_rows:
+        cursor.execute(
+            "INSERT INTO box_reports (box_code, device_name, ip_private, ip_public, mac_address, latency, timestamp) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            row
+        )
+    if device_rows:
+        if STORE_DEVICE_SIGHTINGS:
+            for row in device_rows:
+                cursor.execute(
+                    "INSERT INTO detected_devices (box_code, device_name, ip_address, mac_address, timestamp) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    row
+                )
+        upsert_device_inventory(cursor, inventory_rows(device_rows))
+    if client_rows:
+        for row in client_rows:
+            cursor.execute(
+                "INSERT INTO client_reports (box_code, client_name, ip_private, mac_address, threats_detected, "
+                "ips_blocked, timestamp) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                row
+            )
+        store_rollups(cursor, client_rows)
+
+
+def measure(conn, store, data, repetitions):
+    """Restituisce il tempo medio in millisecondi di inserimento e commit di un report."""
+    total = 0.0
+    for _ in range(repetitions):
+        started = time.perf_counter()
+        with conn.cursor() as cursor:
+            store(cursor, BENCHMARK_BOX_CODE, data, datetime.now())
+        conn.commit()
+        total += time.perf_counter() - started
+    return total / repetitions * 1000
+
+
+def cleanup(conn):
+    """Rimuove le righe inserite dal benchmark."""
+    with conn.cursor() as cursor:
+        for table in ('box_reports', 'detected_devices', 'client_reports', 'device_inventory',
+                      'client_stats_hourly', 'client_stats_daily', 'client_totals'):
+            cursor.execute(f"DELETE FROM {table} WHERE box_code = %s", (BENCHMARK_BOX_CODE,))
+    conn.commit()
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    conn = connect_db()
+    if not conn:
+        print("Impossibile connettersi al database")
+        return 1
+
+    try:
+        print("Entrambi i lati aggiornano anche inventario dei dispositivi e aggregazioni dei client; "
+              f"rilevamenti in detected_devices: {'sì' if STORE_DEVICE_SIGHTINGS else 'no'}")
+        print(f"{'Dispositivi':>12} {'Riga per riga (ms)':>20} {'Multi-riga (ms)':>17} {'Speedup':>9}")
+        for device_count in DEVICE_COUNTS:
+            data = build_report(device_count)
+            row_by_row = measure(conn, store_report_row_by_row, data, repetitions)
+            batched = measure(conn, store_report, data, repetitions)
+            print(f"{device_count:>12} {row_by_row:>20.2f} {batched:>17.2f} {row_by_row / batched:>8.1f}x")
+    finally:
+        cleanup(conn)
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
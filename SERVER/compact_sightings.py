@@ -0,0 +1,98 @@
+# Compattazione dei rilevamenti dei dispositivi del SERVER
+# Il BOX invia l'elenco dei dispositivi a ogni scansione (ogni 10 minuti) e
+# detected_devices ne conserva ogni rilevamento. Lo stato corrente di ogni
+# dispositivo è nell'inventario (device_inventory): per i giorni più vecchi di
+# DEVICE_SIGHTINGS_COMPACT_AFTER resta in detected_devices solo l'ultimo
+# rilevamento di ogni dispositivo per giorno.
+# La compattazione procede un giorno alla volta, con una transazione per giorno,
+# e può essere interrotta e rieseguita (ad esempio ogni notte da cron).
+#
+# Uso: python compact_sightings.py [--days N] [--box CODICE]
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from reportdb import DEVICE_SIGHTINGS_COMPACT_AFTER, connect_db
+
+# Stessa chiave di device_key() in reportdb.py
+DEVICE_KEY_SQL = "LOWER(COALESCE(NULLIF(mac_address, ''), NULLIF(ip_address, ''), COALESCE(device_name, '')))"
+
+
+def day_condition(day, box_code, alias=''):
+    """Condizione sui rilevamenti del giorno (e del BOX) indicato."""
+    start = datetime.combine(day, datetime.min.time())
+    condition = f"{alias}timestamp >= %s AND {alias}timestamp < %s"
+    params = [start, start + timedelta(days=1)]
+    if box_code:
+        condition += f" AND {alias}box_code = %s"
+        params.append(box_code)
+    return condition, params
+
+
+def compact_day(conn, day, box_code=None):
+    """Lascia un solo rilevamento (l'ultimo) per dispositivo nel giorno indicato.
+
+    Restituisce il numero di righe eliminate.
+    """
+    condition, params = day_condition(day, box_code)
+    delete_condition, _ = day_condition(day, box_code, 'd.')
+
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS sightings_keep")
+        cursor.execute(
+            "CREATE TEMPORARY TABLE sightings_keep (id INT PRIMARY KEY) "
+            f"SELECT MAX(id) AS id FROM detected_devices WHERE {condition} GROUP BY box_code, {DEVICE_KEY_SQL}",
+            params
+        )
+        deleted = cursor.execute(
+            "DELETE d FROM detected_devices d LEFT JOIN sightings_keep k ON d.id = k.id "
+            f"WHERE {delete_condition} AND k.id IS NULL",
+            params
+        )
+        cursor.execute("DROP TEMPORARY TABLE sightings_keep")
+    conn.commit()
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compatta i rilevamenti più vecchi di detected_devices")
+    parser.add_argument('--days', type=int, default=DEVICE_SIGHTINGS_COMPACT_AFTER,
+                        help="Compatta i giorni più vecchi di questo numero di giorni")
+    parser.add_argument('--box', help="Compatta solo i rilevamenti di questo BOX")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    if not conn:
+        print("Impossibile connettersi al database")
+        return 1
+
+    cutoff = datetime.now().date() - timedelta(days=args.days)
+    condition, params = "timestamp < %s", [datetime.combine(cutoff, datetime.min.time())]
+    if args.box:
+        condition += " AND box_code = %s"
+        params.append(args.box)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT MIN(timestamp) AS oldest FROM detected_devices WHERE {condition}", params)
+            oldest = cursor.fetchone()['oldest']
+        if oldest is None:
+            print("Nessun rilevamento da compattare")
+            return 0
+
+        total = 0
+        day = oldest.date()
+        while day < cutoff:
+            deleted = compact_day(conn, day, args.box)
+            if deleted:
+                print(f"{day.isoformat()}: {deleted} rilevamenti eliminati")
+            total += deleted
+            day += timedelta(days=1)
+        print(f"Compattazione completata: {total} rilevamenti eliminati")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# Pool di connessioni MySQL del SERVER
+# Le connessioni vengono aperte una volta e riutilizzate tra le richieste, così
+# la latenza non è dominata dall'handshake TCP e dall'autenticazione:
+# 1. Dimensione minima (aperta all'avvio) e massima (limite alle connessioni aperte)
+# 2. Verifica con ping delle connessioni rimaste inattive prima di consegnarle
+# 3. Durata massima di una connessione, oltre la quale viene chiusa e riaperta
+# 4. Attesa limitata quando tutte le connessioni sono in uso
+# 5. Metriche di utilizzo del pool
+
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Nessuna connessione disponibile entro il tempo di attesa."""
+
+
+class PooledConnection:
+    """Connessione presa dal pool: close() la restituisce al pool invece di chiuderla."""
+
+    def __init__(self, pool, conn, created_at):
+        self._pool = pool
+        self._conn = conn
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._conn is None:
+            raise RuntimeError("Connessione già restituita al pool")
+        return getattr(self._conn, name)
+
+    def close(self):
+        """Restituisce la connessione al pool (una sola volta)."""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(conn, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # Una connessione dimenticata aperta torna comunque al pool
+        if getattr(self, '_conn', None) is not None:
+            self.close()
+
+
+class ConnectionPool:
+    """Pool di connessioni thread-safe con verifica, durata massima e attesa limitata."""
+
+    def __init__(self, connect, min_size=2, max_size=20, max_lifetime=3600, wait_timeout=5,
+                 health_check_after=5):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.wait_timeout = wait_timeout
+        self.health_check_after = health_check_after  # Secondi di inattività dopo i quali si esegue il ping
+        self._idle = deque()  # (connessione, creata alle, ultimo utilizzo)
+        self._size = 0  # Connessioni aperte, inattive o in uso
+        self._cond = threading.Condition(threading.RLock())
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'connect_errors': 0
+        }
+
+    def fill(self):
+        """Apre le connessioni fino alla dimensione minima."""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            conn, created_at = self._open()
+            self._release(conn, created_at)
+
+    def acquire(self):
+        """Restituisce una connessione libera, aprendone una nuova se il pool non è pieno.
+
+        Solleva PoolTimeout se nessuna connessione si libera entro wait_timeout secondi.
+        """
+        started = time.monotonic()
+        deadline = started + self.wait_timeout
+        with self._cond:
+            self._stats['checkouts'] += 1
+
+        while True:
+            entry = None
+            with self._cond:
+                waited = False
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"Nessuna connessione libera entro {self.wait_timeout} secondi")
+                    waited = True
+                    self._cond.wait(remaining)
+                if waited:
+                    self._stats['waits'] += 1
+                    self._stats['wait_time'] += time.monotonic() - started
+
+                if self._idle:
+                    # LIFO: si riusano le connessioni usate più di recente
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1
+
+            # Apertura e ping avvengono fuori dal lock
+            if entry is None:
+                conn, created_at = self._open()
+                return PooledConnection(self, conn, created_at)
+
+            conn, created_at, last_used = entry
+            if self._usable(conn, created_at, last_used):
+                return PooledConnection(self, conn, created_at)
+            self._discard(conn)
+
+    def _open(self):
+        """Apre una connessione per uno slot già riservato in _size."""
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._stats['connect_errors'] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+        return conn, time.monotonic()
+
+    def _usable(self, conn, created_at, last_used):
+        now = time.monotonic()
+        if now - created_at > self.max_lifetime:
+            return False
+        if now - last_used >= self.health_check_after:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                return False
+        return True
+
+    def _release(self, conn, created_at):
+        # Annulla la transazione lasciata aperta, così la connessione riparte pulita
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+
+        if time.monotonic() - created_at > self.max_lifetime:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats['closed'] += 1
+            self._cond.notify()
+
+    def stats(self):
+        """Restituisce le metriche di utilizzo del pool."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'avg_wait_time': stats['wait_time'] / stats['waits'] if stats['waits'] else 0.0
+            })
+        return stats
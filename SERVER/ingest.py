@@ -0,0 +1,223 @@
+# Coda di ingestione dei report del SERVER
+# L'API accoda il report e risponde subito; la scrittura su MySQL avviene in
+# background (write-behind):
+# 1. Ogni report viene prima salvato in una directory di spool su disco, così
+#    non va perso se il SERVER si ferma prima di averlo scritto nel database
+# 2. Una coda limitata in memoria passa i report ai thread di scrittura, che li
+#    raggruppano in lotti scritti con una sola transazione
+# 3. I report che non entrano nella coda restano nello spool e vengono
+#    ricaricati quando si libera spazio; se lo spool supera la soglia massima
+#    i nuovi report vengono rifiutati (backpressure)
+# 4. Ogni report riceve come campo id il nome del suo file di spool: un lotto
+#    può essere riscritto (arresto tra il commit e la rimozione dei file) e
+#    write_batch usa l'id per non inserirlo due volte
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+SPOOL_SUFFIX = '.json'
+
+
+class IngestQueue:
+    """Coda limitata con spool su disco e thread di scrittura a lotti."""
+
+    def __init__(self, write_batch, spool_dir, max_queue=1000, max_spool=10000, workers=4,
+                 batch_size=50, batch_wait=0.5, max_attempts=5, retry_delay=5, fsync=True,
+                 is_outage=None):
+        self.write_batch = write_batch  # Funzione che scrive una lista di report nel database
+        # Funzione che riconosce gli errori di database non disponibile: il lotto viene
+        # riprovato senza consumare tentativi
+        self.is_outage = is_outage or (lambda e: isinstance(e, ConnectionError))
+        self.spool_dir = spool_dir
+        self.failed_dir = os.path.join(spool_dir, 'failed')
+        self.max_spool = max_spool
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.fsync = fsync
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = set()  # File dello spool già in coda o in scrittura
+        self._attempts = {}
+        self._spooled = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._started = False
+        self._stats = {'accepted': 0, 'rejected': 0, 'written': 0, 'failed': 0, 'batches': 0, 'retries': 0}
+
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+    def start(self):
+        """Avvia i thread di scrittura e ricarica i report rimasti nello spool (una sola volta)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._spooled = len(self._spool_files())
+
+        for _ in range(self.workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def _spool_files(self):
+        return sorted(name for name in os.listdir(self.spool_dir) if name.endswith(SPOOL_SUFFIX))
+
+    def submit(self, record):
+        """Salva il report nello spool e lo accoda. Restituisce False se lo spool è pieno.
+
+        Al report viene aggiunto il campo id, unico per ogni report accettato.
+        """
+        self.start()
+
+        with self._lock:
+            if self._spooled >= self.max_spool:
+                self._stats['rejected'] += 1
+                return False
+            self._spooled += 1
+            self._stats['accepted'] += 1
+            name = f"{time.time_ns():020d}-{next(self._seq):06d}{SPOOL_SUFFIX}"
+
+        path = os.path.join(self.spool_dir, name)
+        record['id'] = name[:-len(SPOOL_SUFFIX)]
+        try:
+            # Scrittura atomica: il file compare nello spool solo quando è completo
+            with open(path + '.tmp', 'w') as f:
+                json.dump(record, f)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+        except OSError:
+            with self._lock:
+                self._spooled -= 1
+                self._stats['accepted'] -= 1
+            raise
+
+        self._enqueue(path, record)
+        return True
+
+    def _enqueue(self, path, record):
+        with self._lock:
+            if path in self._pending:
+                return True
+            try:
+                self._queue.put_nowait((path, record))
+            except queue.Full:
+                # Resta nello spool: verrà ricaricato quando la coda si libera
+                return False
+            self._pending.add(path)
+            return True
+
+    def _refill(self):
+        """Ricarica periodicamente nella coda i report dello spool non ancora accodati."""
+        while True:
+            try:
+                for name in self._spool_files():
+                    path = os.path.join(self.spool_dir, name)
+                    if path in self._pending:
+                        continue
+                    try:
+                        with open(path) as f:
+                            record = json.load(f)
+                    except FileNotFoundError:
+                        # Già scritto e rimosso da un thread di scrittura dopo l'elenco della directory
+                        continue
+                    except (OSError, ValueError) as e:
+                        print(f"Report illeggibile nello spool {name}: {e}")
+                        self._move_to_failed(path)
+                        continue
+                    if not self._enqueue(path, record):
+                        break
+            except Exception as e:
+                print(f"Errore nella lettura dello spool: {e}")
+            time.sleep(self.retry_delay)
+
+    def _worker(self):
+        while True:
+            # Raggruppa i report arrivati entro batch_wait secondi in un solo lotto
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch):
+        try:
+            self.write_batch([record for _, record in batch])
+        except Exception as e:
+            if self.is_outage(e):
+                # Database non raggiungibile: i report restano nello spool e verranno riprovati
+                print(f"Database non disponibile, {len(batch)} report restano nello spool: {e}")
+                self._retry(batch)
+                return
+            if len(batch) > 1:
+                # Un report non valido non deve bloccare gli altri del lotto
+                for item in batch:
+                    self._process([item])
+                return
+            path = batch[0][0]
+            attempts = self._attempts.get(path, 0) + 1
+            print(f"Errore nella scrittura del report {os.path.basename(path)} (tentativo {attempts}): {e}")
+            if attempts >= self.max_attempts:
+                self._move_to_failed(path)
+            else:
+                self._attempts[path] = attempts
+                self._retry(batch)
+            return
+
+        for path, _ in batch:
+            self._remove(path)
+        with self._lock:
+            self._stats['written'] += len(batch)
+            self._stats['batches'] += 1
+
+    def _retry(self, batch):
+        with self._lock:
+            for path, _ in batch:
+                self._pending.discard(path)
+            self._stats['retries'] += len(batch)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        with self._lock:
+            self._pending.discard(path)
+            self._attempts.pop(path, None)
+            self._spooled -= 1
+
+    def _move_to_failed(self, path):
+        try:
+            os.replace(path, os.path.join(self.failed_dir, os.path.basename(path)))
+        except OSError as e:
+            # File non più nello spool (già rimosso) o non spostabile: non viene contato
+            if not isinstance(e, FileNotFoundError):
+                print(f"Impossibile spostare {os.path.basename(path)} in failed: {e}")
+            with self._lock:
+                self._pending.discard(path)
+                self._attempts.pop(path, None)
+            return
+        with self._lock:
+            self._pending.discard(path)
+            self._attempts.pop(path, None)
+            self._spooled -= 1
+            self._stats['failed'] += 1
+
+    def stats(self):
+        """Restituisce le metriche della coda di ingestione."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'queued': self._queue.qsize(), 'spooled': self._spooled, 'max_spool': self.max_spool})
+        return stats
@@ -0,0 +1,189 @@
+# Aggiornamenti in tempo reale della dashboard del SERVER
+# I browser aprono un canale Server-Sent Events per box_code invece di
+# richiedere periodicamente tutti i dati della dashboard:
+# 1. Quando nuovi report di un BOX vengono scritti nel database, notify() segna
+#    il BOX come modificato
+# 2. Un thread ricalcola i dati dei BOX modificati che hanno almeno un browser
+#    collegato (una volta per BOX, qualunque sia il numero di browser) e li
+#    confronta con gli ultimi inviati
+# 3. Ai browser vengono inviate solo le sezioni cambiate; senza browser
+#    collegati o senza nuovi report non viene eseguita nessuna query
+
+import collections
+import json
+import threading
+import time
+
+RETRY_MS = 3000  # Attesa suggerita al browser prima di ricollegarsi
+
+
+def format_event(event, data):
+    """Formatta un evento Server-Sent Events con dati JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscriber:
+    """Coda degli eventi di un browser collegato.
+
+    Se il browser non legge abbastanza in fretta la coda viene chiusa: al
+    ricollegamento riceve di nuovo tutti i dati.
+    """
+
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self.closed = False
+        self._events = collections.deque()
+        self._cond = threading.Condition()
+
+    def put(self, event):
+        """Accoda un evento. Restituisce False se la coda era piena ed è stata chiusa."""
+        with self._cond:
+            if len(self._events) >= self.max_pending:
+                self.closed = True
+            else:
+                self._events.append(event)
+            self._cond.notify()
+            return not self.closed
+
+    def get(self, timeout):
+        """Restituisce il prossimo evento, o None se non arriva niente entro timeout secondi."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._events or self.closed, timeout)
+            if self._events and not self.closed:
+                return self._events.popleft()
+            return None
+
+
+class LiveFeed:
+    """Canali Server-Sent Events per box_code con invio delle sole sezioni cambiate."""
+
+    def __init__(self, load, max_subscribers=200, max_pending=50, keepalive=15, min_interval=0.5):
+        self.load = load  # Funzione box_code -> dati della dashboard (dizionario di sezioni)
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self.keepalive = keepalive
+        self.min_interval = min_interval
+        self._cond = threading.Condition()
+        self._subscribers = {}  # box_code -> browser collegati
+        self._snapshots = {}  # box_code -> ultimi dati inviati
+        self._dirty = set()
+        self._started = False
+        self._stats = {'events': 0, 'loads': 0, 'dropped': 0}
+
+    def start(self):
+        """Avvia il thread che invia gli aggiornamenti (una sola volta)."""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _count(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def subscribe(self, box_code):
+        """Registra un browser per il BOX. Restituisce None se è già collegato il numero massimo.
+
+        Il controllo e la registrazione avvengono insieme: le richieste concorrenti non
+        possono superare max_subscribers.
+        """
+        with self._cond:
+            if self._count() >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(self.max_pending)
+            self._subscribers.setdefault(box_code, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, box_code, subscriber):
+        """Rimuove un browser (più chiamate per lo stesso browser non hanno effetto)."""
+        with self._cond:
+            subscribers = self._subscribers.get(box_code)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[box_code]
+                self._snapshots.pop(box_code, None)
+
+    def notify(self, box_code):
+        """Segnala nuovi dati per il BOX; ignorato se nessun browser lo sta guardando."""
+        with self._cond:
+            if box_code in self._subscribers:
+                self._dirty.add(box_code)
+                self._cond.notify()
+
+    def stream(self, box_code, subscriber):
+        """Generatore degli eventi di un browser registrato con subscribe(): prima tutti i
+        dati, poi le sezioni cambiate."""
+        self.start()
+        # Il browser è registrato prima di leggere i dati, così nessun aggiornamento va perso
+        try:
+            with self._cond:
+                data = self._snapshots.get(box_code)
+            if data is None:
+                data = self._load(box_code)
+                if 'error' not in data:
+                    with self._cond:
+                        self._snapshots.setdefault(box_code, data)
+            yield f"retry: {RETRY_MS}\n" + format_event('sections', data)
+
+            while not subscriber.closed:
+                event = subscriber.get(self.keepalive)
+                # Il commento periodico mantiene aperta la connessione e rileva i browser chiusi
+                yield event if event is not None else ": keepalive\n\n"
+        finally:
+            self.unsubscribe(box_code, subscriber)
+
+    def _load(self, box_code):
+        with self._cond:
+            self._stats['loads'] += 1
+        return self.load(box_code)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty)
+                dirty, self._dirty = self._dirty, set()
+            for box_code in dirty:
+                try:
+                    self._publish(box_code)
+                except Exception as e:
+                    print(f"Errore nell'invio degli aggiornamenti del BOX {box_code}: {e}")
+            # Le notifiche che arrivano nel frattempo vengono raggruppate in un solo invio
+            time.sleep(self.min_interval)
+
+    def _publish(self, box_code):
+        """Invia ai browser del BOX le sezioni cambiate rispetto all'ultimo invio."""
+        data = self._load(box_code)
+        if 'error' in data:
+            return
+
+        with self._cond:
+            subscribers = self._subscribers.get(box_code)
+            if not subscribers:
+                return
+            previous = self._snapshots.get(box_code, {})
+            changes = {section: value for section, value in data.items()
+                       if section != 'timestamp' and previous.get(section) != value}
+            self._snapshots[box_code] = data
+            if not changes:
+                return
+            changes['timestamp'] = data.get('timestamp')
+            event = format_event('sections', changes)
+            for subscriber in list(subscribers):
+                self._stats['events'] += 1
+                if not subscriber.put(event):
+                    # Browser troppo lento: non riceve altri eventi, il suo stream si chiude
+                    subscribers.discard(subscriber)
+                    self._stats['dropped'] += 1
+            if not subscribers:
+                del self._subscribers[box_code]
+                self._snapshots.pop(box_code, None)
+
+    def stats(self):
+        """Restituisce le metriche dei canali in tempo reale."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({'subscribers': self._count(), 'boxes': len(self._subscribers),
+                          'max_subscribers': self.max_subscribers})
+        return stats
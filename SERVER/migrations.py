@@ -0,0 +1,197 @@
+# Migrazioni dello schema del database del SERVER
+# init_db crea le tabelle con CREATE TABLE IF NOT EXISTS; le modifiche
+# successive (indici, vincoli, nuove colonne) sono migrazioni numerate,
+# applicate una sola volta e registrate nella tabella schema_migrations.
+# Per modificare lo schema si aggiunge una migrazione in fondo a MIGRATIONS,
+# senza mai cambiare quelle già rilasciate. Un passo può essere un'istruzione
+# SQL o una funzione che riceve il cursore, per le modifiche che dipendono dai
+# dati presenti.
+# Le istruzioni DDL confermano implicitamente la transazione: una migrazione
+# interrotta a metà viene rieseguita dall'inizio. Ogni passo deve quindi poter
+# essere rieseguito: gli indici vengono aggiunti solo se mancano (add_index),
+# le tabelle con IF NOT EXISTS e i dati iniziali con upsert che li ricalcolano.
+
+from partitions import partition_report_tables
+
+
+def index_exists(cursor, table, name):
+    cursor.execute(
+        "SELECT COUNT(*) AS count FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (table, name)
+    )
+    return cursor.fetchone()['count'] > 0
+
+
+def add_index(table, name, columns, unique=False):
+    """Passo di migrazione che aggiunge l'indice solo se la tabella non lo ha già."""
+    def step(cursor):
+        if index_exists(cursor, table, name):
+            print(f"Indice {name} già presente su {table}")
+            return
+        cursor.execute(f"ALTER TABLE {table} ADD {'UNIQUE KEY' if unique else 'INDEX'} {name} ({columns})")
+    return step
+
+
+MIGRATIONS = [
+    (1, "Indici (box_code, timestamp) sulle tabelle dei report", [
+        add_index('box_reports', 'idx_box_reports_box_time', 'box_code, timestamp'),
+        add_index('detected_devices', 'idx_detected_devices_box_time', 'box_code, timestamp'),
+        # Copre totali e storico delle minacce: nessun accesso alle righe della tabella
+        add_index('client_reports', 'idx_client_reports_box_time',
+                  'box_code, timestamp, threats_detected, ips_blocked')
+    ]),
+    (2, "Indice di copertura per le statistiche dei client", [
+        # Copre il GROUP BY per client con somme e ultimo report
+        add_index('client_reports', 'idx_client_reports_box_client',
+                  'box_code, client_name, ip_private, mac_address, timestamp, threats_detected, ips_blocked')
+    ]),
+    (3, "Chiave unica su blocked_ips.ip_address e indice sugli IP attivi", [
+        # Per ogni IP duplicato resta la riga più vecchia, attiva se almeno una lo era;
+        # rieseguiti senza duplicati, questi passi non modificano niente
+        "DROP TEMPORARY TABLE IF EXISTS blocked_ips_keep",
+        "CREATE TEMPORARY TABLE blocked_ips_keep AS "
+        "SELECT ip_address, MIN(id) AS id, MAX(active) AS active "
+        "FROM blocked_ips GROUP BY ip_address HAVING COUNT(*) > 1",
+        "UPDATE blocked_ips b JOIN blocked_ips_keep k ON b.id = k.id SET b.active = k.active",
+        "DELETE b FROM blocked_ips b JOIN blocked_ips_keep k ON b.ip_address = k.ip_address AND b.id <> k.id",
+        # I trigger hanno registrato la rimozione dei duplicati attivi: l'IP resta bloccato
+        "INSERT INTO blocklist_changes (ip_address, action) "
+        "SELECT ip_address, 'add' FROM blocked_ips_keep WHERE active",
+        "DROP TEMPORARY TABLE blocked_ips_keep",
+        add_index('blocked_ips', 'uq_blocked_ips_ip_address', 'ip_address', unique=True),
+        add_index('blocked_ips', 'idx_blocked_ips_active', 'active, ip_address'),
+        add_index('blocklist_changes', 'idx_blocklist_changes_changed_at', 'changed_at')
+    ]),
+    (4, "Tabelle di aggregazione dei report dei client", [
+        """CREATE TABLE IF NOT EXISTS client_stats_hourly (
+            box_code VARCHAR(50) NOT NULL,
+            hour DATETIME NOT NULL,
+            reports INT NOT NULL DEFAULT 0,
+            threats_detected BIGINT NOT NULL DEFAULT 0,
+            ips_blocked BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (box_code, hour)
+        )""",
+        """CREATE TABLE IF NOT EXISTS client_stats_daily (
+            box_code VARCHAR(50) NOT NULL,
+            day DATE NOT NULL,
+            reports INT NOT NULL DEFAULT 0,
+            threats_detected BIGINT NOT NULL DEFAULT 0,
+            ips_blocked BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (box_code, day)
+        )""",
+        """CREATE TABLE IF NOT EXISTS client_totals (
+            box_code VARCHAR(50) NOT NULL,
+            client_name VARCHAR(100) NOT NULL DEFAULT '',
+            ip_private VARCHAR(45) NOT NULL DEFAULT '',
+            mac_address VARCHAR(17) NOT NULL DEFAULT '',
+            reports INT NOT NULL DEFAULT 0,
+            threats_detected BIGINT NOT NULL DEFAULT 0,
+            ips_blocked BIGINT NOT NULL DEFAULT 0,
+            first_report DATETIME,
+            last_report DATETIME,
+            PRIMARY KEY (box_code, client_name, ip_private, mac_address),
+            INDEX idx_client_totals_box_last (box_code, last_report)
+        )""",
+        # Le tabelle partono dai report già presenti; le righe esistenti vengono
+        # sostituite dai valori ricalcolati, non sommate
+        "INSERT INTO client_stats_hourly (box_code, hour, reports, threats_detected, ips_blocked) "
+        "SELECT box_code, DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00'), COUNT(*), "
+        "COALESCE(SUM(threats_detected), 0), COALESCE(SUM(ips_blocked), 0) "
+        "FROM client_reports WHERE timestamp IS NOT NULL "
+        "GROUP BY box_code, DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00') "
+        "ON DUPLICATE KEY UPDATE reports = VALUES(reports), "
+        "threats_detected = VALUES(threats_detected), ips_blocked = VALUES(ips_blocked)",
+        "INSERT INTO client_stats_daily (box_code, day, reports, threats_detected, ips_blocked) "
+        "SELECT box_code, DATE(timestamp), COUNT(*), COALESCE(SUM(threats_detected), 0), COALESCE(SUM(ips_blocked), 0) "
+        "FROM client_reports WHERE timestamp IS NOT NULL GROUP BY box_code, DATE(timestamp) "
+        "ON DUPLICATE KEY UPDATE reports = VALUES(reports), "
+        "threats_detected = VALUES(threats_detected), ips_blocked = VALUES(ips_blocked)",
+        "INSERT INTO client_totals (box_code, client_name, ip_private, mac_address, reports, "
+        "threats_detected, ips_blocked, first_report, last_report) "
+        "SELECT box_code, COALESCE(client_name, ''), COALESCE(ip_private, ''), COALESCE(mac_address, ''), COUNT(*), "
+        "COALESCE(SUM(threats_detected), 0), COALESCE(SUM(ips_blocked), 0), MIN(timestamp), MAX(timestamp) "
+        "FROM client_reports "
+        "GROUP BY box_code, COALESCE(client_name, ''), COALESCE(ip_private, ''), COALESCE(mac_address, '') "
+        "ON DUPLICATE KEY UPDATE reports = VALUES(reports), threats_detected = VALUES(threats_detected), "
+        "ips_blocked = VALUES(ips_blocked), first_report = VALUES(first_report), last_report = VALUES(last_report)"
+    ]),
+    (5, "Indice (box_code, timestamp, id) per la paginazione dei report dei client", [
+        # Le pagine sono ordinate per (timestamp, id). In detected_devices basta l'indice
+        # (box_code, timestamp), a cui InnoDB aggiunge la chiave primaria; in client_reports
+        # l'indice esistente ha threats_detected e ips_blocked tra timestamp e id.
+        add_index('client_reports', 'idx_client_reports_box_time_id', 'box_code, timestamp, id')
+    ]),
+    (6, "Inventario dei dispositivi rilevati", [
+        # Una riga per dispositivo di ogni BOX, identificato dal MAC (o dall'IP, o dal nome)
+        """CREATE TABLE IF NOT EXISTS device_inventory (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            box_code VARCHAR(50) NOT NULL,
+            device_key VARCHAR(100) NOT NULL,
+            device_name VARCHAR(100),
+            ip_address VARCHAR(45),
+            mac_address VARCHAR(17),
+            first_seen DATETIME NOT NULL,
+            last_seen DATETIME NOT NULL,
+            seen_count INT NOT NULL DEFAULT 0,
+            UNIQUE KEY uq_device_inventory_box_device (box_code, device_key),
+            INDEX idx_device_inventory_box_last_seen (box_code, last_seen),
+            INDEX idx_device_inventory_box_first_seen (box_code, first_seen)
+        )""",
+        # L'inventario parte dai rilevamenti già presenti; nome e indirizzi dall'ultimo rilevamento.
+        # Le righe esistenti vengono sostituite dai valori ricalcolati
+        "INSERT INTO device_inventory (box_code, device_key, device_name, ip_address, mac_address, "
+        "first_seen, last_seen, seen_count) "
+        "SELECT box_code, LOWER(COALESCE(NULLIF(mac_address, ''), NULLIF(ip_address, ''), COALESCE(device_name, ''))), "
+        "SUBSTRING_INDEX(GROUP_CONCAT(COALESCE(device_name, '') ORDER BY timestamp DESC SEPARATOR '\\n'), '\\n', 1), "
+        "SUBSTRING_INDEX(GROUP_CONCAT(COALESCE(ip_address, '') ORDER BY timestamp DESC SEPARATOR '\\n'), '\\n', 1), "
+        "SUBSTRING_INDEX(GROUP_CONCAT(COALESCE(mac_address, '') ORDER BY timestamp DESC SEPARATOR '\\n'), '\\n', 1), "
+        "MIN(timestamp), MAX(timestamp), COUNT(*) "
+        "FROM detected_devices WHERE timestamp IS NOT NULL "
+        "GROUP BY box_code, LOWER(COALESCE(NULLIF(mac_address, ''), NULLIF(ip_address, ''), COALESCE(device_name, ''))) "
+        "ON DUPLICATE KEY UPDATE device_name = VALUES(device_name), ip_address = VALUES(ip_address), "
+        "mac_address = VALUES(mac_address), first_seen = VALUES(first_seen), last_seen = VALUES(last_seen), "
+        "seen_count = VALUES(seen_count)"
+    ]),
+    (7, "Partizionamento per data delle tabelle dei report", [
+        # Le partizioni dipendono dalle date già presenti: vedi partitions.py
+        partition_report_tables
+    ])
+]
+
+
+def apply_migrations(conn):
+    """Applica in ordine le migrazioni non ancora registrate in schema_migrations.
+
+    Le istruzioni DDL di MySQL confermano implicitamente la transazione: ogni
+    migrazione viene registrata subito dopo essere stata completata e, se
+    interrotta, viene rieseguita per intero alla prossima chiamata.
+    Restituisce il numero di migrazioni applicate.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row['version'] for row in cursor.fetchall()}
+
+    count = 0
+    for version, name, statements in MIGRATIONS:
+        if version in applied:
+            continue
+
+        print(f"Applicazione della migrazione {version}: {name}")
+        with conn.cursor() as cursor:
+            for statement in statements:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        conn.commit()
+        count += 1
+    return count
@@ -0,0 +1,78 @@
+# Paginazione a cursore (keyset) delle API di consultazione dello storico
+# Le pagine non usano OFFSET: il cursore contiene la chiave di ordinamento
+# (timestamp, id) dell'ultima riga restituita e la pagina successiva riparte
+# da lì con una condizione sull'indice, con un costo che non dipende da
+# quanto indietro si sta sfogliando.
+# Le righe vengono lette dal database con un cursore non bufferizzato e
+# scritte nella risposta JSON man mano che arrivano.
+
+import base64
+import json
+from datetime import date, datetime
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(*key):
+    """Codifica la chiave dell'ultima riga di una pagina in un cursore opaco per l'URL."""
+    raw = json.dumps(key, default=_json_default, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(value, size):
+    """Decodifica un cursore in una chiave di size valori, il primo dei quali è un timestamp.
+
+    Restituisce None se il cursore è assente; solleva ValueError se non è valido.
+    """
+    if not value:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Cursore non valido")
+    if not isinstance(key, list) or len(key) != size:
+        raise ValueError("Cursore non valido")
+    key[0] = parse_time(key[0])
+    return key
+
+
+def parse_time(value):
+    """Converte un parametro ISO 8601 in datetime; None se assente, ValueError se non valido."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"Data non valida: {value}")
+
+
+def parse_limit(value, default, maximum):
+    """Converte il parametro limit nel numero di righe per pagina, tra 1 e maximum."""
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError(f"Limite non valido: {value}")
+    return max(1, min(limit, maximum))
+
+
+def stream_json_page(rows, limit, cursor_key):
+    """Generatore del corpo JSON di una pagina.
+
+    Le righe vengono serializzate una alla volta; se la pagina è piena,
+    next_cursor contiene il cursore della pagina successiva, altrimenti null.
+    """
+    count = 0
+    last = None
+    yield '{"status": "success", "items": ['
+    for row in rows:
+        yield (',' if count else '') + json.dumps(row, default=_json_default)
+        count += 1
+        last = row
+    next_cursor = encode_cursor(*cursor_key(last)) if count == limit else None
+    yield f'], "count": {count}, "next_cursor": {json.dumps(next_cursor)}}}'
@@ -0,0 +1,232 @@
+# Partizionamento per data delle tabelle dei report del SERVER
+# Le tabelle che crescono a ogni report sono partizionate per intervalli di
+# tempo (RANGE COLUMNS sulla colonna della data):
+# 1. Una migrazione converte le tabelle esistenti (partition_report_tables)
+# 2. PartitionManager crea in anticipo le partizioni future dividendo la
+#    partizione finale p_future (MAXVALUE), che resta vuota
+# 3. Le partizioni più vecchie della retention vengono eliminate con DROP
+#    PARTITION, oppure prima spostate in una tabella di archivio con EXCHANGE
+#    PARTITION: la pulizia è un'operazione sui metadati, non un DELETE
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+FUTURE_PARTITION = 'p_future'
+
+# Tabelle partizionate: tabella (eventualmente schema.tabella) -> (colonna della data, intervallo)
+PARTITIONED_TABLES = {
+    'box_reports': ('timestamp', 'month'),
+    'client_reports': ('timestamp', 'month'),
+    'detected_devices': ('timestamp', 'day'),
+    # Create già partizionate da init_db e da strutturaSQL
+    'ingested_reports': ('received_at', 'day'),
+    'serverfuturo.rilevazioni': ('dataUpdate', 'month')
+}
+
+
+def bucket_start(value, interval):
+    """Inizio dell'intervallo ('day' o 'month') che contiene value."""
+    start = datetime(value.year, value.month, value.day)
+    return start if interval == 'day' else start.replace(day=1)
+
+
+def next_bucket(start, interval):
+    """Inizio dell'intervallo successivo."""
+    if interval == 'day':
+        return start + timedelta(days=1)
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def partition_name(start, interval):
+    return start.strftime('p%Y%m%d' if interval == 'day' else 'p%Y%m')
+
+
+def partition_definitions(start, until, interval):
+    """Definizioni delle partizioni da start fino a coprire until (escluso)."""
+    definitions = []
+    while start < until:
+        end = next_bucket(start, interval)
+        definitions.append(f"PARTITION {partition_name(start, interval)} VALUES LESS THAN ('{end.isoformat(' ')}')")
+        start = end
+    return definitions
+
+
+def split_table(table):
+    """Restituisce (schema, tabella); lo schema è None per le tabelle del database corrente."""
+    if '.' in table:
+        return tuple(table.split('.', 1))
+    return None, table
+
+
+def list_partitions(cursor, table):
+    """Restituisce [(nome, limite superiore)] delle partizioni in ordine; il limite è None per MAXVALUE.
+
+    La lista è vuota se la tabella non esiste o non è partizionata.
+    """
+    schema, name = split_table(table)
+    cursor.execute(
+        "SELECT PARTITION_NAME AS name, PARTITION_DESCRIPTION AS bound FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = COALESCE(%s, DATABASE()) AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION",
+        (schema, name)
+    )
+    partitions = []
+    for row in cursor.fetchall():
+        bound = row['bound']
+        partitions.append((row['name'], None if bound == 'MAXVALUE' else datetime.fromisoformat(bound.strip("'"))))
+    return partitions
+
+
+def partition_table(cursor, table, ahead=3):
+    """Converte una tabella con chiave primaria id in una tabella partizionata per data.
+
+    La colonna della data entra nella chiave primaria (MySQL lo richiede per ogni
+    chiave unica) e diventa NOT NULL: le righe senza data prendono la data più vecchia.
+    Le partizioni vanno dal primo intervallo con dati fino a ahead intervalli nel futuro.
+    Restituisce False se la tabella è già partizionata.
+    """
+    column, interval = PARTITIONED_TABLES[table]
+    if list_partitions(cursor, table):
+        return False
+
+    cursor.execute(f"SELECT MIN({column}) AS oldest FROM {table}")
+    oldest = cursor.fetchone()['oldest'] or datetime.now()
+    cursor.execute(f"UPDATE {table} SET {column} = %s WHERE {column} IS NULL", (oldest,))
+
+    until = bucket_start(datetime.now(), interval)
+    for _ in range(ahead + 1):
+        until = next_bucket(until, interval)
+    definitions = partition_definitions(bucket_start(oldest, interval), until, interval)
+    definitions.append(f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE)")
+
+    cursor.execute(
+        f"ALTER TABLE {table} MODIFY {column} DATETIME NOT NULL, "
+        f"DROP PRIMARY KEY, ADD PRIMARY KEY (id, {column}) "
+        f"PARTITION BY RANGE COLUMNS({column}) ({', '.join(definitions)})"
+    )
+    return True
+
+
+def partition_report_tables(cursor):
+    """Migrazione: partiziona le tabelle dei report del database del SERVER."""
+    for table in PARTITIONED_TABLES:
+        if split_table(table)[0] is None and partition_table(cursor, table):
+            print(f"Tabella {table} partizionata")
+
+
+class PartitionManager:
+    """Crea le partizioni future ed elimina (o archivia) quelle scadute, periodicamente."""
+
+    def __init__(self, connect, retention, ahead=3, archive=False, check_interval=3600,
+                 tables=PARTITIONED_TABLES):
+        self.connect = connect  # Funzione che restituisce una connessione al database
+        self.retention = retention  # tabella -> giorni di conservazione (None: nessuna eliminazione)
+        self.ahead = ahead
+        self.archive = archive
+        self.check_interval = check_interval
+        self.tables = tables
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """Avvia il thread di manutenzione delle partizioni (una sola volta)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.maintain()
+            time.sleep(self.check_interval)
+
+    def maintain(self, now=None):
+        """Esegue la manutenzione di tutte le tabelle partizionate."""
+        now = now or datetime.now()
+        conn = self.connect()
+        if not conn:
+            print("Manutenzione delle partizioni rimandata: database non disponibile")
+            return
+        try:
+            for table in self.tables:
+                try:
+                    with conn.cursor() as cursor:
+                        self.maintain_table(cursor, table, now)
+                except Exception as e:
+                    print(f"Errore nella manutenzione delle partizioni di {table}: {e}")
+        finally:
+            conn.close()
+
+    def maintain_table(self, cursor, table, now):
+        column, interval = self.tables[table]
+        partitions = list_partitions(cursor, table)
+        if not partitions:
+            print(f"Tabella {table} non partizionata: ignorata")
+            return
+
+        # Partizioni future: fino a ahead intervalli dopo quello corrente
+        bounds = [bound for _, bound in partitions if bound is not None]
+        until = bucket_start(now, interval)
+        for _ in range(self.ahead + 1):
+            until = next_bucket(until, interval)
+        last = max(bounds) if bounds else bucket_start(now, interval)
+        if last < until:
+            definitions = partition_definitions(last, until, interval)
+            if partitions[-1][1] is None:
+                # p_future è vuota: dividerla non sposta righe
+                cursor.execute(
+                    f"ALTER TABLE {table} REORGANIZE PARTITION {partitions[-1][0]} INTO "
+                    f"({', '.join(definitions)}, PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE))"
+                )
+            else:
+                cursor.execute(f"ALTER TABLE {table} ADD PARTITION ({', '.join(definitions)})")
+            print(f"{table}: create {len(definitions)} partizioni fino a {until.date().isoformat()}")
+
+        # Partizioni scadute: tutte le righe sono più vecchie della retention
+        days = self.retention.get(table)
+        if days is None:
+            return
+        cutoff = now - timedelta(days=days)
+        expired = [name for name, bound in partitions if bound is not None and bound <= cutoff]
+        if len(expired) == len(partitions):
+            # Una tabella partizionata deve conservare almeno una partizione
+            expired = expired[:-1]
+        if not expired:
+            return
+        if self.archive:
+            for name in expired:
+                self.archive_partition(cursor, table, name)
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+        print(f"{table}: {'archiviate' if self.archive else 'eliminate'} le partizioni {', '.join(expired)}")
+
+    def archive_partition(self, cursor, table, partition):
+        """Sposta le righe di una partizione nella tabella <tabella>_archive_<partizione>."""
+        schema, name = split_table(table)
+        archive = f"{name}_archive_{partition}"
+        cursor.execute(
+            "SELECT COUNT(*) AS count FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = COALESCE(%s, DATABASE()) AND TABLE_NAME = %s",
+            (schema, archive)
+        )
+        exists = cursor.fetchone()['count'] > 0
+        if schema:
+            archive = f"{schema}.{archive}"
+        if exists:
+            # Creata da un'esecuzione precedente interrotta: prima o dopo lo scambio?
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table} PARTITION ({partition})) AS has_rows")
+            if not cursor.fetchone()['has_rows']:
+                # Scambio già avvenuto: la partizione è vuota e può essere eliminata
+                return
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {archive}) AS has_rows")
+            if cursor.fetchone()['has_rows']:
+                raise RuntimeError(f"{archive} e la partizione {partition} contengono entrambe dati: "
+                                   "partizione non eliminata")
+            if list_partitions(cursor, archive):
+                # Interrotta prima di REMOVE PARTITIONING
+                cursor.execute(f"ALTER TABLE {archive} REMOVE PARTITIONING")
+        else:
+            cursor.execute(f"CREATE TABLE {archive} LIKE {table}")
+            cursor.execute(f"ALTER TABLE {archive} REMOVE PARTITIONING")
+        cursor.execute(f"ALTER TABLE {table} EXCHANGE PARTITION {partition} WITH TABLE {archive}")
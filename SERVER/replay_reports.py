@@ -0,0 +1,307 @@
+# Ricostruzione delle tabelle dei report dall'archivio del SERVER
+# Rilegge i report archiviati in data_received (segmenti del log e vecchi file
+# box_<codice>_<timestamp>.json) e li ricarica in box_reports, detected_devices
+# e client_reports:
+# 1. L'archivio viene diviso in unità (un segmento, o un gruppo di vecchi file)
+#    analizzate in parallelo da un pool di processi
+# 2. Le righe vengono caricate con LOAD DATA LOCAL INFILE oppure con grandi
+#    inserimenti multi-riga, una transazione per unità
+# 3. Le unità completate vengono registrate in un file di checkpoint, così una
+#    ricostruzione interrotta riprende da dove si era fermata
+# 4. L'inventario dei dispositivi (device_inventory) viene aggiornato unità per
+#    unità come durante l'ingestione; detected_devices viene caricata solo se
+#    STORE_DEVICE_SIGHTINGS è attivo
+# 5. Al termine le tabelle di aggregazione (client_stats_hourly, client_stats_daily,
+#    client_totals) vengono ricalcolate da client_reports
+# Il segmento attivo (ancora in scrittura da parte del SERVER) viene escluso,
+# salvo con --include-active: il SERVER archivia i report solo dopo averli
+# scritti nel database, quindi i suoi report sono già nelle tabelle.
+#
+# Uso: python replay_reports.py [--method load|insert] [--workers N] [--box CODICE]
+#                               [--since ISO] [--until ISO] [--truncate] [--checkpoint FILE]
+#                               [--include-active]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pymysql
+
+from reportlog import ACTIVE_SUFFIX, SegmentLog
+from reportdb import (DATA_DIR, DB_CONFIG, STORE_DEVICE_SIGHTINGS, inventory_rows, rebuild_rollups, report_rows,
+                      upsert_device_inventory)
+
+CHECKPOINT_FILE = "replay_checkpoint.json"
+LEGACY_CHUNK_SIZE = 1000  # Vecchi file JSON per unità
+INSERT_BATCH_ROWS = 5000  # Righe per istruzione con il metodo insert
+
+TABLES = {
+    'box_reports': "(box_code, device_name, ip_private, ip_public, mac_address, latency, timestamp)",
+    'detected_devices': "(box_code, device_name, ip_address, mac_address, timestamp)",
+    'client_reports': "(box_code, client_name, ip_private, mac_address, threats_detected, ips_blocked, timestamp)"
+}
+
+
+def list_units(log, include_active=False):
+    """Elenca le unità di lavoro dell'archivio: ('segment', nome) e ('legacy', [file])."""
+    segments = log.segments()
+    if segments and not include_active and \
+            os.path.exists(os.path.join(log.directory, segments[-1] + ACTIVE_SUFFIX)):
+        segments = segments[:-1]
+    units = [('segment', segment) for segment in segments]
+
+    legacy = sorted(name for name in os.listdir(log.directory)
+                    if name.startswith('box_') and name.endswith('.json'))
+    for i in range(0, len(legacy), LEGACY_CHUNK_SIZE):
+        units.append(('legacy', legacy[i:i + LEGACY_CHUNK_SIZE]))
+    return units
+
+
+def unit_id(unit):
+    kind, value = unit
+    return f"segment:{value}" if kind == 'segment' else f"legacy:{value[0]}:{len(value)}"
+
+
+def read_unit(log, unit, box_code, since, until):
+    """Restituisce i report di un'unità che rispettano i filtri."""
+    kind, value = unit
+    if kind == 'segment':
+        yield from log.replay_segment(value, box_code, since, until)
+        return
+
+    for name in value:
+        try:
+            with open(os.path.join(log.directory, name)) as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"File {name} ignorato: {e}")
+            continue
+        code = record.get('data', {}).get('box_code')
+        timestamp = record.get('timestamp', '')
+        if box_code is not None and code != box_code:
+            continue
+        if since and timestamp < since or until and timestamp >= until:
+            continue
+        yield record
+
+
+def _escape(value):
+    """Formatta un valore per un file TSV di LOAD DATA (escape predefinito di MySQL)."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def parse_unit(directory, unit, box_code, since, until, method, tmp_dir):
+    """Eseguito nel pool di processi: analizza un'unità e ne prepara le righe.
+
+    Con il metodo load le righe vengono scritte in file TSV e si restituiscono
+    i percorsi, altrimenti si restituiscono le righe stesse. Le righe
+    dell'inventario dei dispositivi vengono sempre restituite già aggregate.
+    """
+    log = SegmentLog(directory)
+    reports = []
+    for record in read_unit(log, unit, box_code, since, until):
+        data = record.get('data', {})
+        if not data.get('box_code'):
+            continue
+        reports.append((data['box_code'], data, datetime.fromisoformat(record['timestamp'])))
+
+    rows = dict(zip(TABLES, report_rows(reports)))
+    inventory = inventory_rows(rows['detected_devices'])
+    if not STORE_DEVICE_SIGHTINGS:
+        rows['detected_devices'] = []
+    if method != 'load':
+        return unit, len(reports), rows, inventory
+
+    files = {}
+    for table, table_rows in rows.items():
+        if not table_rows:
+            continue
+        fd, path = tempfile.mkstemp(prefix=f"{table}-", suffix='.tsv', dir=tmp_dir)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for row in table_rows:
+                f.write('\t'.join(map(_escape, row)) + '\n')
+        files[table] = path
+    return unit, len(reports), files, inventory
+
+
+def load_unit(conn, method, payload, inventory):
+    """Carica nel database le righe di un'unità in una sola transazione."""
+    with conn.cursor() as cursor:
+        if inventory:
+            upsert_device_inventory(cursor, inventory)
+        for table, columns in TABLES.items():
+            if table not in payload or not payload[table]:
+                continue
+            if method == 'load':
+                cursor.execute(
+                    f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 {columns}",
+                    (payload[table],)
+                )
+            else:
+                placeholders = ', '.join(['%s'] * len(payload[table][0]))
+                rows = payload[table]
+                for i in range(0, len(rows), INSERT_BATCH_ROWS):
+                    cursor.executemany(f"INSERT INTO {table} {columns} VALUES ({placeholders})",
+                                       rows[i:i + INSERT_BATCH_ROWS])
+    conn.commit()
+
+
+def clear_tables(conn, filters):
+    """Svuota le tabelle dei report, o ne cancella solo le righe che rispettano i filtri."""
+    conditions, params = [], []
+    if filters['box']:
+        conditions.append("box_code = %s")
+        params.append(filters['box'])
+    if filters['since']:
+        conditions.append("timestamp >= %s")
+        params.append(filters['since'])
+    if filters['until']:
+        conditions.append("timestamp < %s")
+        params.append(filters['until'])
+
+    with conn.cursor() as cursor:
+        for table in TABLES:
+            if conditions:
+                cursor.execute(f"DELETE FROM {table} WHERE {' AND '.join(conditions)}", params)
+            else:
+                cursor.execute(f"TRUNCATE TABLE {table}")
+
+        # L'inventario non ha i singoli rilevamenti: si svuota solo senza filtri di tempo
+        if filters['since'] or filters['until']:
+            print("Filtri di tempo: device_inventory non viene svuotata, seen_count conterà di nuovo "
+                  "i rilevamenti ricaricati")
+        elif filters['box']:
+            cursor.execute("DELETE FROM device_inventory WHERE box_code = %s", (filters['box'],))
+        else:
+            cursor.execute("TRUNCATE TABLE device_inventory")
+    conn.commit()
+
+
+def load_checkpoint(path, filters):
+    """Restituisce le unità già completate. Il checkpoint vale solo per gli stessi filtri."""
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('filters') != filters:
+        raise ValueError(f"Il checkpoint {path} è stato creato con filtri diversi: {checkpoint.get('filters')}")
+    return set(checkpoint.get('done', []))
+
+
+def save_checkpoint(path, filters, done):
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'filters': filters, 'done': sorted(done)}, f)
+    os.replace(path + '.tmp', path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ricostruisce le tabelle dei report dall'archivio data_received")
+    parser.add_argument('--method', choices=('load', 'insert'), default='load',
+                        help="LOAD DATA LOCAL INFILE (load) o inserimenti multi-riga (insert)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Processi per l'analisi")
+    parser.add_argument('--box', help="Ricarica solo i report di questo BOX")
+    parser.add_argument('--since', help="Solo i report ricevuti da questa data (ISO)")
+    parser.add_argument('--until', help="Solo i report ricevuti prima di questa data (ISO)")
+    parser.add_argument('--truncate', action='store_true',
+                        help="Svuota le tabelle (solo le righe che rispettano i filtri) prima di iniziare, "
+                             "solo senza checkpoint")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE, help="File dei progressi")
+    parser.add_argument('--directory', default=DATA_DIR, help="Directory dell'archivio")
+    parser.add_argument('--include-active', action='store_true',
+                        help="Include il segmento ancora in scrittura (non viene registrato nel checkpoint)")
+    args = parser.parse_args()
+
+    log = SegmentLog(args.directory)
+    filters = {'box': args.box, 'since': args.since, 'until': args.until}
+    try:
+        done = load_checkpoint(args.checkpoint, filters)
+    except ValueError as e:
+        print(e)
+        return 1
+    units = [unit for unit in list_units(log, args.include_active) if unit_id(unit) not in done]
+    segments = log.segments()
+    active = set()
+    if args.include_active and segments and \
+            os.path.exists(os.path.join(log.directory, segments[-1] + ACTIVE_SUFFIX)):
+        active.add(unit_id(('segment', segments[-1])))
+    print(f"{len(units)} unità da caricare ({len(done)} già completate)")
+
+    conn = pymysql.connect(
+        host=DB_CONFIG['host'],
+        user=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        db=DB_CONFIG['db'],
+        charset=DB_CONFIG['charset'],
+        cursorclass=DB_CONFIG['cursorclass'],
+        local_infile=args.method == 'load'
+    )
+
+    if args.truncate:
+        if done:
+            print("Checkpoint presente: le tabelle non vengono svuotate")
+        else:
+            clear_tables(conn, filters)
+
+    started = time.monotonic()
+    total_reports = 0
+    workers = args.workers or 1
+    with tempfile.TemporaryDirectory(prefix='replay-') as tmp_dir, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        # Al massimo due unità per processo in attesa: le righe analizzate non si accumulano in memoria
+        pending = deque()
+        remaining = iter(units)
+        try:
+            while True:
+                while len(pending) < 2 * workers:
+                    unit = next(remaining, None)
+                    if unit is None:
+                        break
+                    pending.append(executor.submit(parse_unit, args.directory, unit, args.box, args.since,
+                                                   args.until, args.method, tmp_dir))
+                if not pending:
+                    break
+
+                unit, count, payload, inventory = pending.popleft().result()
+                load_unit(conn, args.method, payload, inventory)
+                if args.method == 'load':
+                    for path in payload.values():
+                        os.remove(path)
+
+                # L'unità è stata caricata e confermata: viene registrata nel checkpoint
+                if unit_id(unit) not in active:
+                    done.add(unit_id(unit))
+                    save_checkpoint(args.checkpoint, filters, done)
+                total_reports += count
+                elapsed = time.monotonic() - started
+                print(f"{unit_id(unit)}: {count} report ({total_reports / elapsed:.0f} report/s)")
+
+            # Il caricamento non passa da store_reports: le tabelle di aggregazione vengono ricalcolate
+            print("Ricalcolo delle tabelle di aggregazione...")
+            with conn.cursor() as cursor:
+                rebuild_rollups(cursor, args.box)
+            conn.commit()
+        except KeyboardInterrupt:
+            print("Interrotto: rieseguire il comando per riprendere dal checkpoint")
+            for future in pending:
+                future.cancel()
+            return 1
+        finally:
+            conn.close()
+
+    print(f"Caricati {total_reports} report in {time.monotonic() - started:.1f} secondi")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
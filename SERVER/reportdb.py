@@ -0,0 +1,352 @@
+# Dati dei report del SERVER nel database
+# Configurazione MySQL, scrittura dei report del BOX (tabelle dei report,
+# inventario dei dispositivi, tabelle di aggregazione) e query della dashboard.
+# Il modulo non ha effetti all'importazione (nessuna app Flask, pool di
+# connessioni, thread o directory): lo importano server.py e gli script
+# (replay_reports.py, benchmark_*.py, compact_sightings.py), anche nei
+# processi worker.
+
+import pymysql
+from pymysql.constants import CLIENT
+
+# Configurazione MySQL
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'claudio',
+    'password': 'Superrapa22',
+    'db': 'security_system',
+    'charset': 'utf8mb4',
+    'cursorclass': pymysql.cursors.DictCursor
+}
+
+# Directory dell'archivio dei report ricevuti (log a segmenti)
+DATA_DIR = "data_received"
+
+# Inventario dei dispositivi: una riga per dispositivo aggiornata a ogni rilevamento
+STORE_DEVICE_SIGHTINGS = True  # Registra anche ogni singolo rilevamento in detected_devices (storico)
+DEVICE_SIGHTINGS_COMPACT_AFTER = 7  # Giorni dopo i quali compact_sightings.py lascia un rilevamento al giorno
+
+
+def open_db_connection():
+    """Apre una nuova connessione al database."""
+    return pymysql.connect(
+        host=DB_CONFIG['host'],
+        user=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        db=DB_CONFIG['db'],
+        charset=DB_CONFIG['charset'],
+        cursorclass=DB_CONFIG['cursorclass'],
+        # Le query della dashboard vengono inviate insieme in un'unica richiesta
+        client_flag=CLIENT.MULTI_STATEMENTS
+    )
+
+
+def connect_db():
+    """Apre una connessione al database per gli script; None se non è disponibile."""
+    try:
+        return open_db_connection()
+    except Exception as e:
+        print(f"Errore nella connessione al database: {e}")
+        return None
+
+
+def report_rows(reports):
+    """Converte un lotto di report del BOX, dati come (box_code, dati, timestamp), nelle righe
+    delle tabelle box_reports, detected_devices e client_reports."""
+    box_rows, device_rows, client_rows = [], [], []
+    for box_code, data, timestamp in reports:
+        # Informazioni sul BOX
+        box_data = data.get('box_data', {})
+        box_rows.append((
+            box_code,
+            box_data.get('device_name', ''),
+            box_data.get('ip_private', ''),
+            box_data.get('ip_public', ''),
+            box_data.get('mac_address', ''),
+            box_data.get('latency', 0),
+            timestamp
+        ))
+
+        # Informazioni sui dispositivi rilevati
+        device_rows.extend((box_code, device.get('name', ''), device.get('ip', ''), device.get('mac', ''), timestamp)
+                           for device in data.get('devices', []))
+
+        # Informazioni dai client
+        client_rows.extend((box_code, report.get('name', ''), report.get('ip_priv', ''), report.get('MAC', ''),
+                            report.get('minacce', 0), report.get('ip_bloccati', 0), timestamp)
+                           for report in data.get('client_reports', []))
+
+    return box_rows, device_rows, client_rows
+
+
+def store_reports(cursor, reports):
+    """Inserisce un lotto di report del BOX, dati come (box_code, dati, timestamp).
+
+    Le righe di tutti i report vengono unite e scritte con inserimenti multi-riga
+    (executemany), senza un round-trip per ogni voce.
+    """
+    box_rows, device_rows, client_rows = report_rows(reports)
+    if box_rows:
+        cursor.executemany(
+            "INSERT INTO box_reports (box_code, device_name, ip_private, ip_public, mac_address, latency, timestamp) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            box_rows
+        )
+    if device_rows:
+        if STORE_DEVICE_SIGHTINGS:
+            cursor.executemany(
+                "INSERT INTO detected_devices (box_code, device_name, ip_address, mac_address, timestamp) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                device_rows
+            )
+        upsert_device_inventory(cursor, inventory_rows(device_rows))
+    if client_rows:
+        cursor.executemany(
+            "INSERT INTO client_reports (box_code, client_name, ip_private, mac_address, threats_detected, ips_blocked, timestamp) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            client_rows
+        )
+        store_rollups(cursor, client_rows)
+
+
+def device_key(name, ip_address, mac_address):
+    """Chiave di un dispositivo nell'inventario: il MAC, oppure l'IP, oppure il nome."""
+    return (mac_address or ip_address or name or '').lower()
+
+
+def inventory_rows(device_rows):
+    """Aggrega le righe di detected_devices di un lotto per la tabella device_inventory.
+
+    Per ogni dispositivo restituisce nome e indirizzi dell'ultimo rilevamento, primo e
+    ultimo rilevamento e numero di rilevamenti, in ordine di chiave (vedi rollup_rows).
+    """
+    devices = {}
+    for box_code, name, ip_address, mac_address, timestamp in device_rows:
+        key = (box_code, device_key(name, ip_address, mac_address))
+        device = devices.get(key)
+        if device is None:
+            devices[key] = [name, ip_address, mac_address, timestamp, timestamp, 1]
+            continue
+        if timestamp >= device[4]:
+            device[0:3] = [name, ip_address, mac_address]
+        device[3] = min(device[3], timestamp)
+        device[4] = max(device[4], timestamp)
+        device[5] += 1
+    return [key + tuple(value) for key, value in sorted(devices.items())]
+
+
+def upsert_device_inventory(cursor, rows):
+    """Aggiorna l'inventario dei dispositivi con le righe di inventory_rows.
+
+    Nome e indirizzi vengono sostituiti solo da un rilevamento più recente, così
+    l'ordine di scrittura dei lotti (o un replay dell'archivio) non li fa tornare indietro.
+    """
+    cursor.executemany(
+        "INSERT INTO device_inventory (box_code, device_key, device_name, ip_address, mac_address, "
+        "first_seen, last_seen, seen_count) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE "
+        "device_name = IF(VALUES(last_seen) >= last_seen, VALUES(device_name), device_name), "
+        "ip_address = IF(VALUES(last_seen) >= last_seen, VALUES(ip_address), ip_address), "
+        "mac_address = IF(VALUES(last_seen) >= last_seen, VALUES(mac_address), mac_address), "
+        "first_seen = LEAST(first_seen, VALUES(first_seen)), "
+        "last_seen = GREATEST(last_seen, VALUES(last_seen)), "
+        "seen_count = seen_count + VALUES(seen_count)",
+        rows
+    )
+
+
+def rollup_rows(client_rows):
+    """Aggrega le righe di client_reports di un lotto per le tabelle di aggregazione.
+
+    Restituisce le righe di client_stats_hourly, client_stats_daily e client_totals,
+    ordinate per chiave: le transazioni concorrenti aggiornano le stesse righe
+    sempre nello stesso ordine, senza deadlock.
+    """
+    hourly, daily, totals = {}, {}, {}
+    for box_code, client_name, ip_private, mac_address, threats, blocked, timestamp in client_rows:
+        threats, blocked = int(threats or 0), int(blocked or 0)
+        for buckets, key in ((hourly, (box_code, timestamp.replace(minute=0, second=0, microsecond=0))),
+                             (daily, (box_code, timestamp.date()))):
+            bucket = buckets.setdefault(key, [0, 0, 0])
+            bucket[0] += 1
+            bucket[1] += threats
+            bucket[2] += blocked
+
+        key = (box_code, client_name or '', ip_private or '', mac_address or '')
+        total = totals.setdefault(key, [0, 0, 0, timestamp, timestamp])
+        total[0] += 1
+        total[1] += threats
+        total[2] += blocked
+        total[3] = min(total[3], timestamp)
+        total[4] = max(total[4], timestamp)
+
+    return ([key + tuple(value) for key, value in sorted(hourly.items())],
+            [key + tuple(value) for key, value in sorted(daily.items())],
+            [key + tuple(value) for key, value in sorted(totals.items())])
+
+
+def store_rollups(cursor, client_rows):
+    """Aggiorna le tabelle di aggregazione con le righe di client_reports di un lotto.
+
+    Viene eseguito nella stessa transazione dell'inserimento dei report, così
+    totali e storico restano coerenti con client_reports.
+    """
+    hourly_rows, daily_rows, total_rows = rollup_rows(client_rows)
+    for table, column, rows in (('client_stats_hourly', 'hour', hourly_rows),
+                                ('client_stats_daily', 'day', daily_rows)):
+        cursor.executemany(
+            f"INSERT INTO {table} (box_code, {column}, reports, threats_detected, ips_blocked) "
+            "VALUES (%s, %s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE reports = reports + VALUES(reports), "
+            "threats_detected = threats_detected + VALUES(threats_detected), "
+            "ips_blocked = ips_blocked + VALUES(ips_blocked)",
+            rows
+        )
+    cursor.executemany(
+        "INSERT INTO client_totals (box_code, client_name, ip_private, mac_address, reports, "
+        "threats_detected, ips_blocked, first_report, last_report) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE reports = reports + VALUES(reports), "
+        "threats_detected = threats_detected + VALUES(threats_detected), "
+        "ips_blocked = ips_blocked + VALUES(ips_blocked), "
+        "first_report = LEAST(first_report, VALUES(first_report)), "
+        "last_report = GREATEST(last_report, VALUES(last_report))",
+        total_rows
+    )
+
+
+def rebuild_rollups(cursor, box_code=None):
+    """Ricalcola da client_reports le tabelle di aggregazione, per un BOX o per tutti.
+
+    Serve dopo i caricamenti che non passano da store_reports (replay_reports.py).
+    """
+    condition, params = ("WHERE box_code = %s", (box_code,)) if box_code else ("", ())
+    for table in ('client_stats_hourly', 'client_stats_daily', 'client_totals'):
+        cursor.execute(f"DELETE FROM {table} {condition}", params)
+
+    filtered = f"{condition} AND" if condition else "WHERE"
+    cursor.execute(
+        "INSERT INTO client_stats_hourly (box_code, hour, reports, threats_detected, ips_blocked) "
+        "SELECT box_code, DATE_FORMAT(timestamp, '%%Y-%%m-%%d %%H:00:00'), COUNT(*), "
+        "COALESCE(SUM(threats_detected), 0), COALESCE(SUM(ips_blocked), 0) "
+        f"FROM client_reports {filtered} timestamp IS NOT NULL "
+        "GROUP BY box_code, DATE_FORMAT(timestamp, '%%Y-%%m-%%d %%H:00:00')",
+        params
+    )
+    cursor.execute(
+        "INSERT INTO client_stats_daily (box_code, day, reports, threats_detected, ips_blocked) "
+        "SELECT box_code, DATE(timestamp), COUNT(*), COALESCE(SUM(threats_detected), 0), "
+        "COALESCE(SUM(ips_blocked), 0) "
+        f"FROM client_reports {filtered} timestamp IS NOT NULL GROUP BY box_code, DATE(timestamp)",
+        params
+    )
+    cursor.execute(
+        "INSERT INTO client_totals (box_code, client_name, ip_private, mac_address, reports, "
+        "threats_detected, ips_blocked, first_report, last_report) "
+        "SELECT box_code, COALESCE(client_name, ''), COALESCE(ip_private, ''), COALESCE(mac_address, ''), "
+        "COUNT(*), COALESCE(SUM(threats_detected), 0), COALESCE(SUM(ips_blocked), 0), "
+        f"MIN(timestamp), MAX(timestamp) FROM client_reports {condition} "
+        "GROUP BY box_code, COALESCE(client_name, ''), COALESCE(ip_private, ''), COALESCE(mac_address, '')",
+        params
+    )
+
+
+def store_report(cursor, box_code, data, timestamp):
+    """Inserisce un singolo report del BOX (vedi store_reports)."""
+    store_reports(cursor, [(box_code, data, timestamp)])
+
+
+# Query della dashboard, eseguite in un'unica richiesta multi-istruzione:
+# (sezione, query, numero di parametri box_code)
+DASHBOARD_QUERIES = [
+    # Informazioni sul BOX
+    ('box_info', """
+        SELECT device_name, ip_private, ip_public, mac_address, latency, timestamp
+        FROM box_reports 
+        WHERE box_code = %s 
+        ORDER BY timestamp DESC 
+        LIMIT 1
+    """, 1),
+    # Stato di sicurezza (totali), dai totali aggregati per client
+    ('security_status', """
+        SELECT 
+            COALESCE(SUM(reports), 0) as total_reports,
+            SUM(threats_detected) as total_threats,
+            SUM(ips_blocked) as total_blocked
+        FROM client_totals 
+        WHERE box_code = %s
+    """, 1),
+    # Ultimo aggiornamento
+    ('last_update', """
+        SELECT MAX(timestamp) as last_update
+        FROM (
+            SELECT MAX(timestamp) as timestamp FROM box_reports WHERE box_code = %s
+            UNION
+            SELECT MAX(timestamp) as timestamp FROM client_reports WHERE box_code = %s
+            UNION
+            SELECT MAX(last_seen) as timestamp FROM device_inventory WHERE box_code = %s
+        ) as updates
+    """, 3),
+    # Dispositivi connessi, dall'inventario: un dispositivo per riga
+    ('connected_devices', """
+        SELECT device_name, ip_address, mac_address, last_seen as timestamp, first_seen, seen_count
+        FROM device_inventory 
+        WHERE box_code = %s 
+        ORDER BY last_seen DESC
+        LIMIT 50
+    """, 1),
+    # Statistiche dei client
+    ('client_stats', """
+        SELECT 
+            client_name,
+            ip_private,
+            mac_address,
+            threats_detected,
+            ips_blocked,
+            last_report
+        FROM client_totals 
+        WHERE box_code = %s 
+        ORDER BY last_report DESC
+    """, 1),
+    # Storico delle minacce (ultimi 7 giorni), dalle ore aggregate: al massimo 168 righe
+    ('threats_history', """
+        SELECT 
+            DATE(hour) as date,
+            SUM(threats_detected) as threats_detected,
+            SUM(ips_blocked) as ips_blocked
+        FROM client_stats_hourly 
+        WHERE box_code = %s AND hour >= DATE_FORMAT(DATE_SUB(NOW(), INTERVAL 7 DAY), '%%Y-%%m-%%d %%H:00:00')
+        GROUP BY DATE(hour)
+        ORDER BY date DESC
+    """, 1),
+    # Attività recente (ultimi 20 report e nuovi dispositivi). Ogni ramo legge al più
+    # 20 righe dal proprio indice (box_code, data); l'ordinamento finale unisce solo quelle
+    ('recent_activity', """
+        (SELECT 
+            'client_report' as type,
+            client_name as name,
+            ip_private as ip,
+            threats_detected,
+            ips_blocked,
+            timestamp
+        FROM client_reports 
+        WHERE box_code = %s
+        ORDER BY timestamp DESC
+        LIMIT 20)
+        UNION ALL
+        (SELECT 
+            'device_detected' as type,
+            device_name as name,
+            ip_address as ip,
+            0 as threats_detected,
+            0 as ips_blocked,
+            first_seen as timestamp
+        FROM device_inventory 
+        WHERE box_code = %s
+        ORDER BY first_seen DESC
+        LIMIT 20)
+        ORDER BY timestamp DESC
+        LIMIT 20
+    """, 2)
+]
@@ -0,0 +1,226 @@
+# Archivio dei report ricevuti dal SERVER
+# Sostituisce un file JSON per report con un log a segmenti in sola aggiunta:
+# 1. I report vengono scritti come righe JSON (una per report) nel segmento attivo
+# 2. Il segmento viene chiuso quando supera una dimensione o un'età massima e,
+#    se richiesto, compresso con gzip in background
+# 3. Per ogni segmento un file indice (.idx) registra box_code, timestamp,
+#    posizione e lunghezza di ogni report, così i report di un BOX o di un
+#    intervallo di tempo possono essere riletti senza scorrere tutto l'archivio
+# I report vengono archiviati dalla coda di ingestione dopo la scrittura nel
+# database, quindi non sempre in ordine di timestamp: i segmenti vengono
+# selezionati in base al timestamp minimo e massimo registrato nel loro indice.
+
+import gzip
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+SEGMENT_PREFIX = 'segment-'
+ACTIVE_SUFFIX = '.log'
+SEALED_SUFFIX = '.log.gz'
+INDEX_SUFFIX = '.idx'
+
+
+def _timestamp_key(value):
+    """Converte un datetime o una stringa ISO nella forma confrontabile usata nell'indice."""
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+
+class SegmentLog:
+    """Log a segmenti dei report, con rotazione per dimensione/età e indice per box_code e tempo."""
+
+    def __init__(self, directory, max_segment_size=64 * 1024 * 1024, max_segment_age=3600,
+                 compress=True, fsync=False):
+        self.directory = directory
+        self.max_segment_size = max_segment_size
+        self.max_segment_age = max_segment_age
+        self.compress = compress
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._segment = None  # Nome del segmento attivo, senza estensione
+        self._file = None
+        self._index = None
+        self._opened_at = 0
+        self._seq = None  # Numero del prossimo segmento, calcolato alla prima scrittura
+        self._ranges = {}  # segmento chiuso -> (timestamp minimo, timestamp massimo)
+
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, segment, suffix):
+        return os.path.join(self.directory, segment + suffix)
+
+    def segments(self):
+        """Restituisce i nomi dei segmenti (attivo e chiusi) in ordine cronologico."""
+        names = set()
+        for name in os.listdir(self.directory):
+            if not name.startswith(SEGMENT_PREFIX):
+                continue
+            for suffix in (SEALED_SUFFIX, ACTIVE_SUFFIX):
+                if name.endswith(suffix):
+                    names.add(name[:-len(suffix)])
+                    break
+        return sorted(names)
+
+    def _recover(self):
+        """Chiude i segmenti rimasti attivi da un'esecuzione precedente.
+
+        Viene eseguito alla prima scrittura, così gli strumenti che leggono
+        soltanto l'archivio non toccano il segmento attivo del SERVER.
+        """
+        self._seq = 0
+        for segment in self.segments():
+            self._seq = max(self._seq, int(segment.rsplit('-', 1)[1]) + 1)
+            if os.path.exists(self._path(segment, ACTIVE_SUFFIX)):
+                self._seal(segment)
+
+    def _open_segment(self):
+        self._segment = f"{SEGMENT_PREFIX}{datetime.now().strftime('%Y%m%dT%H%M%S')}-{self._seq:06d}"
+        self._seq += 1
+        self._file = open(self._path(self._segment, ACTIVE_SUFFIX), 'ab')
+        self._index = open(self._path(self._segment, INDEX_SUFFIX), 'a')
+        self._opened_at = time.monotonic()
+
+    def _close_segment(self):
+        segment = self._segment
+        self._file.close()
+        self._index.close()
+        self._segment = self._file = self._index = None
+        return segment
+
+    def _seal(self, segment):
+        """Comprime un segmento chiuso (in background), lasciando l'indice invariato."""
+        if not self.compress:
+            return
+
+        def compress():
+            source = self._path(segment, ACTIVE_SUFFIX)
+            target = self._path(segment, SEALED_SUFFIX)
+            try:
+                with open(source, 'rb') as src, gzip.open(target + '.tmp', 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(target + '.tmp', target)
+                os.remove(source)
+            except OSError as e:
+                print(f"Errore nella compressione del segmento {segment}: {e}")
+
+        threading.Thread(target=compress, daemon=True).start()
+
+    def rotate(self):
+        """Chiude il segmento attivo; il report successivo aprirà un nuovo segmento."""
+        with self._lock:
+            if self._segment is not None:
+                self._seal(self._close_segment())
+
+    def append(self, record, box_code, timestamp):
+        """Aggiunge un report al log e restituisce (segmento, posizione)."""
+        line = json.dumps(record, separators=(',', ':')).encode() + b'\n'
+
+        with self._lock:
+            if self._segment is not None and (
+                    self._file.tell() + len(line) > self.max_segment_size or
+                    time.monotonic() - self._opened_at > self.max_segment_age):
+                self._seal(self._close_segment())
+            if self._segment is None:
+                if self._seq is None:
+                    self._recover()
+                self._open_segment()
+
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            self._index.write(json.dumps([box_code, _timestamp_key(timestamp), offset, len(line)]) + '\n')
+            self._index.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+                os.fsync(self._index.fileno())
+            return self._segment, offset
+
+    def select_segments(self, since=None, until=None):
+        """Restituisce i segmenti che possono contenere report con since <= timestamp < until."""
+        since, until = _timestamp_key(since), _timestamp_key(until)
+        selected = []
+
+        for segment in self.segments():
+            if since or until:
+                first, last = self._segment_range(segment)
+                if first is None:
+                    # Indice vuoto o illeggibile: il segmento non ha report da rileggere
+                    continue
+                if since and last < since or until and first >= until:
+                    continue
+            selected.append(segment)
+        return selected
+
+    def _index_entries(self, segment, box_code=None, since=None, until=None):
+        """Legge l'indice di un segmento: (posizione, lunghezza, box_code, timestamp) dei report scelti."""
+        since, until = _timestamp_key(since), _timestamp_key(until)
+        try:
+            index = open(self._path(segment, INDEX_SUFFIX))
+        except OSError:
+            return
+        with index:
+            for line in index:
+                try:
+                    code, timestamp, offset, length = json.loads(line)
+                except ValueError:
+                    # Riga incompleta scritta durante un arresto improvviso
+                    continue
+                if box_code is not None and code != box_code:
+                    continue
+                if since and timestamp < since or until and timestamp >= until:
+                    continue
+                yield offset, length, code, timestamp
+
+    def find(self, box_code=None, since=None, until=None):
+        """Restituisce dall'indice (segmento, posizione, lunghezza, box_code, timestamp) dei report
+        del BOX indicato (o di tutti) con since <= timestamp < until."""
+        for segment in self.select_segments(since, until):
+            for entry in self._index_entries(segment, box_code, since, until):
+                yield (segment,) + entry
+
+    def _segment_range(self, segment):
+        """Restituisce i timestamp minimo e massimo dei report del segmento, letti dall'indice.
+
+        Il risultato viene memorizzato solo per i segmenti chiusi, che non cambiano più.
+        """
+        if segment in self._ranges:
+            return self._ranges[segment]
+        timestamps = [timestamp for _, _, _, timestamp in self._index_entries(segment)]
+        bounds = (min(timestamps), max(timestamps)) if timestamps else (None, None)
+        with self._lock:
+            active = segment == self._segment
+        if timestamps and not active and not os.path.exists(self._path(segment, ACTIVE_SUFFIX)):
+            self._ranges[segment] = bounds
+        return bounds
+
+    def open_segment(self, segment):
+        """Apre un segmento in lettura binaria, compresso o no."""
+        with self._lock:
+            if segment == self._segment:
+                self._file.flush()
+        sealed = self._path(segment, SEALED_SUFFIX)
+        if os.path.exists(sealed):
+            return gzip.open(sealed, 'rb')
+        return open(self._path(segment, ACTIVE_SUFFIX), 'rb')
+
+    def replay_segment(self, segment, box_code=None, since=None, until=None):
+        """Rilegge in ordine i report di un segmento selezionati tramite il suo indice."""
+        entries = self._index_entries(segment, box_code, since, until)
+        first = next(entries, None)
+        if first is None:
+            return
+        with self.open_segment(segment) as handle:
+            for offset, length, _, _ in itertools.chain([first], entries):
+                handle.seek(offset)
+                yield json.loads(handle.read(length))
+
+    def replay(self, box_code=None, since=None, until=None):
+        """Rilegge in ordine i report selezionati tramite l'indice."""
+        for segment in self.select_segments(since, until):
+            yield from self.replay_segment(segment, box_code, since, until)
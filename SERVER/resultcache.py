@@ -0,0 +1,102 @@
+# Cache dei risultati del SERVER
+# Conserva per pochi secondi i dati già calcolati (ad esempio i dati della
+# dashboard di un BOX), così le richieste ravvicinate non interrogano ogni
+# volta il database:
+# 1. Ogni chiave ha una scadenza (ttl); alla scadenza il valore viene ricalcolato
+# 2. Le richieste concorrenti per la stessa chiave attendono un solo calcolo
+# 3. invalidate() scarta subito il valore di una chiave quando i dati cambiano;
+#    un calcolo già in corso al momento dell'invalidazione non viene memorizzato
+
+import threading
+import time
+
+
+class ResultCache:
+    """Cache con scadenza dei risultati per chiave, con invalidazione esplicita."""
+
+    def __init__(self, load, ttl=10, max_size=1000):
+        self.load = load  # Funzione che calcola il valore di una chiave
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = {}  # chiave -> (scadenza, valore)
+        self._loading = {}  # chiave -> lock del calcolo in corso
+        self._generations = {}  # chiave -> numero di invalidazioni (solo chiavi in memoria o in calcolo)
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _cached(self, key):
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._stats['hits'] += 1
+            return True, entry[1]
+        return False, None
+
+    def get(self, key):
+        """Restituisce il valore della chiave, calcolandolo se assente o scaduto.
+
+        Le eccezioni di load vengono propagate e il risultato non viene memorizzato.
+        """
+        with self._lock:
+            found, value = self._cached(key)
+            if found:
+                return value
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                # Il valore può essere stato calcolato da chi ha tenuto il lock prima di noi
+                found, value = self._cached(key)
+                if found:
+                    return value
+                self._stats['misses'] += 1
+                generation = self._generations.get(key, 0)
+
+            try:
+                value = self.load(key)
+            except Exception:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+
+            with self._lock:
+                if self._generations.get(key, 0) == generation:
+                    self._entries[key] = (time.monotonic() + self.ttl, value)
+                    self._evict()
+                self._loading.pop(key, None)
+            return value
+
+    def _evict(self):
+        """Rimuove i valori scaduti e, oltre max_size, quelli più vicini alla scadenza."""
+        if len(self._entries) <= self.max_size:
+            return
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+            self._discard(key)
+        if len(self._entries) > self.max_size:
+            oldest = sorted(self._entries, key=lambda key: self._entries[key][0])
+            for key in oldest[:len(self._entries) - self.max_size]:
+                self._discard(key)
+
+    def _discard(self, key):
+        del self._entries[key]
+        # Il contatore serve solo a un calcolo in corso: senza, la chiave viene dimenticata
+        if key not in self._loading:
+            self._generations.pop(key, None)
+
+    def invalidate(self, key):
+        """Scarta il valore della chiave: la prossima richiesta lo ricalcola."""
+        with self._lock:
+            self._entries.pop(key, None)
+            if key in self._loading:
+                # Il valore in calcolo non verrà memorizzato
+                self._generations[key] = self._generations.get(key, 0) + 1
+            else:
+                self._generations.pop(key, None)
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        """Restituisce le metriche della cache."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'entries': len(self._entries), 'ttl': self.ttl})
+        return stats
@@ -4,31 +4,118 @@
 # 2. Un'API per ricevere dati dal BOX
 # 3. Una dashboard web per visualizzare lo stato di sicurezza
 
-from flask import Flask, jsonify, request, render_template, redirect, url_for, flash, session
+from flask import Flask, Response, jsonify, request, render_template, redirect, url_for, flash, session
 import pymysql
 import os
 import json
-from datetime import datetime, timedelta
+import gzip
+import hashlib
+import ipaddress
+import threading
+from datetime import date, datetime, timedelta
 import time
+from dbpool import ConnectionPool, PoolTimeout
+from ingest import IngestQueue
+from livefeed import LiveFeed
+from migrations import apply_migrations
+from pagination import decode_cursor, parse_limit, parse_time, stream_json_page
+from partitions import PartitionManager
+from reportdb import DASHBOARD_QUERIES, DATA_DIR, DB_CONFIG, open_db_connection, store_reports
+from reportlog import SegmentLog
+from resultcache import ResultCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Configurazione
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.secret_key = 'security_dashboard_secret_key'  # Necessario per flash e session
+DEBUG = True  # Modalità debug di Flask (con il reloader)
+
+# Configurazione del pool di connessioni MySQL
+DB_POOL_CONFIG = {
+    'min_size': 2,  # Connessioni aperte all'avvio
+    'max_size': 20,  # Connessioni aperte al massimo
+    'max_lifetime': 3600,  # Secondi dopo i quali una connessione viene chiusa e riaperta
+    'wait_timeout': 5,  # Secondi di attesa massima di una connessione libera
+    'health_check_after': 5  # Secondi di inattività dopo i quali la connessione viene verificata con ping
+}
 
-# Configurazione MySQL
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'claudio',
-    'password': 'Superrapa22',
-    'db': 'security_system',
-    'charset': 'utf8mb4',
-    'cursorclass': pymysql.cursors.DictCursor
+# Numero massimo di modifiche restituite come delta: oltre si invia la lista completa
+BLOCKLIST_MAX_DELTA = 5000
+
+# Snapshot della lista IP: corpo JSON già codificato e compresso per la revisione corrente
+BLOCKLIST_SNAPSHOT_TTL = 5  # Secondi tra due verifiche della revisione nel database
+BLOCKLIST_DELTA_CACHE_SIZE = 32  # Delta codificati conservati per lo snapshot corrente
+COMPRESS_MIN_SIZE = 512  # Sotto questa dimensione il corpo non viene compresso
+BINARY_MIMETYPE = 'application/vnd.futuro.blocklist'  # Formato binario compatto della lista IP
+BINARY_MAGIC = b'FBL1'
+blocklist_snapshot = None
+blocklist_snapshot_lock = threading.Lock()
+
+# Archivio dei report ricevuti: log a segmenti nella directory DATA_DIR (vedi reportdb.py)
+REPORT_LOG_CONFIG = {
+    'max_segment_size': 64 * 1024 * 1024,  # Byte oltre i quali il segmento viene chiuso
+    'max_segment_age': 3600,  # Secondi oltre i quali il segmento viene chiuso
+    'compress': True  # Comprime con gzip i segmenti chiusi
+}
+report_log = SegmentLog(DATA_DIR, **REPORT_LOG_CONFIG)
+
+# Coda di ingestione dei report: spool su disco e scrittura a lotti in background
+SPOOL_DIR = "ingest_spool"
+INGEST_CONFIG = {
+    'max_queue': 1000,  # Report in attesa nella coda in memoria
+    'max_spool': 10000,  # Report nello spool oltre i quali si risponde 429
+    'workers': 4,  # Thread di scrittura nel database
+    'batch_size': 50,  # Report scritti al massimo in una transazione
+    'batch_wait': 0.5,  # Secondi di attesa per riempire un lotto
+    'max_attempts': 5,  # Tentativi prima di spostare un report in ingest_spool/failed
+    'retry_delay': 5  # Secondi tra due ricariche dei report rimasti nello spool
+}
+INGEST_RETRY_AFTER = 30  # Secondi suggeriti al BOX con la risposta 429
+
+# Partizioni per data delle tabelle dei report (vedi partitions.py) e loro conservazione
+PARTITION_CONFIG = {
+    'retention': {  # Giorni di conservazione per tabella (None: nessuna eliminazione)
+        'box_reports': 365,
+        'client_reports': 365,
+        'detected_devices': 90,
+        'ingested_reports': 30,  # Oltre un report non può più essere riscritto dallo spool
+        'serverfuturo.rilevazioni': 730
+    },
+    'ahead': 3,  # Partizioni future create in anticipo
+    'archive': False,  # Sposta le partizioni scadute in tabelle <tabella>_archive_<partizione> invece di eliminarle
+    'check_interval': 3600  # Secondi tra due controlli delle partizioni
 }
 
-# Directory per archiviare i dati ricevuti
-DATA_DIR = "data_received"
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
+# Cache dei dati della dashboard per BOX
+DASHBOARD_CACHE_CONFIG = {
+    'ttl': 10,  # Secondi di validità dei dati calcolati
+    'max_size': 1000  # BOX conservati al massimo
+}
+
+# Aggiornamenti in tempo reale della dashboard (Server-Sent Events)
+LIVE_FEED_CONFIG = {
+    'max_subscribers': 200,  # Browser collegati al massimo (ognuno occupa un thread)
+    'max_pending': 50,  # Eventi in attesa oltre i quali un browser lento viene scollegato
+    'keepalive': 15,  # Secondi tra due commenti di keepalive
+    'min_interval': 0.5  # Secondi minimi tra due invii: le notifiche ravvicinate vengono raggruppate
+}
+LIVE_FEED_RETRY_AFTER = 30  # Secondi suggeriti al browser con la risposta 503
+
+# API di consultazione dello storico (/api/boxes/<box_code>/...)
+HISTORY_PAGE_SIZE = 100  # Righe per pagina se limit non è indicato
+HISTORY_MAX_PAGE_SIZE = 1000  # Righe per pagina al massimo
+# Tabelle dell'attività del BOX: (tipo, tabella, colonna del tempo, colonne name, ip, threats_detected, ips_blocked)
+ACTIVITY_SOURCES = [
+    ('client_report', 'client_reports', 'timestamp',
+     "client_name as name, ip_private as ip, threats_detected, ips_blocked"),
+    # Nuovi dispositivi: la prima volta che compaiono nell'inventario
+    ('device_detected', 'device_inventory', 'first_seen',
+     "device_name as name, ip_address as ip, 0 as threats_detected, 0 as ips_blocked")
+]
 
 # Crea le cartelle per i template e gli static se non esistono
 if not os.path.exists('templates'):
@@ -37,23 +124,33 @@ if not os.path.exists('static'):
     os.makedirs('static')
 
 
+# Pool di connessioni condiviso da tutte le richieste
+db_pool = ConnectionPool(open_db_connection, **DB_POOL_CONFIG)
+
+
 def get_db_connection():
-    """Ottiene una connessione al database."""
+    """Ottiene una connessione al database dal pool.
+
+    close() restituisce la connessione al pool invece di chiuderla.
+    """
     try:
-        connection = pymysql.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            db=DB_CONFIG['db'],
-            charset=DB_CONFIG['charset'],
-            cursorclass=DB_CONFIG['cursorclass']
-        )
-        return connection
+        return db_pool.acquire()
     except Exception as e:
         print(f"Errore nella connessione al database: {e}")
         return None
 
 
+# Manutenzione delle partizioni: crea quelle future ed elimina quelle oltre la retention
+partition_manager = PartitionManager(get_db_connection, **PARTITION_CONFIG)
+
+
+@app.before_request
+def start_partition_manager():
+    # Il thread parte alla prima richiesta, come la coda di ingestione: con il
+    # reloader di Flask gira solo nel processo che serve l'API, non anche nel processo padre
+    partition_manager.start()
+
+
 def create_database_if_not_exists():
     """Verifica che il database esista e lo crea se necessario."""
     try:
@@ -79,37 +176,280 @@ def create_database_if_not_exists():
         return False
 
 
+def get_blocklist_revision(cursor):
+    """Restituisce revisione corrente, revisione più vecchia e data dell'ultima modifica della lista IP."""
+    cursor.execute("SELECT COALESCE(MAX(revision), 0) as revision, COALESCE(MIN(revision), 0) as oldest, "
+                   "MAX(changed_at) as last_modified FROM blocklist_changes")
+    result = cursor.fetchone()
+    return result['revision'], result['oldest'], result['last_modified']
+
+
+def compute_blocklist_etag(ips):
+    """Calcola l'ETag della lista IP come hash del contenuto, indipendente dall'ordine."""
+    return hashlib.sha256("\n".join(sorted(ips)).encode()).hexdigest()[:32]
+
+
+def is_not_modified(etag, last_modified):
+    """Verifica If-None-Match / If-Modified-Since della richiesta (If-None-Match ha la precedenza).
+
+    L'ETag è debole: indica il contenuto della lista, non i byte di una rappresentazione.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return int(last_modified.astimezone().timestamp()) <= int(request.if_modified_since.timestamp())
+    return False
+
+
+def set_cache_headers(response, etag, last_modified):
+    """Aggiunge ETag e Last-Modified alla risposta.
+
+    Lo stesso contenuto della lista viene servito in più rappresentazioni (JSON o binaria,
+    completa o delta): l'ETag è quindi debole e la risposta, anche 304, varia con Accept.
+    """
+    response.vary.add('Accept')
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified.astimezone()
+    return response
+
+
+def get_blocklist_delta(cursor, since, until):
+    """Calcola le aggiunte e le rimozioni avvenute tra le revisioni since e until.
+
+    Restituisce None se il delta non è disponibile o è troppo grande e va inviata la lista completa.
+    """
+    cursor.execute("SELECT COUNT(*) as count FROM blocklist_changes WHERE revision > %s AND revision <= %s",
+                   (since, until))
+    if cursor.fetchone()['count'] > BLOCKLIST_MAX_DELTA:
+        return None
+
+    cursor.execute(
+        "SELECT ip_address, action FROM blocklist_changes WHERE revision > %s AND revision <= %s "
+        "ORDER BY revision",
+        (since, until)
+    )
+
+    # Per ogni IP conta solo l'ultima modifica
+    last_action = {}
+    for row in cursor.fetchall():
+        last_action[row['ip_address']] = row['action']
+
+    added = [ip for ip, action in last_action.items() if action == 'add']
+    removed = [ip for ip, action in last_action.items() if action == 'remove']
+    return added, removed
+
+
+def parse_networks(ips):
+    """Converte gli IP e i range CIDR testuali in tuple (versione, indirizzo di rete, prefisso)."""
+    networks = set()
+    for ip in ips:
+        try:
+            network = ipaddress.ip_network(str(ip).strip(), strict=False)
+        except ValueError:
+            continue
+        value, prefix = int(network.network_address), network.prefixlen
+        # Gli indirizzi IPv4-mapped vengono inviati come IPv4
+        if network.version == 6 and prefix == 128 and value >> 32 == 0xFFFF:
+            networks.add((4, value & 0xFFFFFFFF, 32))
+        else:
+            networks.add((network.version, value, prefix))
+    return networks
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_networks(out, networks):
+    """Scrive una sezione di reti: per ogni versione il numero di voci e gli indirizzi ordinati
+    come differenze varint. Il bit basso indica se segue un byte con la lunghezza del prefisso."""
+    for version, width in ((4, 32), (6, 128)):
+        entries = sorted((value, prefix) for v, value, prefix in networks if v == version)
+        _write_varint(out, len(entries))
+        previous = 0
+        for value, prefix in entries:
+            if prefix == width:
+                _write_varint(out, (value - previous) << 1)
+            else:
+                _write_varint(out, (value - previous) << 1 | 1)
+                out.append(prefix)
+            previous = value
+
+
+def encode_blocklist(revision, full, *sections):
+    """Codifica la lista nel formato binario compatto.
+
+    Con full=True la sezione è la lista completa, altrimenti le sezioni sono aggiunti e rimossi.
+    """
+    out = bytearray(BINARY_MAGIC)
+    _write_varint(out, revision)
+    out.append(1 if full else 0)
+    for networks in sections:
+        _write_networks(out, parse_networks(networks))
+    return bytes(out)
+
+
+def compress_variants(body):
+    """Prepara le versioni compresse di un corpo già codificato."""
+    variants = {'identity': body}
+    if len(body) >= COMPRESS_MIN_SIZE:
+        variants['gzip'] = gzip.compress(body, compresslevel=6)
+        if brotli is not None:
+            variants['br'] = brotli.compress(body)
+    return variants
+
+
+def encode_variants(payload, binary):
+    """Codifica il payload in JSON e nel formato binario una sola volta, con le versioni compresse."""
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    return {'application/json': compress_variants(body), BINARY_MIMETYPE: compress_variants(binary)}
+
+
+def build_blocklist_snapshot(revision, oldest, last_modified, ips):
+    """Costruisce lo snapshot della lista completa per una revisione."""
+    timestamp = datetime.now().isoformat()
+    return {
+        'revision': revision,
+        'oldest': oldest,
+        'last_modified': last_modified,
+        'timestamp': timestamp,
+        'etag': compute_blocklist_etag(ips),
+        'full': encode_variants({
+            "status": "success",
+            "timestamp": timestamp,
+            "revision": revision,
+            "full": True,
+            "data": ips
+        }, encode_blocklist(revision, True, ips)),
+        'deltas': {},  # since -> formati codificati del delta, o None se va inviata la lista completa
+        'checked_at': time.monotonic()
+    }
+
+
+def get_blocklist_snapshot():
+    """Restituisce lo snapshot corrente, ricostruendolo solo se la revisione è cambiata.
+
+    La revisione viene verificata sul database al massimo ogni BLOCKLIST_SNAPSHOT_TTL secondi.
+    """
+    global blocklist_snapshot
+
+    snapshot = blocklist_snapshot
+    if snapshot and time.monotonic() - snapshot['checked_at'] < BLOCKLIST_SNAPSHOT_TTL:
+        return snapshot
+
+    with blocklist_snapshot_lock:
+        # Un'altra richiesta potrebbe aver già aggiornato lo snapshot
+        snapshot = blocklist_snapshot
+        if snapshot and time.monotonic() - snapshot['checked_at'] < BLOCKLIST_SNAPSHOT_TTL:
+            return snapshot
+
+        conn = get_db_connection()
+        if not conn:
+            raise ConnectionError("Impossibile connettersi al database")
+        try:
+            with conn.cursor() as cursor:
+                revision, oldest, last_modified = get_blocklist_revision(cursor)
+                if snapshot and snapshot['revision'] == revision:
+                    snapshot = dict(snapshot, oldest=oldest, checked_at=time.monotonic())
+                else:
+                    # Esegue query al database MySQL per ottenere gli IP da bloccare
+                    cursor.execute("SELECT ip_address FROM blocked_ips WHERE active = 1")
+                    ips = [row['ip_address'] for row in cursor.fetchall()]
+                    snapshot = build_blocklist_snapshot(revision, oldest, last_modified, ips)
+                    print(f"Snapshot della lista IP ricostruito (revisione {revision}, {len(ips)} IP)")
+        finally:
+            conn.close()
+
+        blocklist_snapshot = snapshot
+        return snapshot
+
+
+def get_delta_variants(snapshot, since):
+    """Restituisce il delta codificato dalla revisione since a quella dello snapshot.
+
+    Restituisce None se va inviata la lista completa.
+    """
+    deltas = snapshot['deltas']
+    if since in deltas:
+        return deltas[since]
+
+    if since == snapshot['revision']:
+        delta = [], []
+    else:
+        conn = get_db_connection()
+        if not conn:
+            raise ConnectionError("Impossibile connettersi al database")
+        try:
+            with conn.cursor() as cursor:
+                delta = get_blocklist_delta(cursor, since, snapshot['revision'])
+        finally:
+            conn.close()
+
+    variants = None
+    if delta is not None:
+        added, removed = delta
+        variants = encode_variants({
+            "status": "success",
+            "timestamp": snapshot['timestamp'],
+            "revision": snapshot['revision'],
+            "full": False,
+            "added": added,
+            "removed": removed
+        }, encode_blocklist(snapshot['revision'], False, added, removed))
+
+    with blocklist_snapshot_lock:
+        if len(deltas) >= BLOCKLIST_DELTA_CACHE_SIZE:
+            deltas.pop(next(iter(deltas)))
+        deltas[since] = variants
+    return variants
+
+
+def encoded_response(formats):
+    """Risponde con la versione già codificata più adatta agli header Accept e Accept-Encoding.
+
+    Il formato binario viene usato solo se richiesto esplicitamente, altrimenti JSON.
+    """
+    mimetype = request.accept_mimetypes.best_match(['application/json', BINARY_MIMETYPE]) or 'application/json'
+    variants = formats[mimetype]
+    encoding = request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in variants])
+    response = app.response_class(variants[encoding or 'identity'], mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept')
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 # API per la lista di IP da bloccare
 @app.route('/api/blocklist', methods=['GET'])
 def get_block_list():
     """
     API che fornisce la lista di IP da bloccare.
     Il BOX chiama questa API ogni 24 ore.
+    Con il parametro since=<revisione> restituisce solo le modifiche successive.
+    Supporta le richieste condizionali con If-None-Match e If-Modified-Since.
+    Il corpo viene servito dallo snapshot in memoria, compresso con gzip o brotli se richiesto.
+    Con Accept: application/vnd.futuro.blocklist risponde nel formato binario compatto.
     """
     try:
-        # Ottiene una connessione al database
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({
-                "status": "error",
-                "timestamp": datetime.now().isoformat(),
-                "message": "Impossibile connettersi al database"
-            }), 500
+        since = request.args.get('since', type=int)
+        snapshot = get_blocklist_snapshot()
+        etag, last_modified = snapshot['etag'], snapshot['last_modified']
 
-        # Esegue query al database MySQL per ottenere gli IP da bloccare
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT ip_address FROM blocked_ips WHERE active = 1")
-            results = cursor.fetchall()
-            blocked_ips = [row['ip_address'] for row in results]
+        if is_not_modified(etag, last_modified):
+            return set_cache_headers(app.response_class(status=304), etag, last_modified)
 
-        conn.close()
+        # Delta solo se la revisione del BOX è ancora coperta dal registro delle modifiche
+        variants = None
+        if since is not None and snapshot['oldest'] - 1 <= since <= snapshot['revision']:
+            variants = get_delta_variants(snapshot, since)
 
         # Risponde con la lista degli IP
-        return jsonify({
-            "status": "success",
-            "timestamp": datetime.now().isoformat(),
-            "data": blocked_ips
-        })
+        return set_cache_headers(encoded_response(variants or snapshot['full']), etag, last_modified)
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -118,12 +458,92 @@ def get_block_list():
         }), 500
 
 
+def claim_reports(cursor, records):
+    """Registra in ingested_reports, nella transazione della scrittura, gli id dei report
+    del lotto e restituisce solo quelli non ancora scritti.
+
+    Un lotto riscritto dopo un arresto tra il commit e la rimozione dallo spool non
+    viene inserito due volte (né sommato due volte nelle aggregazioni). I report senza
+    id (spool di versioni precedenti) vengono sempre scritti.
+    """
+    keys = [(record['id'], datetime.fromisoformat(record['timestamp'])) for record in records if record.get('id')]
+    if not keys:
+        return records
+    cursor.execute(
+        "SELECT report_id FROM ingested_reports WHERE (report_id, received_at) IN "
+        f"({', '.join(['(%s, %s)'] * len(keys))})",
+        [value for key in keys for value in key]
+    )
+    written = {row['report_id'] for row in cursor.fetchall()}
+    if written:
+        print(f"Ignorati {len(written)} report già scritti nel database")
+    cursor.executemany(
+        "INSERT INTO ingested_reports (report_id, received_at) VALUES (%s, %s)",
+        [key for key in keys if key[0] not in written]
+    )
+    return [record for record in records if not record.get('id') or record['id'] not in written]
+
+
+def write_report_batch(records):
+    """Scrive nel database, in una transazione, un lotto di report presi dalla coda di ingestione."""
+    conn = get_db_connection()
+    if not conn:
+        raise ConnectionError("Impossibile connettersi al database")
+    try:
+        with conn.cursor() as cursor:
+            records = claim_reports(cursor, records)
+            store_reports(cursor, [(record['data']['box_code'], record['data'],
+                                    datetime.fromisoformat(record['timestamp'])) for record in records])
+        conn.commit()
+    finally:
+        conn.close()
+
+    # Archivia nel log a segmenti solo i report confermati nel database: l'archivio
+    # non contiene report rifiutati (e poi reinviati dal BOX) né finiti in spool/failed.
+    # Un errore qui non deve far riscrivere il lotto, già confermato.
+    for record in records:
+        try:
+            report_log.append(record, record['data']['box_code'], record['timestamp'])
+        except Exception as e:
+            print(f"Errore nell'archiviazione del report del BOX {record['data']['box_code']}: {e}")
+
+    # I dati della dashboard dei BOX del lotto non sono più aggiornati: i browser collegati li ricevono
+    for box_code in {record['data']['box_code'] for record in records}:
+        dashboard_cache.invalidate(box_code)
+        live_feed.notify(box_code)
+
+
+# Errori MySQL di connessione persa o risorsa temporaneamente occupata
+DB_OUTAGE_ERROR_CODES = {
+    1040,  # Too many connections
+    1205,  # Lock wait timeout
+    1213,  # Deadlock
+    2002, 2003,  # Server non raggiungibile
+    2006,  # MySQL server has gone away
+    2013,  # Lost connection during query
+    2055  # Lost connection (errore di sistema)
+}
+
+
+def is_db_outage(e):
+    """Indica se l'errore è dovuto al database non disponibile e non al contenuto del report."""
+    if isinstance(e, (ConnectionError, PoolTimeout, pymysql.err.InterfaceError)):
+        return True
+    return isinstance(e, pymysql.err.OperationalError) and bool(e.args) and e.args[0] in DB_OUTAGE_ERROR_CODES
+
+
+# Coda di ingestione: i thread di scrittura partono alla prima richiesta, nel processo che serve l'API
+ingest_queue = IngestQueue(write_report_batch, SPOOL_DIR, is_outage=is_db_outage, **INGEST_CONFIG)
+
+
 # API per ricevere i report dal BOX
 @app.route('/api/report', methods=['POST'])
 def receive_report():
     """
     API che riceve dati dal BOX.
     Il BOX invia dati di rete e informazioni sui dispositivi connessi.
+    Il report viene accodato e scritto nel database in background: risponde 202,
+    oppure 429 se la coda di ingestione è piena.
     """
     try:
         data = request.json
@@ -135,84 +555,22 @@ def receive_report():
                 "message": "Missing required data"
             }), 400
 
-        # Salva i dati ricevuti in un file JSON con timestamp
-        timestamp = datetime.now().isoformat().replace(':', '-')
-        box_code = data.get('box_code')
-        filename = f"{DATA_DIR}/box_{box_code}_{timestamp}.json"
-
-        with open(filename, 'w') as f:
-            json.dump({
-                "timestamp": datetime.now().isoformat(),
-                "data": data
-            }, f, indent=4)
-
-        # Ottiene una connessione al database
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({
-                "status": "success",
+        # Accoda il report per la scrittura nel database (e l'archiviazione nel log a segmenti)
+        record = {"timestamp": datetime.now().isoformat(), "data": data}
+        if not ingest_queue.submit(record):
+            response = jsonify({
+                "status": "error",
                 "timestamp": datetime.now().isoformat(),
-                "message": "Data received and stored in file only (database connection failed)"
+                "message": "Ingest queue full, retry later"
             })
-
-        # Salva i dati nel database
-        with conn.cursor() as cursor:
-            # Salva informazioni sul BOX
-            box_data = data.get('box_data', {})
-            cursor.execute(
-                "INSERT INTO box_reports (box_code, device_name, ip_private, ip_public, mac_address, latency, timestamp) "
-                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                (
-                    box_code,
-                    box_data.get('device_name', ''),
-                    box_data.get('ip_private', ''),
-                    box_data.get('ip_public', ''),
-                    box_data.get('mac_address', ''),
-                    box_data.get('latency', 0),
-                    datetime.now()
-                )
-            )
-
-            # Salva informazioni sui dispositivi rilevati
-            devices = data.get('devices', [])
-            for device in devices:
-                cursor.execute(
-                    "INSERT INTO detected_devices (box_code, device_name, ip_address, mac_address, timestamp) "
-                    "VALUES (%s, %s, %s, %s, %s)",
-                    (
-                        box_code,
-                        device.get('name', ''),
-                        device.get('ip', ''),
-                        device.get('mac', ''),
-                        datetime.now()
-                    )
-                )
-
-            # Salva informazioni dai client
-            client_reports = data.get('client_reports', [])
-            for report in client_reports:
-                cursor.execute(
-                    "INSERT INTO client_reports (box_code, client_name, ip_private, mac_address, threats_detected, ips_blocked, timestamp) "
-                    "VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                    (
-                        box_code,
-                        report.get('name', ''),
-                        report.get('ip_priv', ''),
-                        report.get('MAC', ''),
-                        report.get('minacce', 0),
-                        report.get('ip_bloccati', 0),
-                        datetime.now()
-                    )
-                )
-
-        conn.commit()
-        conn.close()
+            response.headers['Retry-After'] = str(INGEST_RETRY_AFTER)
+            return response, 429
 
         return jsonify({
             "status": "success",
             "timestamp": datetime.now().isoformat(),
-            "message": "Data received and stored"
-        })
+            "message": "Data received and queued"
+        }), 202
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -249,15 +607,16 @@ def dashboard():
             flash('Errore di connessione al database')
             return redirect(url_for('home'))
 
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT COUNT(*) as count FROM box_reports WHERE box_code = %s", (box_code,))
-            result = cursor.fetchone()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) as count FROM box_reports WHERE box_code = %s", (box_code,))
+                result = cursor.fetchone()
+        finally:
+            conn.close()
 
-            if result['count'] == 0:
-                flash('Codice BOX non trovato nel sistema')
-                return redirect(url_for('home'))
-
-        conn.close()
+        if result['count'] == 0:
+            flash('Codice BOX non trovato nel sistema')
+            return redirect(url_for('home'))
     elif 'box_code' in session:
         box_code = session['box_code']
     else:
@@ -278,6 +637,281 @@ def dashboard_api(box_code):
     return jsonify(dashboard_data)
 
 
+# API di consultazione dello storico del BOX (paginazione a cursore)
+
+def history_args(cursor_size):
+    """Legge dalla richiesta i filtri since/until, il limite e il cursore. Solleva ValueError se non validi."""
+    return (parse_time(request.args.get('since')),
+            parse_time(request.args.get('until')),
+            parse_limit(request.args.get('limit'), HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE),
+            decode_cursor(request.args.get('cursor'), cursor_size))
+
+
+def history_conditions(box_code, since, until, column='timestamp'):
+    """Condizioni comuni: BOX e intervallo since <= column < until."""
+    conditions = ["box_code = %s", f"{column} IS NOT NULL"]
+    params = [box_code]
+    if since:
+        conditions.append(f"{column} >= %s")
+        params.append(since)
+    if until:
+        conditions.append(f"{column} < %s")
+        params.append(until)
+    return conditions, params
+
+
+def keyset_condition(timestamp, row_id, include_equal=False, column='timestamp'):
+    """Condizione sulle righe che seguono (column, id) in ordine decrescente."""
+    if include_equal:
+        return f"{column} <= %s", [timestamp]
+    return f"({column} < %s OR ({column} = %s AND id < %s))", [timestamp, timestamp, row_id]
+
+
+def stream_history(sql, params, limit, cursor_key):
+    """Esegue la query con un cursore non bufferizzato e restituisce la pagina JSON in streaming."""
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({
+            "status": "error",
+            "timestamp": datetime.now().isoformat(),
+            "message": "Errore di connessione al database"
+        }), 503
+
+    cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+    try:
+        cursor.execute(sql, params)
+    except Exception:
+        cursor.close()
+        conn.close()
+        raise
+
+    def close():
+        # Chiamata al termine della risposta, anche se il client si disconnette prima
+        try:
+            cursor.close()
+        finally:
+            conn.close()
+
+    response = Response(stream_json_page(cursor, limit, cursor_key), mimetype='application/json')
+    response.call_on_close(close)
+    return response
+
+
+def history_error(e, status):
+    return jsonify({
+        "status": "error",
+        "timestamp": datetime.now().isoformat(),
+        "message": str(e)
+    }), status
+
+
+# Storico dei dispositivi rilevati dal BOX
+@app.route('/api/boxes/<box_code>/devices')
+def box_devices_history(box_code):
+    """
+    API che restituisce i singoli rilevamenti dei dispositivi del BOX, dal più recente.
+    Con STORE_DEVICE_SIGHTINGS disattivato resta solo lo storico già registrato.
+    Parametri: since e until (ISO 8601), limit, cursor (next_cursor della pagina precedente).
+    """
+    try:
+        since, until, limit, key = history_args(2)
+    except ValueError as e:
+        return history_error(e, 400)
+
+    try:
+        conditions, params = history_conditions(box_code, since, until)
+        if key:
+            condition, key_params = keyset_condition(*key)
+            conditions.append(condition)
+            params.extend(key_params)
+        sql = f"""
+            SELECT id, device_name, ip_address, mac_address, timestamp
+            FROM detected_devices
+            WHERE {' AND '.join(conditions)}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT %s
+        """
+        return stream_history(sql, params + [limit], limit, lambda row: (row['timestamp'], row['id']))
+    except Exception as e:
+        return history_error(e, 500)
+
+
+# Inventario dei dispositivi del BOX
+@app.route('/api/boxes/<box_code>/inventory')
+def box_device_inventory(box_code):
+    """
+    API che restituisce l'inventario dei dispositivi del BOX (uno per riga), dal visto più di recente.
+    Parametri: since e until (ISO 8601, su last_seen), limit, cursor (next_cursor della pagina precedente).
+    """
+    try:
+        since, until, limit, key = history_args(2)
+    except ValueError as e:
+        return history_error(e, 400)
+
+    try:
+        conditions, params = history_conditions(box_code, since, until, 'last_seen')
+        if key:
+            condition, key_params = keyset_condition(*key, column='last_seen')
+            conditions.append(condition)
+            params.extend(key_params)
+        sql = f"""
+            SELECT id, device_name, ip_address, mac_address, first_seen, last_seen, seen_count
+            FROM device_inventory
+            WHERE {' AND '.join(conditions)}
+            ORDER BY last_seen DESC, id DESC
+            LIMIT %s
+        """
+        return stream_history(sql, params + [limit], limit, lambda row: (row['last_seen'], row['id']))
+    except Exception as e:
+        return history_error(e, 500)
+
+
+# Storico dei report dei client del BOX
+@app.route('/api/boxes/<box_code>/clients')
+def box_clients_history(box_code):
+    """
+    API che restituisce i report dei client del BOX, dal più recente.
+    Parametri: since e until (ISO 8601), limit, cursor (next_cursor della pagina precedente).
+    """
+    try:
+        since, until, limit, key = history_args(2)
+    except ValueError as e:
+        return history_error(e, 400)
+
+    try:
+        conditions, params = history_conditions(box_code, since, until)
+        if key:
+            condition, key_params = keyset_condition(*key)
+            conditions.append(condition)
+            params.extend(key_params)
+        sql = f"""
+            SELECT id, client_name, ip_private, mac_address, threats_detected, ips_blocked, timestamp
+            FROM client_reports
+            WHERE {' AND '.join(conditions)}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT %s
+        """
+        return stream_history(sql, params + [limit], limit, lambda row: (row['timestamp'], row['id']))
+    except Exception as e:
+        return history_error(e, 500)
+
+
+# Storico dell'attività del BOX: report dei client e dispositivi rilevati insieme
+@app.route('/api/boxes/<box_code>/activity')
+def box_activity_history(box_code):
+    """
+    API che restituisce l'attività del BOX (report dei client e dispositivi rilevati), dalla più recente.
+    Parametri: since e until (ISO 8601), limit, cursor (next_cursor della pagina precedente).
+    L'ordine è (timestamp, tipo, id) decrescente; ogni tabella contribuisce al più limit righe.
+    """
+    try:
+        since, until, limit, key = history_args(3)
+    except ValueError as e:
+        return history_error(e, 400)
+
+    try:
+        branches, params = [], []
+        for activity_type, table, column, columns in ACTIVITY_SOURCES:
+            conditions, branch_params = history_conditions(box_code, since, until, column)
+            if key:
+                timestamp, key_type, row_id = key
+                if activity_type > key_type:
+                    # A parità di timestamp queste righe precedono il cursore
+                    condition, key_params = f"{column} < %s", [timestamp]
+                else:
+                    condition, key_params = keyset_condition(timestamp, row_id, activity_type < key_type, column)
+                conditions.append(condition)
+                branch_params.extend(key_params)
+            branches.append(f"""
+                (SELECT '{activity_type}' as type, id, {columns}, {column} as timestamp
+                 FROM {table}
+                 WHERE {' AND '.join(conditions)}
+                 ORDER BY {column} DESC, id DESC
+                 LIMIT %s)
+            """)
+            params.extend(branch_params + [limit])
+
+        sql = f"""
+            SELECT * FROM ({' UNION ALL '.join(branches)}) as activity
+            ORDER BY timestamp DESC, type DESC, id DESC
+            LIMIT %s
+        """
+        return stream_history(sql, params + [limit], limit,
+                              lambda row: (row['timestamp'], row['type'], row['id']))
+    except Exception as e:
+        return history_error(e, 500)
+
+
+# Canale Server-Sent Events con gli aggiornamenti della dashboard
+@app.route('/api/dashboard/<box_code>/events')
+def dashboard_events(box_code):
+    """
+    Canale Server-Sent Events per la dashboard del BOX.
+    Il primo evento contiene tutti i dati, i successivi solo le sezioni cambiate
+    quando arrivano nuovi report del BOX.
+    """
+    subscriber = live_feed.subscribe(box_code)
+    if subscriber is None:
+        response = jsonify({
+            "status": "error",
+            "timestamp": datetime.now().isoformat(),
+            "message": "Too many live connections, retry later"
+        })
+        response.headers['Retry-After'] = str(LIVE_FEED_RETRY_AFTER)
+        return response, 503
+
+    response = Response(live_feed.stream(box_code, subscriber), mimetype='text/event-stream')
+    # Libera il posto anche se la connessione si chiude prima che lo stream inizi
+    response.call_on_close(lambda: live_feed.unsubscribe(box_code, subscriber))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Evita il buffering di un eventuale proxy nginx
+    return response
+
+
+# API per le metriche dei canali in tempo reale
+@app.route('/api/live_feed')
+def live_feed_stats():
+    """API che restituisce le metriche dei canali in tempo reale della dashboard."""
+    return jsonify({
+        "status": "success",
+        "timestamp": datetime.now().isoformat(),
+        "live_feed": live_feed.stats()
+    })
+
+
+# API per le metriche del pool di connessioni al database
+@app.route('/api/db_pool')
+def db_pool_stats():
+    """API che restituisce le metriche del pool di connessioni MySQL."""
+    return jsonify({
+        "status": "success",
+        "timestamp": datetime.now().isoformat(),
+        "pool": db_pool.stats()
+    })
+
+
+# API per le metriche della coda di ingestione dei report
+@app.route('/api/ingest')
+def ingest_stats():
+    """API che restituisce le metriche della coda di ingestione dei report."""
+    return jsonify({
+        "status": "success",
+        "timestamp": datetime.now().isoformat(),
+        "ingest": ingest_queue.stats()
+    })
+
+
+# API per le metriche della cache dei dati della dashboard
+@app.route('/api/dashboard_cache')
+def dashboard_cache_stats():
+    """API che restituisce le metriche della cache dei dati della dashboard."""
+    return jsonify({
+        "status": "success",
+        "timestamp": datetime.now().isoformat(),
+        "cache": dashboard_cache.stats()
+    })
+
+
 # Rimuove il codice BOX dalla sessione
 @app.route('/logout')
 def logout():
@@ -287,15 +921,22 @@ def logout():
     return redirect(url_for('home'))
 
 
-# Raccoglie tutti i dati necessari per la dashboard
-def get_dashboard_data(box_code):
-    """Raccoglie tutti i dati necessari per la dashboard."""
+def _isoformat_row(row):
+    """Converte in stringhe ISO le date di una riga."""
+    for key, value in row.items():
+        if isinstance(value, (datetime, date)):
+            row[key] = value.isoformat()
+    return row
+
+
+def query_dashboard_data(box_code):
+    """Esegue le query della dashboard in un solo round-trip e ne assembla il risultato.
+
+    Solleva un'eccezione se il database non è raggiungibile o una query fallisce.
+    """
     conn = get_db_connection()
     if not conn:
-        return {
-            'error': 'Errore di connessione al database',
-            'timestamp': datetime.now().isoformat()
-        }
+        raise ConnectionError('Errore di connessione al database')
 
     data = {
         'box_info': {},
@@ -307,141 +948,117 @@ def get_dashboard_data(box_code):
         'timestamp': datetime.now().isoformat()
     }
 
+    sql = ';\n'.join(query for _, query, _ in DASHBOARD_QUERIES)
+    params = [box_code] * sum(count for _, _, count in DASHBOARD_QUERIES)
     try:
         with conn.cursor() as cursor:
-            # Informazioni sul BOX
-            cursor.execute("""
-                SELECT device_name, ip_private, ip_public, mac_address, latency, timestamp
-                FROM box_reports 
-                WHERE box_code = %s 
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            """, (box_code,))
-            box_info = cursor.fetchone()
-            if box_info:
-                data['box_info'] = box_info
-                # Converti la data in formato stringa ISO
-                if 'timestamp' in box_info and box_info['timestamp']:
-                    data['box_info']['timestamp'] = box_info['timestamp'].isoformat()
-
-            # Stato di sicurezza (totali)
-            cursor.execute("""
-                SELECT 
-                    COUNT(DISTINCT id) as total_reports,
-                    SUM(threats_detected) as total_threats,
-                    SUM(ips_blocked) as total_blocked
-                FROM client_reports 
-                WHERE box_code = %s
-            """, (box_code,))
-            security_stats = cursor.fetchone()
-            if security_stats:
-                data['security_status'] = security_stats
-
-            # Ultimo aggiornamento
-            cursor.execute("""
-                SELECT MAX(timestamp) as last_update
-                FROM (
-                    SELECT MAX(timestamp) as timestamp FROM box_reports WHERE box_code = %s
-                    UNION
-                    SELECT MAX(timestamp) as timestamp FROM client_reports WHERE box_code = %s
-                    UNION
-                    SELECT MAX(timestamp) as timestamp FROM detected_devices WHERE box_code = %s
-                ) as updates
-            """, (box_code, box_code, box_code))
-            last_update = cursor.fetchone()
-            if last_update and last_update['last_update']:
-                data['last_update'] = last_update['last_update'].isoformat()
-
-            # Dispositivi connessi
-            cursor.execute("""
-                SELECT device_name, ip_address, mac_address, timestamp
-                FROM detected_devices 
-                WHERE box_code = %s 
-                ORDER BY timestamp DESC
-                LIMIT 50
-            """, (box_code,))
-            devices = cursor.fetchall()
-            for device in devices:
-                if 'timestamp' in device and device['timestamp']:
-                    device['timestamp'] = device['timestamp'].isoformat()
-                data['connected_devices'].append(device)
-
-            # Statistiche dei client
-            cursor.execute("""
-                SELECT 
-                    client_name,
-                    ip_private,
-                    mac_address,
-                    SUM(threats_detected) as threats_detected,
-                    SUM(ips_blocked) as ips_blocked,
-                    MAX(timestamp) as last_report
-                FROM client_reports 
-                WHERE box_code = %s 
-                GROUP BY client_name, ip_private, mac_address
-                ORDER BY MAX(timestamp) DESC
-            """, (box_code,))
-            client_stats = cursor.fetchall()
-            for client in client_stats:
-                if 'last_report' in client and client['last_report']:
-                    client['last_report'] = client['last_report'].isoformat()
-                data['client_stats'].append(client)
-
-            # Storico delle minacce (ultimi 7 giorni)
-            cursor.execute("""
-                SELECT 
-                    DATE(timestamp) as date,
-                    SUM(threats_detected) as threats_detected,
-                    SUM(ips_blocked) as ips_blocked
-                FROM client_reports 
-                WHERE box_code = %s AND timestamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-                GROUP BY DATE(timestamp)
-                ORDER BY date DESC
-            """, (box_code,))
-            threats_history = cursor.fetchall()
-            for day in threats_history:
-                if 'date' in day and day['date']:
-                    day['date'] = day['date'].isoformat()
-                data['threats_history'].append(day)
-
-            # Attività recente (ultimi 20 report)
-            cursor.execute("""
-                SELECT 
-                    'client_report' as type,
-                    client_name as name,
-                    ip_private as ip,
-                    threats_detected,
-                    ips_blocked,
-                    timestamp
-                FROM client_reports 
-                WHERE box_code = %s
-                UNION
-                SELECT 
-                    'device_detected' as type,
-                    device_name as name,
-                    ip_address as ip,
-                    0 as threats_detected,
-                    0 as ips_blocked,
-                    timestamp
-                FROM detected_devices 
-                WHERE box_code = %s
-                ORDER BY timestamp DESC
-                LIMIT 20
-            """, (box_code, box_code))
-            recent_activity = cursor.fetchall()
-            for activity in recent_activity:
-                if 'timestamp' in activity and activity['timestamp']:
-                    activity['timestamp'] = activity['timestamp'].isoformat()
-                data['recent_activity'].append(activity)
-    except Exception as e:
-        data['error'] = str(e)
+            cursor.execute(sql, params)
+            for i, (section, _, _) in enumerate(DASHBOARD_QUERIES):
+                if i:
+                    cursor.nextset()
+                rows = [_isoformat_row(row) for row in cursor.fetchall()]
+                if section == 'last_update':
+                    if rows and rows[0]['last_update']:
+                        data['last_update'] = rows[0]['last_update']
+                elif isinstance(data[section], list):
+                    data[section] = rows
+                elif rows:
+                    data[section] = rows[0]
     finally:
         conn.close()
 
     return data
 
 
+# Dati della dashboard per box_code, invalidati quando arrivano nuovi report del BOX
+dashboard_cache = ResultCache(query_dashboard_data, **DASHBOARD_CACHE_CONFIG)
+
+
+# Raccoglie tutti i dati necessari per la dashboard
+def get_dashboard_data(box_code):
+    """Raccoglie tutti i dati necessari per la dashboard (dalla cache se ancora validi)."""
+    try:
+        return dashboard_cache.get(box_code)
+    except ConnectionError as e:
+        return {
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }
+    except Exception as e:
+        return {
+            'box_info': {},
+            'security_status': {},
+            'connected_devices': [],
+            'client_stats': [],
+            'threats_history': [],
+            'recent_activity': [],
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }
+
+
+# Canali in tempo reale della dashboard: il thread di invio parte al primo browser collegato
+live_feed = LiveFeed(get_dashboard_data, **LIVE_FEED_CONFIG)
+
+
 # Funzioni di inizializzazione
 
+# Trigger che registrano in blocklist_changes ogni modifica a blocked_ips
+BLOCKLIST_TRIGGERS = {
+    'blocked_ips_after_insert': '''
+        CREATE TRIGGER blocked_ips_after_insert AFTER INSERT ON blocked_ips
+        FOR EACH ROW
+        BEGIN
+            IF NEW.active THEN
+                INSERT INTO blocklist_changes (ip_address, action) VALUES (NEW.ip_address, 'add');
+            END IF;
+        END
+    ''',
+    'blocked_ips_after_update': '''
+        CREATE TRIGGER blocked_ips_after_update AFTER UPDATE ON blocked_ips
+        FOR EACH ROW
+        BEGIN
+            IF OLD.active AND (NOT NEW.active OR OLD.ip_address <> NEW.ip_address) THEN
+                INSERT INTO blocklist_changes (ip_address, action) VALUES (OLD.ip_address, 'remove');
+            END IF;
+            IF NEW.active AND (NOT OLD.active OR OLD.ip_address <> NEW.ip_address) THEN
+                INSERT INTO blocklist_changes (ip_address, action) VALUES (NEW.ip_address, 'add');
+            END IF;
+        END
+    ''',
+    'blocked_ips_after_delete': '''
+        CREATE TRIGGER blocked_ips_after_delete AFTER DELETE ON blocked_ips
+        FOR EACH ROW
+        BEGIN
+            IF OLD.active THEN
+                INSERT INTO blocklist_changes (ip_address, action) VALUES (OLD.ip_address, 'remove');
+            END IF;
+        END
+    '''
+}
+
+
+def create_blocklist_triggers(cursor):
+    """Crea i trigger del registro delle modifiche e lo inizializza con gli IP già attivi."""
+    cursor.execute(
+        "SELECT TRIGGER_NAME FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = %s",
+        (DB_CONFIG['db'],)
+    )
+    existing = {row['TRIGGER_NAME'] for row in cursor.fetchall()}
+
+    for name, sql in BLOCKLIST_TRIGGERS.items():
+        if name not in existing:
+            cursor.execute(sql)
+
+    # Un database creato prima del registro parte da una revisione con tutti gli IP attivi
+    cursor.execute("SELECT COUNT(*) as count FROM blocklist_changes")
+    if cursor.fetchone()['count'] == 0:
+        cursor.execute(
+            "INSERT INTO blocklist_changes (ip_address, action) "
+            "SELECT ip_address, 'add' FROM blocked_ips WHERE active = 1"
+        )
+
+
 def init_db():
     """Crea le tabelle necessarie se non esistono."""
     # Prima assicuriamoci che il database esista
@@ -468,6 +1085,17 @@ def init_db():
             )
             ''')
 
+            # Registro delle modifiche alla lista IP: ogni riga è una revisione
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blocklist_changes (
+                revision BIGINT AUTO_INCREMENT PRIMARY KEY,
+                ip_address VARCHAR(45) NOT NULL,
+                action ENUM('add', 'remove') NOT NULL,
+                changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            create_blocklist_triggers(cursor)
+
             # Tabella per i report dai BOX
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS box_reports (
@@ -494,6 +1122,18 @@ def init_db():
             )
             ''')
 
+            # Report già scritti dalla coda di ingestione (vedi claim_reports), per giorno di ricezione
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ingested_reports (
+                report_id VARCHAR(40) NOT NULL,
+                received_at DATETIME NOT NULL,
+                PRIMARY KEY (report_id, received_at)
+            )
+            PARTITION BY RANGE COLUMNS(received_at) (
+                PARTITION p_future VALUES LESS THAN (MAXVALUE)
+            )
+            ''')
+
             # Tabella per i report dai CLIENT
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS client_reports (
@@ -509,7 +1149,13 @@ def init_db():
             ''')
 
         conn.commit()
+
+        # Indici e vincoli aggiunti dopo la creazione delle tabelle
+        apply_migrations(conn)
         conn.close()
+
+        # Crea subito le partizioni del mese corrente e di quelli successivi
+        partition_manager.maintain()
         print("Database inizializzato con successo.")
         return True
     except Exception as e:
@@ -1417,7 +2063,7 @@ def create_templates():
                         <input class="form-check-input" type="checkbox" id="autoRefreshSwitch" checked>
                         <label class="form-check-label" for="autoRefreshSwitch">Aggiornamento auto</label>
                     </div>
-                    <span class="countdown" id="countdown">30s</span>
+                    <span class="countdown" id="countdown">Live</span>
                 </div>
                 <div class="last-update">
                     Ultimo aggiornamento: <span class="last-update-time" id="last-update-time">
@@ -1684,6 +2330,8 @@ def create_templates():
         }, 1500);
 
         // Inizializzazione grafico minacce con tema scuro
+        let threatsChart = null;
+
         const initThreatsChart = (data) => {
             const chartTheme = {
                 gridColor: 'rgba(0, 255, 102, 0.1)',
@@ -1737,7 +2385,10 @@ def create_templates():
             blockedGradient.addColorStop(0, 'rgba(255, 51, 102, 0.3)');
             blockedGradient.addColorStop(1, 'rgba(255, 51, 102, 0)');
 
-            new Chart(ctx, {
+            if (threatsChart) {
+                threatsChart.destroy();
+            }
+            threatsChart = new Chart(ctx, {
                 type: 'line',
                 data: {
                     labels: labels,
@@ -1875,7 +2526,155 @@ def create_templates():
             return `${date.toLocaleDateString()} ${date.toLocaleTimeString()}`;
         };
 
-        // Aggiorna i dati della dashboard
+        // Dati correnti della dashboard, aggiornati con le sezioni ricevute dal server
+        let dashboardData = {{ data|tojson }};
+
+        // Mostra nella pagina i dati della dashboard
+        const renderDashboard = (data) => {
+            // Aggiorna statistiche principali
+            document.getElementById('status-box').textContent = data.box_info.device_name || 'N/D';
+            document.getElementById('clients-count').textContent = data.client_stats ? data.client_stats.length : 0;
+            document.getElementById('threats-count').textContent = data.security_status && data.security_status.total_threats ? data.security_status.total_threats : 0;
+            document.getElementById('blocked-count').textContent = data.security_status && data.security_status.total_blocked ? data.security_status.total_blocked : 0;
+
+            // Aggiorna ultimo aggiornamento
+            document.getElementById('last-update-time').textContent = formatDateTime(data.last_update || data.timestamp);
+
+            // Aggiorna info BOX
+            const boxInfoElem = document.getElementById('box-info');
+            if (data.box_info) {
+                boxInfoElem.innerHTML = `
+                    <div class="info-grid">
+                        <div class="info-item">
+                            <div class="info-label">Nome Dispositivo</div>
+                            <div class="info-value">${data.box_info.device_name || 'N/D'}</div>
+                        </div>
+                        <div class="info-item">
+                            <div class="info-label">IP Privato</div>
+                            <div class="info-value">${data.box_info.ip_private || 'N/D'}</div>
+                        </div>
+                        <div class="info-item">
+                            <div class="info-label">IP Pubblico</div>
+                            <div class="info-value">${data.box_info.ip_public || 'N/D'}</div>
+                        </div>
+                        <div class="info-item">
+                            <div class="info-label">MAC Address</div>
+                            <div class="info-value">${data.box_info.mac_address || 'N/D'}</div>
+                        </div>
+                        <div class="info-item">
+                            <div class="info-label">Latenza</div>
+                            <div class="info-value">${data.box_info.latency ? data.box_info.latency.toFixed(2) : 'N/D'} ms</div>
+                        </div>
+                    </div>
+                `;
+            }
+
+            // Aggiorna tabella client
+            const clientsTable = document.getElementById('clients-table');
+            if (clientsTable && data.client_stats && data.client_stats.length > 0) {
+                let clientsHtml = `
+                    <thead>
+                        <tr>
+                            <th>Nome Client</th>
+                            <th>IP</th>
+                            <th>MAC</th>
+                            <th>Minacce</th>
+                            <th>Bloccati</th>
+                            <th>Ultimo Report</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                `;
+
+                data.client_stats.forEach(client => {
+                    clientsHtml += `
+                        <tr>
+                            <td>${client.client_name || 'N/D'}</td>
+                            <td>${client.ip_private || 'N/D'}</td>
+                            <td>${client.mac_address || 'N/D'}</td>
+                            <td>${client.threats_detected || 0}</td>
+                            <td>${client.ips_blocked || 0}</td>
+                            <td>${formatDateTime(client.last_report)}</td>
+                        </tr>
+                    `;
+                });
+
+                clientsHtml += '</tbody>';
+                clientsTable.innerHTML = clientsHtml;
+            }
+
+            // Aggiorna tabella dispositivi
+            const devicesTable = document.getElementById('devices-table');
+            if (devicesTable && data.connected_devices && data.connected_devices.length > 0) {
+                let devicesHtml = `
+                    <thead>
+                        <tr>
+                            <th>Nome Dispositivo</th>
+                            <th>IP</th>
+                            <th>MAC</th>
+                            <th>Rilevato</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                `;
+
+                data.connected_devices.forEach(device => {
+                    devicesHtml += `
+                        <tr>
+                            <td>${device.device_name || 'N/D'}</td>
+                            <td>${device.ip_address || 'N/D'}</td>
+                            <td>${device.mac_address || 'N/D'}</td>
+                            <td>${formatDateTime(device.timestamp)}</td>
+                        </tr>
+                    `;
+                });
+
+                devicesHtml += '</tbody>';
+                devicesTable.innerHTML = devicesHtml;
+            }
+
+            // Aggiorna tabella attività
+            const activityTable = document.getElementById('activity-table');
+            if (activityTable && data.recent_activity && data.recent_activity.length > 0) {
+                let activityHtml = `
+                    <thead>
+                        <tr>
+                            <th>Tipo</th>
+                            <th>Nome</th>
+                            <th>IP</th>
+                            <th>Dettagli</th>
+                            <th>Orario</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                `;
+
+                data.recent_activity.forEach(activity => {
+                    activityHtml += `
+                        <tr>
+                            <td>
+                                ${activity.type === 'client_report' 
+                                    ? '<span class="badge badge-primary">Report Client</span>'
+                                    : '<span class="badge badge-success">Dispositivo</span>'}
+                            </td>
+                            <td>${activity.name || 'N/D'}</td>
+                            <td>${activity.ip || 'N/D'}</td>
+                            <td>
+                                ${activity.type === 'client_report'
+                                    ? `Minacce: ${activity.threats_detected || 0}, Bloccati: ${activity.ips_blocked || 0}`
+                                    : 'Nuovo dispositivo rilevato'}
+                            </td>
+                            <td>${formatDateTime(activity.timestamp)}</td>
+                        </tr>
+                    `;
+                });
+
+                activityHtml += '</tbody>';
+                activityTable.innerHTML = activityHtml;
+            }
+        };
+
+        // Aggiorna tutti i dati della dashboard con una richiesta completa
         const updateDashboard = () => {
             // Mostra indicatore di aggiornamento
             document.body.classList.add('updating');
@@ -1891,147 +2690,9 @@ def create_templates():
                         return;
                     }
 
-                    // Aggiorna statistiche principali
-                    document.getElementById('status-box').textContent = data.box_info.device_name || 'N/D';
-                    document.getElementById('clients-count').textContent = data.client_stats ? data.client_stats.length : 0;
-                    document.getElementById('threats-count').textContent = data.security_status && data.security_status.total_threats ? data.security_status.total_threats : 0;
-                    document.getElementById('blocked-count').textContent = data.security_status && data.security_status.total_blocked ? data.security_status.total_blocked : 0;
-
-                    // Aggiorna ultimo aggiornamento
-                    document.getElementById('last-update-time').textContent = formatDateTime(data.last_update || data.timestamp);
-
-                    // Aggiorna info BOX
-                    const boxInfoElem = document.getElementById('box-info');
-                    if (data.box_info) {
-                        boxInfoElem.innerHTML = `
-                            <div class="info-grid">
-                                <div class="info-item">
-                                    <div class="info-label">Nome Dispositivo</div>
-                                    <div class="info-value">${data.box_info.device_name || 'N/D'}</div>
-                                </div>
-                                <div class="info-item">
-                                    <div class="info-label">IP Privato</div>
-                                    <div class="info-value">${data.box_info.ip_private || 'N/D'}</div>
-                                </div>
-                                <div class="info-item">
-                                    <div class="info-label">IP Pubblico</div>
-                                    <div class="info-value">${data.box_info.ip_public || 'N/D'}</div>
-                                </div>
-                                <div class="info-item">
-                                    <div class="info-label">MAC Address</div>
-                                    <div class="info-value">${data.box_info.mac_address || 'N/D'}</div>
-                                </div>
-                                <div class="info-item">
-                                    <div class="info-label">Latenza</div>
-                                    <div class="info-value">${data.box_info.latency ? data.box_info.latency.toFixed(2) : 'N/D'} ms</div>
-                                </div>
-                            </div>
-                        `;
-                    }
-
-                    // Aggiorna tabella client
-                    const clientsTable = document.getElementById('clients-table');
-                    if (clientsTable && data.client_stats && data.client_stats.length > 0) {
-                        let clientsHtml = `
-                            <thead>
-                                <tr>
-                                    <th>Nome Client</th>
-                                    <th>IP</th>
-                                    <th>MAC</th>
-                                    <th>Minacce</th>
-                                    <th>Bloccati</th>
-                                    <th>Ultimo Report</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-                        `;
-
-                        data.client_stats.forEach(client => {
-                            clientsHtml += `
-                                <tr>
-                                    <td>${client.client_name || 'N/D'}</td>
-                                    <td>${client.ip_private || 'N/D'}</td>
-                                    <td>${client.mac_address || 'N/D'}</td>
-                                    <td>${client.threats_detected || 0}</td>
-                                    <td>${client.ips_blocked || 0}</td>
-                                    <td>${formatDateTime(client.last_report)}</td>
-                                </tr>
-                            `;
-                        });
-
-                        clientsHtml += '</tbody>';
-                        clientsTable.innerHTML = clientsHtml;
-                    }
-
-                    // Aggiorna tabella dispositivi
-                    const devicesTable = document.getElementById('devices-table');
-                    if (devicesTable && data.connected_devices && data.connected_devices.length > 0) {
-                        let devicesHtml = `
-                            <thead>
-                                <tr>
-                                    <th>Nome Dispositivo</th>
-                                    <th>IP</th>
-                                    <th>MAC</th>
-                                    <th>Rilevato</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-                        `;
-
-                        data.connected_devices.forEach(device => {
-                            devicesHtml += `
-                                <tr>
-                                    <td>${device.device_name || 'N/D'}</td>
-                                    <td>${device.ip_address || 'N/D'}</td>
-                                    <td>${device.mac_address || 'N/D'}</td>
-                                    <td>${formatDateTime(device.timestamp)}</td>
-                                </tr>
-                            `;
-                        });
-
-                        devicesHtml += '</tbody>';
-                        devicesTable.innerHTML = devicesHtml;
-                    }
-
-                    // Aggiorna tabella attività
-                    const activityTable = document.getElementById('activity-table');
-                    if (activityTable && data.recent_activity && data.recent_activity.length > 0) {
-                        let activityHtml = `
-                            <thead>
-                                <tr>
-                                    <th>Tipo</th>
-                                    <th>Nome</th>
-                                    <th>IP</th>
-                                    <th>Dettagli</th>
-                                    <th>Orario</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-                        `;
-
-                        data.recent_activity.forEach(activity => {
-                            activityHtml += `
-                                <tr>
-                                    <td>
-                                        ${activity.type === 'client_report' 
-                                            ? '<span class="badge badge-primary">Report Client</span>'
-                                            : '<span class="badge badge-success">Dispositivo</span>'}
-                                    </td>
-                                    <td>${activity.name || 'N/D'}</td>
-                                    <td>${activity.ip || 'N/D'}</td>
-                                    <td>
-                                        ${activity.type === 'client_report'
-                                            ? `Minacce: ${activity.threats_detected || 0}, Bloccati: ${activity.ips_blocked || 0}`
-                                            : 'Nuovo dispositivo rilevato'}
-                                    </td>
-                                    <td>${formatDateTime(activity.timestamp)}</td>
-                                </tr>
-                            `;
-                        });
-
-                        activityHtml += '</tbody>';
-                        activityTable.innerHTML = activityHtml;
-                    }
+                    dashboardData = data;
+                    renderDashboard(dashboardData);
+                    initThreatsChart(dashboardData);
                 })
                 .catch(error => {
                     document.body.classList.remove('updating');
@@ -2039,7 +2700,48 @@ def create_templates():
                 });
         };
 
-        // Gestione del timer per aggiornamento automatico
+        // Aggiornamenti in tempo reale (Server-Sent Events): il server invia solo le sezioni cambiate
+        let eventSource = null;
+
+        const startLiveUpdates = () => {
+            // Browser senza EventSource: aggiornamento periodico
+            if (!window.EventSource) {
+                startCountdown();
+                return;
+            }
+
+            eventSource = new EventSource(`/api/dashboard/{{ box_code }}/events`);
+            eventSource.addEventListener('sections', (event) => {
+                const sections = JSON.parse(event.data);
+                if (sections.error) {
+                    console.error('Errore:', sections.error);
+                    return;
+                }
+                Object.assign(dashboardData, sections);
+                renderDashboard(dashboardData);
+                if (sections.threats_history) {
+                    initThreatsChart(dashboardData);
+                }
+            });
+            eventSource.onopen = () => {
+                document.getElementById('countdown').textContent = 'Live';
+            };
+            eventSource.onerror = () => {
+                // EventSource si ricollega da solo e riceve di nuovo tutti i dati
+                document.getElementById('countdown').textContent = '...';
+            };
+        };
+
+        const stopLiveUpdates = () => {
+            if (eventSource) {
+                eventSource.close();
+                eventSource = null;
+            }
+            clearInterval(countdownInterval);
+            document.getElementById('countdown').textContent = 'Off';
+        };
+
+        // Gestione del timer per aggiornamento periodico (solo senza EventSource)
         let countdownValue = 30;
         let countdownInterval;
 
@@ -2062,13 +2764,12 @@ def create_templates():
         // Inizializzazione al caricamento della pagina
         document.addEventListener('DOMContentLoaded', () => {
             // Inizializza il grafico
-            initThreatsChart({{ data|tojson }});
+            initThreatsChart(dashboardData);
 
             // Gestione aggiornamento manuale
             document.getElementById('refresh-data').addEventListener('click', (e) => {
                 e.preventDefault();
                 updateDashboard();
-                startCountdown();
             });
 
             // Gestione switch aggiornamento automatico
@@ -2076,16 +2777,15 @@ def create_templates():
 
             autoRefreshSwitch.addEventListener('change', () => {
                 if (autoRefreshSwitch.checked) {
-                    startCountdown();
+                    startLiveUpdates();
                 } else {
-                    clearInterval(countdownInterval);
-                    document.getElementById('countdown').textContent = 'Off';
+                    stopLiveUpdates();
                 }
             });
 
-            // Avvia il timer se l'interruttore è attivo
+            // Avvia gli aggiornamenti in tempo reale se l'interruttore è attivo
             if (autoRefreshSwitch.checked) {
-                startCountdown();
+                startLiveUpdates();
             }
         });
 
@@ -2131,9 +2831,17 @@ if __name__ == '__main__':
 
             # Crea i file template per la dashboard
 
+            # Apre le connessioni minime del pool prima di accettare richieste
+            db_pool.fill()
+
+            # Riprende subito la scrittura dei report rimasti nello spool. Con il reloader
+            # di Flask questo codice gira anche nel processo padre, che non serve l'API
+            if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not DEBUG:
+                ingest_queue.start()
+
             print("Avvio del server...")
             # Avvia il server Flask
-            app.run(host='0.0.0.0', port=80, debug=True)
+            app.run(host='0.0.0.0', port=80, debug=DEBUG)
         else:
             print("Il server non può essere avviato a causa di problemi con il database.")
     except Exception as e: